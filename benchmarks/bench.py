@@ -0,0 +1,222 @@
+"""Benchmarks every stage of the topolayers pipeline.
+
+Run the sweep and store the results as JSON:
+
+    python benchmarks/bench.py run --output results.json
+
+Compare a new run against a stored baseline, exiting with 1 on regressions:
+
+    python benchmarks/bench.py compare baseline.json results.json --tolerance 0.25
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from topolayers import NoiseCache, Patterns, RandomNoise, RingMap, RingOverlay, TopographyMap  # noqa: E402
+
+ARRAY_SIZES = [(4, 4), (8, 8), (16, 16), (32, 32), (64, 64)]
+ZOOM_ASPECTS = [8, 32, 128, 512]
+LAYER_COUNTS = [1, 10, 50, 200]
+QUICK = {"array_sizes": [(4, 4), (8, 8)], "zoom_aspects": [8, 64], "layer_counts": [1, 20]}
+COLORS = ["#000000", "#4B3F72", "#FFC857", "#FFFFFF"]
+
+
+def measure(function, repeat: int) -> tuple:
+    """Runs a function several times, keeping the fastest time, then once more to measure its peak memory.
+
+    Tracing allocations slows allocation heavy code down several times over, so
+    the timed runs are never traced and the peak comes from a separate run.
+
+    Args:
+        function: The function to measure, without arguments.
+        repeat: The amount of timed runs.
+
+    Returns:
+        tuple: The result of the last run, the fastest wall time in seconds and the peak bytes allocated.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        result = function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, best, peak
+
+
+def bench_case(array_size: tuple, zoom_aspect: int, layer_count: int, repeat: int) -> dict:
+    """Benchmarks every stage of a single configuration.
+
+    Args:
+        array_size: The initial noise array size.
+        zoom_aspect: The zoom aspect.
+        layer_count: The amount of layers.
+        repeat: The amount of runs per stage.
+
+    Returns:
+        dict: The wall time and peak memory of every stage.
+    """
+    stages = {}
+
+    def record(name, function):
+        result, seconds, peak = measure(function, repeat)
+        stages[name] = {"seconds": seconds, "peak_bytes": peak}
+        return result
+
+    noise = record("noise", lambda: RandomNoise(1024, array_size))
+    field = record("zoom", lambda: noise.process_noise_array(zoom_aspect=zoom_aspect))
+    pattern = Patterns(field, gradient_steps=max(1, layer_count // (len(COLORS) - 1)))
+    thresholds = record("thresholds", lambda: pattern.plan_thresholds(layer_count))
+    palette = record("palette", lambda: pattern.sample_palette(COLORS, layer_count))
+
+    generator = TopographyMap(1024, array_size, zoom_aspect=zoom_aspect, noise_cache=NoiseCache())
+    generator.get_noise(zoom_aspect=zoom_aspect)  # Keep the zoom out of the compositing stage.
+
+    def add_layers():
+        generator.layers.clear()
+        generator.add_layers(palette, thresholds)
+
+    def composite():
+        generator.clear_index_map()  # Every run buckets the noise again instead of reusing the first index map.
+        return generator.generate_image()
+
+    record("add_layers", add_layers)
+    image = record("composite", composite)
+    record("encode", lambda: image.save(io.BytesIO(), format="PNG", optimize=True))
+    record("gradient", lambda: pattern.gradient_palette(COLORS, luminosity=1 / pattern.gradient_steps))
+    # interpolate_colors chunks the pixels sorted in descending order, like topolayers.py once did.
+    descending = Patterns(np.sort(field, axis=None)[::-1], pattern.gradient_steps)
+    record("interpolate_colors", lambda: list(descending.interpolate_colors(COLORS, 1 / pattern.gradient_steps)))
+    return stages
+
+
+def bench_rings(array_size: tuple, zoom_aspect: int, repeat: int) -> dict:
+    """Benchmarks the ring overlay workflow of toporings.py.
+
+    Args:
+        array_size: The initial noise array size.
+        zoom_aspect: The zoom aspect.
+        repeat: The amount of runs.
+
+    Returns:
+        dict: The wall time and peak memory of the whole workflow.
+    """
+    overlay_image = Image.fromarray(np.random.default_rng(0).integers(0, 256, (512, 512, 4), dtype=np.uint8))
+    overlay = RingOverlay(overlay_image)
+
+    def render():
+        generator = RingMap(1024, array_size, zoom_aspect=zoom_aspect, overlay=overlay, noise_cache=NoiseCache())
+        generator.add_rings()
+        return generator.generate_image()
+
+    _, seconds, peak = measure(render, repeat)
+    return {"rings": {"seconds": seconds, "peak_bytes": peak}}
+
+
+def run(args: argparse.Namespace) -> int:
+    """Runs the benchmark sweep and writes the results as JSON.
+
+    Args:
+        args: The parsed command line arguments.
+
+    Returns:
+        int: The exit code.
+    """
+    sweep = {"array_sizes": ARRAY_SIZES, "zoom_aspects": ZOOM_ASPECTS, "layer_counts": LAYER_COUNTS}
+    if args.quick:
+        sweep = QUICK
+    results = []
+    for array_size, zoom_aspect in itertools.product(sweep["array_sizes"], sweep["zoom_aspects"]):
+        pixels = array_size[0] * zoom_aspect * array_size[1] * zoom_aspect
+        if pixels > args.max_pixels:
+            print(f"Skipping {array_size} at zoom {zoom_aspect}, {pixels} pixels exceeds --max-pixels.")
+            continue
+        name = f"{array_size[0]}x{array_size[1]}/zoom{zoom_aspect}"
+        for layer_count in sweep["layer_counts"]:
+            if layer_count > pixels:
+                continue
+            stages = bench_case(array_size, zoom_aspect, layer_count, args.repeat)
+            results.append({"case": f"{name}/layers{layer_count}", "stages": stages})
+            print(results[-1]["case"], " ".join(f"{stage}={value['seconds']:.4f}s" for stage, value in stages.items()))
+        results.append({"case": f"{name}/rings", "stages": bench_rings(array_size, zoom_aspect, args.repeat)})
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=4)
+    print(f"Wrote {len(results)} cases to {args.output}.")
+    return 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    """Flags every stage that got slower or used more memory than the baseline allows.
+
+    Args:
+        args: The parsed command line arguments.
+
+    Returns:
+        int: 1 if any stage regressed, otherwise 0.
+    """
+    with open(args.baseline) as baseline_file, open(args.results) as results_file:
+        baseline = {case["case"]: case["stages"] for case in json.load(baseline_file)["results"]}
+        results = {case["case"]: case["stages"] for case in json.load(results_file)["results"]}
+    regressions = 0
+    for case, stages in results.items():
+        for name, stage in stages.items():
+            previous = baseline.get(case, {}).get(name)
+            if previous is None:
+                continue
+            for metric in ("seconds", "peak_bytes"):
+                # Tiny stages are dominated by noise, so they need to grow past an absolute floor too.
+                floor = args.min_seconds if metric == "seconds" else args.min_bytes
+                if stage[metric] > previous[metric] * (1 + args.tolerance) and stage[metric] - previous[metric] > floor:
+                    regressions += 1
+                    print(f"REGRESSION {case} {name} {metric}: {previous[metric]:.6g} -> {stage[metric]:.6g}")
+    print(f"{regressions} regressions across {len(results)} cases.")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the topolayers pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmark sweep.")
+    run_parser.add_argument("-o", "--output", default="bench_results.json", help="The JSON file to write.")
+    run_parser.add_argument("-r", "--repeat", type=int, default=3, help="The amount of runs per stage.")
+    run_parser.add_argument("--quick", action="store_true", help="Run a small sweep.")
+    run_parser.add_argument("--max-pixels", type=int, default=4096 * 4096, help="Skip bigger zoomed arrays.")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare results against a baseline.")
+    compare_parser.add_argument("baseline", help="The stored baseline JSON file.")
+    compare_parser.add_argument("results", help="The new results JSON file.")
+    compare_parser.add_argument("-t", "--tolerance", type=float, default=0.25, help="The allowed relative growth.")
+    compare_parser.add_argument("--min-seconds", type=float, default=0.005, help="Ignore smaller slowdowns.")
+    compare_parser.add_argument("--min-bytes", type=int, default=1 << 20, help="Ignore smaller memory growth.")
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
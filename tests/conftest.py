@@ -0,0 +1,34 @@
+from typing import Callable, Optional
+
+import pytest
+
+from topolayers import NoiseCache, Patterns, TopographyMap
+
+
+@pytest.fixture
+def build_map() -> Callable[..., TopographyMap]:
+    """Builds small maps with a noise cache of their own.
+
+    Without explicit (color, threshold) layers, the map gets a black to white
+    gradient with planned thresholds.
+    """
+
+    def build(
+        seed: int = 7,
+        array_size: tuple = (4, 4),
+        zoom_aspect: int = 16,
+        background: tuple = (255, 255, 255, 255),
+        layers: Optional[list] = None,
+        **kwargs,
+    ) -> TopographyMap:
+        generator = TopographyMap(seed, array_size, background, zoom_aspect, noise_cache=NoiseCache(), **kwargs)
+        if layers is None:
+            pattern = Patterns(generator.get_noise(zoom_aspect), 4)
+            palette = pattern.gradient_palette(["#000000", "#FFFFFF"], 0.1)
+            generator.add_layers(palette, pattern.plan_thresholds(len(palette)))
+        else:
+            for color, threshold in layers:
+                generator.add_layer(color, threshold)
+        return generator
+
+    return build
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from topolayers import HeightField, NoiseCache, TopographyAnimation, TopographyMap, WorldMap
+
+LAYERS = [((200, 40, 40, 255), 0.6), ((40, 200, 40, 255), 0.45), ((40, 40, 200, 255), 0.3)]
+
+
+def decode_frames(path: str) -> list:
+    frames = []
+    with Image.open(path) as image:
+        for frame in range(image.n_frames):
+            image.seek(frame)
+            frames.append(np.array(image.convert("RGBA")))
+    return frames
+
+
+def test_first_frame_matches_still_image(build_map):
+    generator = build_map(5, zoom_aspect=12, layers=LAYERS)
+    frame = next(TopographyAnimation(generator, frame_count=6).frames())
+    np.testing.assert_array_equal(frame, np.array(generator.generate_image()))
+
+
+def test_first_frame_matches_still_image_with_octaves(build_map):
+    generator = build_map(5, zoom_aspect=12, layers=LAYERS, octaves=3, persistence=0.6)
+    frames = [frame.copy() for frame in TopographyAnimation(generator, frame_count=4, keyframes=2).frames()]
+    np.testing.assert_array_equal(frames[0], np.array(generator.generate_image()))
+    assert not np.array_equal(frames[0], frames[2])
+
+
+def test_world_maps_have_a_single_octave():
+    with pytest.raises(ValueError):
+        WorldMap(1, octaves=2)
+
+
+def test_first_world_frame_matches_still_image():
+    world = WorldMap(5, (4, 4), (255, 255, 255, 255), 12, noise_cache=NoiseCache())
+    world.add_layer((200, 40, 40, 255), 0.6)
+    world.add_layer((40, 40, 200, 255), 0.35)
+    frames = [frame.copy() for frame in TopographyAnimation(world, frame_count=4, keyframes=2).frames()]
+    np.testing.assert_array_equal(frames[0], np.array(world.generate_image()))
+    assert not np.array_equal(frames[0], frames[2])
+
+
+def test_height_fields_cannot_be_animated():
+    generator = TopographyMap(height_field=HeightField(np.arange(16.0).reshape(4, 4)), zoom_aspect=4)
+    with pytest.raises(ValueError):
+        TopographyAnimation(generator)
+
+
+def test_index_frames_reuse_one_buffer(build_map):
+    frames = TopographyAnimation(build_map(5, zoom_aspect=12, layers=LAYERS), frame_count=4).index_frames()
+    buffers = [index_map for index_map, _ in frames]
+    assert all(index_map is buffers[0] for index_map in buffers)
+    assert buffers[0].dtype == np.uint8
+
+
+@pytest.mark.parametrize("background", [(255, 255, 255, 255), (0, 0, 0, 0)], ids=["opaque", "transparent"])
+def test_gif_frames_decode_to_rendered_frames(tmp_path, background, build_map):
+    animation = TopographyAnimation(build_map(5, zoom_aspect=12, background=background, layers=LAYERS), frame_count=5)
+    expected = [frame.copy() for frame in animation.frames()]
+    path = str(tmp_path / "map.gif")
+    animation.save_animation(path, duration=50)
+    decoded = decode_frames(path)
+    assert len(decoded) == len(expected)
+    for frame, rendered in zip(decoded, expected):
+        if background[3]:
+            np.testing.assert_array_equal(frame, rendered)
+        else:
+            np.testing.assert_array_equal(frame[..., 3], rendered[..., 3])
+            visible = rendered[..., 3] == 255
+            np.testing.assert_array_equal(frame[visible], rendered[visible])
+    with Image.open(path) as image:
+        assert image.info["loop"] == 0
+        assert image.info["duration"] == 50
+
+
+def test_webp_frames_decode_to_rendered_frames(tmp_path, build_map):
+    animation = TopographyAnimation(build_map(5, zoom_aspect=12, layers=LAYERS), frame_count=5)
+    expected = [frame.copy() for frame in animation.frames()]
+    path = str(tmp_path / "map.webp")
+    animation.save_animation(path)
+    decoded = decode_frames(path)
+    assert len(decoded) == len(expected)
+    for frame, rendered in zip(decoded, expected):
+        np.testing.assert_array_equal(frame, rendered)
+
+
+def test_save_animation_rejects_other_formats(tmp_path, build_map):
+    with pytest.raises(ValueError):
+        TopographyAnimation(build_map(5, zoom_aspect=12, layers=LAYERS), frame_count=2).save_animation(
+            str(tmp_path / "map.png")
+        )
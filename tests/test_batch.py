@@ -0,0 +1,96 @@
+import os
+import json
+import stat
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from topolayers import NoiseCache
+from topolayers.batch import build_gradient_map, generate_batch, load_config, parse_seeds, render_seed_range, save_atomically
+from topolayers.patterns import Patterns
+
+
+@pytest.fixture
+def settings(tmp_path) -> dict:
+    config = {
+        "seed": 1,
+        "zoom_aspect": 8,
+        "noise_size": {"x": 4, "y": 4},
+        "output_path": str(tmp_path),
+        "background_color": [255, 255, 255, 255],
+        "colors": ["#000000", "#FFFFFF"],
+        "gradient_steps": 3,
+        "luminosity": 0.1,
+    }
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    return load_config(str(path))
+
+
+def test_parse_seeds():
+    assert parse_seeds("1-3, 7,10-11") == [1, 2, 3, 7, 10, 11]
+    with pytest.raises(ValueError):
+        parse_seeds("1-x")
+
+
+def test_load_config_fills_in_defaults(settings):
+    assert settings["noise_size"] == (4, 4)
+    assert settings["legacy_rng"] is False and settings["octaves"] == 1
+
+
+def test_save_atomically_uses_the_umask_permissions(tmp_path, settings):
+    palette = Patterns(None, settings["gradient_steps"]).gradient_palette(settings["colors"], settings["luminosity"])
+    path = str(tmp_path / "5.png")
+    save_atomically(build_gradient_map(5, settings, palette), path)
+    with open(tmp_path / "reference", "wb"):
+        pass
+    assert stat.S_IMODE(os.stat(path).st_mode) == stat.S_IMODE(os.stat(tmp_path / "reference").st_mode)
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+
+
+def test_failed_saves_leave_no_files(tmp_path, settings):
+    generator = build_gradient_map(5, settings, np.zeros((1, 4)))
+    generator.layers.clear()
+    with pytest.raises(Exception):
+        save_atomically(generator, str(tmp_path / "5.png"))
+    assert sorted(os.listdir(tmp_path)) == ["config.json"]
+
+
+def test_render_seed_range_matches_single_renders(tmp_path, settings):
+    output = tmp_path / "out"
+    report = render_seed_range(settings, [3, 4], str(output), workers=2, profile="fast")
+    assert report.rendered == 2 and not report.failures
+    palette = Patterns(None, settings["gradient_steps"]).gradient_palette(settings["colors"], settings["luminosity"])
+    for seed in (3, 4):
+        expected = np.array(build_gradient_map(seed, settings, palette).generate_image())
+        np.testing.assert_array_equal(np.array(Image.open(output / f"{seed}.png").convert("RGBA")), expected)
+
+
+def test_threaded_batches_match_sequential_renders(settings):
+    palette = Patterns(None, settings["gradient_steps"]).gradient_palette(settings["colors"], settings["luminosity"])
+
+    def build_map(seed: int):
+        return build_gradient_map(seed, settings, palette, noise_cache=NoiseCache())
+
+    seeds = list(np.arange(20, 32))
+    expected = [np.array(build_map(seed).generate_image()) for seed in seeds]
+    rendered = list(generate_batch(seeds, build_map, max_workers=4))
+    assert [seed for seed, _ in rendered] == seeds
+    for (_, image), reference in zip(rendered, expected):
+        np.testing.assert_array_equal(np.array(image), reference)
+
+
+def test_batches_keep_a_bounded_window_of_seeds_in_flight(settings):
+    palette = Patterns(None, settings["gradient_steps"]).gradient_palette(settings["colors"], settings["luminosity"])
+    drawn = []
+
+    def seeds():
+        for seed in range(100):
+            drawn.append(seed)
+            yield seed
+
+    batch = generate_batch(seeds(), lambda seed: build_gradient_map(seed, settings, palette, NoiseCache()), max_workers=2)
+    assert next(batch)[0] == 0
+    assert len(drawn) == 4
+    assert [seed for seed, _ in batch] == list(range(1, 100))
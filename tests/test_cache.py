@@ -0,0 +1,144 @@
+import os
+import glob
+import threading
+
+import numpy as np
+import pytest
+
+from topolayers import DiskCache, Instrumentation, NoiseCache, TopographyMap
+
+
+def test_hits_misses_and_lru_eviction():
+    cache = NoiseCache(max_bytes=3 * 800)
+    for key in "abc":
+        cache.put(key, np.zeros(100))
+    assert cache.get("a") is not None  # "b" is now the least recently used.
+    cache.put("d", np.zeros(100))
+    assert "b" not in cache and "a" in cache and "d" in cache
+    info = cache.info()
+    assert (info.hits, info.evictions, info.entries, info.current_bytes) == (1, 1, 3, 3 * 800)
+    assert cache.get("b") is None and cache.info().misses == 1
+
+
+def test_stored_arrays_are_read_only():
+    cache = NoiseCache(max_bytes=1024)
+    stored = cache.put("key", np.zeros(10))
+    assert not stored.flags.writeable
+
+
+def test_arrays_over_budget_are_left_writable_and_uncached():
+    cache = NoiseCache(max_bytes=10)
+    array = np.zeros(100)
+    assert cache.put("key", array) is array
+    assert array.flags.writeable
+    assert "key" not in cache and cache.info().current_bytes == 0
+
+
+def test_get_or_compute_computes_once():
+    cache = NoiseCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return np.ones(4)
+
+    first = cache.get_or_compute("key", compute)
+    second = cache.get_or_compute("key", compute)
+    assert first is second and len(calls) == 1
+
+
+def test_maps_share_zoomed_noise_through_the_cache():
+    cache = NoiseCache()
+    first = TopographyMap(5, (4, 4), zoom_aspect=8, noise_cache=cache).get_noise(8)
+    second = TopographyMap(5, (4, 4), zoom_aspect=8, noise_cache=cache).get_noise(8)
+    assert first is second
+    assert TopographyMap(6, (4, 4), zoom_aspect=8, noise_cache=cache).get_noise(8) is not first
+
+
+def test_concurrent_puts_keep_the_byte_total_consistent():
+    cache = NoiseCache(max_bytes=8 * 800)
+
+    def fill(offset: int):
+        for key in range(50):
+            cache.put((offset, key), np.zeros(100))
+
+    threads = [threading.Thread(target=fill, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    info = cache.info()
+    assert info.entries == 8 and info.current_bytes == 8 * 800
+
+
+def test_disk_cache_round_trips(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    array = np.arange(12.0).reshape(3, 4)
+    cache.put_array(("noise", 1), array)
+    cache.put_bytes(("image", 1), b"encoded")
+    stored = cache.get_array(("noise", 1))
+    np.testing.assert_array_equal(stored, array)
+    assert isinstance(stored, np.memmap) and not stored.flags.writeable
+    assert cache.get_bytes(("image", 1)) == b"encoded"
+    assert cache.get_bytes(("image", 2)) is None
+    info = cache.info()
+    assert (info.hits, info.misses, info.entries) == (2, 1, 2)
+
+
+@pytest.mark.parametrize("verify_arrays", [False, True])
+def test_disk_cache_discards_corrupt_entries(tmp_path, verify_arrays):
+    cache = DiskCache(str(tmp_path), verify_arrays=verify_arrays)
+    cache.put_bytes(("blob",), b"encoded image")
+    cache.put_array(("array",), np.zeros(64))
+    for path in glob.glob(str(tmp_path / "*" / "*")):
+        with open(path, "r+b") as file:
+            file.seek(-1, os.SEEK_END)
+            file.write(b"\x01")
+    assert cache.get_bytes(("blob",)) is None
+    assert (cache.get_array(("array",)) is None) == verify_arrays
+    assert cache.info().entries == (1 if not verify_arrays else 0)
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    cache.put_bytes(("a",), bytes(100))
+    cache.put_bytes(("b",), bytes(100))
+    os.utime(cache._find(("a",), ".bin")[0], (0, 0))
+    os.utime(cache._find(("b",), ".bin")[0], (1, 1))
+    assert cache.get_bytes(("a",)) is not None  # "b" is now the least recently used.
+    cache.put_bytes(("c",), bytes(100))
+    assert cache.get_bytes(("b",)) is None and cache.get_bytes(("a",)) is not None
+    info = cache.info()
+    assert (info.evictions, info.entries, info.current_bytes) == (1, 2, 200)
+
+
+def test_disk_cache_scans_only_when_over_budget(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    scans = []
+    entries = DiskCache._entries
+    monkeypatch.setattr(DiskCache, "_entries", lambda self: scans.append(1) or entries(self))
+    for key in range(9):
+        cache.put_bytes((key,), bytes(100))
+    cache.put_bytes((0,), bytes(100))  # Overwriting an entry does not grow the directory.
+    assert len(scans) == 1
+    cache.put_bytes((9,), bytes(100))
+    cache.put_bytes((10,), bytes(100))
+    assert len(scans) == 2
+    assert cache.info().current_bytes == 1000
+
+
+def test_cached_images_are_saved_atomically_with_a_save_stage(tmp_path):
+    events = []
+    disk_cache, instrumentation = DiskCache(str(tmp_path / "cache")), Instrumentation(events.append)
+    generator = TopographyMap(5, (4, 4), zoom_aspect=8, disk_cache=disk_cache, instrumentation=instrumentation)
+    generator.add_layer((200, 40, 40, 255), 0.5)
+    first, second = str(tmp_path / "first.png"), str(tmp_path / "second.png")
+    miss = np.array(generator.generate_image(first))
+    events.clear()
+    hit = np.array(generator.generate_image(second))
+    np.testing.assert_array_equal(hit, miss)
+    with open(first, "rb") as expected, open(second, "rb") as cached:
+        assert cached.read() == expected.read()
+    saves = [event for event in events if event.stage == "save"]
+    assert len(saves) == 1 and saves[0].bytes_written == os.path.getsize(second)
+    assert sorted(os.listdir(tmp_path)) == ["cache", "first.png", "second.png"]
@@ -0,0 +1,107 @@
+import json
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+import pytest
+
+from topolayers import ContourExporter
+from topolayers.contours import marching_squares
+
+
+def even_odd_inside(rings: list, shape: tuple) -> np.ndarray:
+    """Marks the pixel centres that fall inside an odd amount of rings."""
+    rows, columns = np.indices(shape)
+    x, y = (columns + 0.5).ravel()[:, np.newaxis], (rows + 0.5).ravel()[:, np.newaxis]
+    inside = np.zeros(x.shape[0], dtype=bool)
+    for ring in rings:
+        (x1, y1), (x2, y2) = ring[:-1].T, ring[1:].T
+        straddles = (y1 > y) != (y2 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossing = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= (np.count_nonzero(straddles & (crossing > x), axis=1) % 2).astype(bool)
+    return inside.reshape(shape)
+
+
+def segment_distance(points: np.ndarray, line: np.ndarray) -> np.ndarray:
+    """The distance from every point to the nearest segment of a polyline."""
+    start, direction = line[:-1], line[1:] - line[:-1]
+    relative = points[:, np.newaxis] - start
+    lengths = np.maximum((direction**2).sum(axis=1), 1e-12)
+    t = np.clip((relative * direction).sum(axis=2) / lengths, 0, 1)
+    return np.hypot(*(relative - t[..., np.newaxis] * direction).transpose(2, 0, 1)).min(axis=1)
+
+
+LAYERS = [((200, 40, 40, 255), 0.6), ((40, 40, 200, 128), 0.35)]
+
+
+@pytest.fixture
+def field() -> np.ndarray:
+    return np.random.default_rng(4).uniform(size=(24, 30))
+
+
+def test_single_pit_is_a_closed_diamond():
+    field = np.ones((3, 3))
+    field[1, 1] = 0.0
+    contours = marching_squares(field, [0.5])
+    assert len(contours) == 1
+    (ring,) = contours.rings(0)
+    np.testing.assert_array_equal(ring[0], ring[-1])
+    assert sorted(map(tuple, ring[:-1])) == [(1.0, 1.5), (1.5, 1.0), (1.5, 2.0), (2.0, 1.5)]
+    assert not contours.border.any()
+
+
+def test_rings_enclose_exactly_the_pixels_at_or_below_every_level(field):
+    levels = np.array([0.2, 0.45, 0.7])
+    contours = marching_squares(field, levels)
+    for level, threshold in enumerate(levels):
+        np.testing.assert_array_equal(even_odd_inside(contours.rings(level), field.shape), field <= threshold)
+
+
+def test_rings_touching_the_edge_run_along_it(field):
+    contours = marching_squares(field, [0.5])
+    height, width = field.shape
+    x, y = contours.points.T
+    assert contours.border.any()
+    assert np.all(((x == 0) | (x == width) | (y == 0) | (y == height))[contours.border])
+    assert x.min() >= 0 and x.max() <= width and y.min() >= 0 and y.max() <= height
+    for line in contours.lines(0):
+        on_edge = (line[:, 0] == 0) | (line[:, 0] == width) | (line[:, 1] == 0) | (line[:, 1] == height)
+        assert len(line) > 1 and not np.any(on_edge[:-1] & on_edge[1:])
+
+
+@pytest.mark.parametrize("tolerance", [0.3, 0.75, 2.0])
+def test_simplified_rings_stay_within_tolerance(field, tolerance):
+    contours = marching_squares(field, [0.3, 0.6])
+    simplified = contours.simplify(tolerance)
+    assert len(simplified.points) < len(contours.points)
+    for level in range(2):
+        originals = contours.rings(level)
+        for ring in simplified.rings(level):
+            (original,) = [candidate for candidate in originals if (candidate == ring[0]).all(axis=1).any()]
+            assert (original[:, np.newaxis] == ring).all(axis=2).any(axis=0).all()
+            assert segment_distance(original, ring).max() <= tolerance + 1e-9
+
+
+def test_svg_paints_every_layer_over_the_background(build_map):
+    exporter = ContourExporter(build_map(2, zoom_aspect=8, layers=LAYERS), tolerance=0)
+    root = ElementTree.fromstring(exporter.to_svg(stroke=(0, 0, 0, 255), scale=2))
+    namespace = "{http://www.w3.org/2000/svg}"
+    assert (root.get("width"), root.get("height"), root.get("viewBox")) == ("64", "64", "0 0 32 32")
+    assert root.find(f"{namespace}rect").get("fill") == "#ffffff"
+    fills = [path.get("fill") for path in root.iter(f"{namespace}path")]
+    assert fills == ["#c82828", "#2828c8", "none"]
+    assert root.findall(f"{namespace}path")[1].get("fill-opacity") == "0.502"
+
+
+def test_geojson_has_a_feature_per_level(tmp_path, build_map):
+    generator = build_map(2, zoom_aspect=8, layers=LAYERS)
+    path = str(tmp_path / "map.geojson")
+    document = ContourExporter(generator).to_geojson(path)
+    with open(path, encoding="utf-8") as file:
+        assert file.read() == document
+    features = json.loads(document)["features"]
+    assert [feature["properties"]["threshold"] for feature in features] == [0.35, 0.6]
+    assert [feature["properties"]["color"] for feature in features] == ["#2828c8", "#c82828"]
+    for feature in features:
+        coordinates = np.concatenate([np.array(line) for line in feature["geometry"]["coordinates"]])
+        assert coordinates.min() >= 0 and coordinates.max() <= 32
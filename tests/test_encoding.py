@@ -0,0 +1,66 @@
+import io
+import pathlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from topolayers.encoding import ENCODE_PROFILES, encode_image, infer_format, palette_image
+
+LAYERS = [((200, 40, 40, 255), 0.6), ((40, 200, 40, 128), 0.45), ((40, 40, 200, 255), 0.3)]
+
+
+@pytest.mark.parametrize("image_format", ["PNG", "WEBP"])
+@pytest.mark.parametrize("profile", list(ENCODE_PROFILES))
+def test_encoded_images_decode_to_the_rendered_pixels(build_map, profile, image_format):
+    # The transparent background and translucent layer need the palette alpha, and the exact RGB of WebP.
+    generator = build_map(3, background=(0, 0, 0, 0), layers=LAYERS)
+    expected = np.array(generator.generate_image())
+    with Image.open(io.BytesIO(generator.generate_bytes(profile, image_format))) as image:
+        assert image.format == image_format
+        assert image.mode == ("P" if image_format == "PNG" else "RGBA")
+        np.testing.assert_array_equal(np.array(image.convert("RGBA")), expected)
+
+
+def test_palette_output_can_be_turned_off(build_map):
+    generator = build_map(3, layers=LAYERS)
+    with Image.open(io.BytesIO(generator.generate_bytes(palette_output=False))) as image:
+        assert image.mode == "RGBA"
+        np.testing.assert_array_equal(np.array(image), np.array(generator.generate_image()))
+
+
+def test_palette_image_round_trips():
+    palette = np.array([[0, 0, 0, 0], [255, 10, 20, 128], [1, 2, 3, 255]], dtype=np.uint8)
+    index_map = np.random.default_rng(0).integers(0, 3, size=(9, 11))
+    image = palette_image(index_map, palette)
+    assert image.mode == "P"
+    np.testing.assert_array_equal(np.array(image.convert("RGBA")), palette[index_map])
+
+
+def test_encode_image_reports_the_bytes_written(tmp_path):
+    image = Image.new("RGBA", (8, 8), (10, 20, 30, 255))
+    path = tmp_path / "image.webp"
+    assert encode_image(image, str(path), "fast") == path.stat().st_size
+    buffer = io.BytesIO(b"header")
+    buffer.seek(0, io.SEEK_END)
+    assert encode_image(image, buffer, "fast") == len(buffer.getvalue()) - len(b"header")
+    with pytest.raises(ValueError):
+        encode_image(image, buffer, "lossy")
+
+
+@pytest.mark.parametrize(
+    "output, image_format, expected",
+    [
+        ("map.png", None, "PNG"),
+        ("map.WEBP", None, "WEBP"),
+        ("maps/map.jpg", None, "JPEG"),
+        (pathlib.Path("map.webp"), None, "WEBP"),
+        ("map.unknown", None, "PNG"),
+        ("map", None, "PNG"),
+        (io.BytesIO(), None, "PNG"),
+        ("map.png", "webp", "WEBP"),
+        (io.BytesIO(), "webp", "WEBP"),
+    ],
+)
+def test_infer_format(output, image_format, expected):
+    assert infer_format(output, image_format) == expected
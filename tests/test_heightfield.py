@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from topolayers import HeightField, NoiseCache, TiledRenderer, TopographyMap, heightfield
+
+
+@pytest.fixture
+def grid() -> np.ndarray:
+    rows, columns = np.mgrid[0:37, 0:29]
+    return (np.sin(rows / 5.0) * np.cos(columns / 4.0) * 100 + rows).astype(np.float32)
+
+
+@pytest.mark.parametrize("order", [0, 1])
+@pytest.mark.parametrize("zoom_aspect", [1, 2.5, 0.5])
+def test_regions_match_the_full_grid(grid, order, zoom_aspect):
+    field = HeightField(grid, order=order, chunk_rows=7)
+    full = field.process_noise_array(zoom_aspect=zoom_aspect)[:, :, 0]
+    assert full.shape == field.zoomed_shape(zoom_aspect)
+    height, width = full.shape
+    rows, columns = slice(height // 3, height - 2), slice(3, width // 2 + 1)
+    np.testing.assert_array_equal(field.process_noise_region(zoom_aspect, rows, columns), full[rows, columns])
+    assert full.min() >= 0 and full.max() <= 1
+
+
+def test_tiled_render_matches_full_render(tmp_path, grid):
+    generator = TopographyMap(height_field=HeightField(grid, chunk_rows=5), zoom_aspect=2, noise_cache=NoiseCache())
+    generator.add_layers(np.array([[200, 40, 40, 255], [40, 40, 200, 255]]), generator.height_field.plan_thresholds(2))
+    path = str(tmp_path / "grid.npy")
+    TiledRenderer(generator, tile_size=16).render(path)
+    np.testing.assert_array_equal(np.load(path), np.array(generator.generate_image()))
+
+
+def test_missing_heights_show_the_background(grid):
+    grid[5:9, 10:20] = -9999
+    field = HeightField(grid, nodata=-9999)
+    assert field.value_range() == (float(grid[grid != -9999].min()), float(grid.max()))
+    generator = TopographyMap(height_field=field, background_color=(1, 2, 3, 255), zoom_aspect=1, noise_cache=NoiseCache())
+    generator.add_layer((200, 40, 40, 255), 1.0)
+    image = np.array(generator.generate_image())
+    missing = grid == -9999
+    assert np.all(image[missing] == (1, 2, 3, 255))
+    assert np.all(image[~missing] == (200, 40, 40, 255))
+
+
+def test_planned_thresholds_skip_missing_heights(grid):
+    grid[:4] = -9999
+    field = HeightField(grid, nodata=-9999)
+    thresholds = field.plan_thresholds(4)
+    heights = np.sort(field.normalise(grid[4:].astype(np.float32)).ravel())
+    chunk = len(heights) // 4
+    np.testing.assert_allclose(thresholds, heights[::-1][np.arange(4) * chunk], atol=2 / 65536)
+
+
+def test_raw_grids_are_keyed_by_their_offset(tmp_path, grid):
+    path = str(tmp_path / "grid.f32")
+    np.concatenate([np.zeros(29, dtype=np.float32), grid.ravel()]).tofile(path)
+    shape = (36, 29)
+    first = HeightField.from_raw(path, shape)
+    second = HeightField.from_raw(path, shape, offset=29 * 4)
+    assert first.cache_key != second.cache_key
+    cache = NoiseCache()
+    noise = [TopographyMap(height_field=field, zoom_aspect=1, noise_cache=cache).get_noise(1) for field in (first, second)]
+    assert not np.array_equal(noise[0], noise[1])
+
+
+def test_grids_in_memory_are_hashed_once(grid, monkeypatch):
+    calls = []
+    digest = heightfield.content_digest
+    monkeypatch.setattr(heightfield, "content_digest", lambda data: calls.append(1) or digest(data))
+    field = HeightField(grid)
+    keys = {field.cache_key for _ in range(3)}
+    assert len(keys) == 1 and len(calls) == 1
+    assert HeightField(grid + 1).cache_key != field.cache_key
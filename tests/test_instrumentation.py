@@ -0,0 +1,46 @@
+import io
+
+from topolayers import Instrumentation, NoiseCache, Patterns, TopographyMap
+from topolayers.instrumentation import NULL_INSTRUMENTATION, NULL_STAGE
+
+
+def test_every_stage_is_reported():
+    events = []
+    instrumentation = Instrumentation(events.append)
+    generator = TopographyMap(9, (4, 4), zoom_aspect=16, noise_cache=NoiseCache(), instrumentation=instrumentation)
+    pattern = Patterns(generator.get_noise(16), 3, instrumentation)
+    palette = pattern.gradient_palette(["#000000", "#FFFFFF"], 0.1)
+    generator.add_layers(palette, pattern.plan_thresholds(len(palette)))
+    buffer = io.BytesIO()
+    generator.generate_image(buffer)
+    stages = {event.stage: event for event in events}
+    assert list(stages) == ["rng", "zoom", "plan", "threshold", "palette", "composite", "save"]
+    assert stages["zoom"].pixels == 64 * 64 and stages["zoom"].bytes_allocated == 64 * 64 * 8
+    assert stages["plan"].pixels == 64 * 64
+    assert all(event.duration >= 0 and event.seed == 9 for event in events if event.stage != "plan")
+
+
+def test_save_reports_bytes_written_apart_from_bytes_allocated():
+    events = []
+    generator = TopographyMap(9, (4, 4), zoom_aspect=16, instrumentation=Instrumentation(events.append))
+    generator.add_layer((0, 0, 0, 255), 0.5)
+    buffer = io.BytesIO()
+    generator.generate_image(buffer)
+    save = [event for event in events if event.stage == "save"][0]
+    assert save.bytes_written == len(buffer.getvalue()) > 0
+    assert save.bytes_allocated == 0
+
+
+def test_disabled_instrumentation_shares_a_no_op_stage():
+    assert NULL_INSTRUMENTATION.stage("zoom", 1) is NULL_STAGE
+    assert TopographyMap(1).instrumentation is NULL_INSTRUMENTATION
+    assert Patterns(None, 1).instrumentation is NULL_INSTRUMENTATION
+
+
+def test_octaves_are_combined_in_the_zoom_stage():
+    events = []
+    generator = TopographyMap(9, (4, 4), zoom_aspect=16, octaves=3, instrumentation=Instrumentation(events.append))
+    generator.get_random_noise()
+    rng, zoom = events
+    assert (rng.stage, rng.pixels, rng.bytes_allocated) == ("rng", 16 + 64 + 256, (16 + 64 + 256) * 8)
+    assert (zoom.stage, zoom.pixels, zoom.bytes_allocated) == ("zoom", 256, 256 * 8)
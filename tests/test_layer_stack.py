@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from topolayers import TopographyLayer, TopographyMap
+
+LAYERS = [((position, 0, 0, 255), position / 20) for position in range(20)]
+
+
+def test_layers_grow_past_their_capacity(build_map):
+    generator = build_map(2, zoom_aspect=8, layers=LAYERS)
+    assert len(generator.layers) == 20
+    np.testing.assert_array_equal(generator.layers.thresholds, np.arange(20) / 20)
+    assert generator.layers[-1].color == (19, 0, 0, 255)
+
+
+def test_slicing_returns_layers_like_a_list(build_map):
+    layers = build_map(2, zoom_aspect=8, layers=LAYERS).layers
+    sliced = layers[2:8:3]
+    assert isinstance(sliced, list)
+    assert [layer.threshold for layer in sliced] == [2 / 20, 5 / 20]
+    assert [layer.color for layer in layers[-2:]] == [(18, 0, 0, 255), (19, 0, 0, 255)]
+    assert layers[30:] == []
+
+
+def test_index_out_of_range(build_map):
+    with pytest.raises(IndexError):
+        build_map(2, zoom_aspect=8, layers=LAYERS).layers[20]
+
+
+def test_layers_are_slotted_and_repr_shows_their_state(build_map):
+    layer = build_map(2, zoom_aspect=8, layers=LAYERS).layers[3]
+    assert not hasattr(layer, "__dict__")
+    assert repr(layer) == "TopographyLayer(threshold=0.15, color=(3, 0, 0, 255))"
+
+
+def test_layer_noise_map_is_built_from_its_source(build_map):
+    generator = build_map(2, zoom_aspect=8, layers=LAYERS)
+    layer = generator.layers[10]
+    noise_map = layer.noise_map
+    assert noise_map.shape == (32, 32, 4)
+    np.testing.assert_array_equal(np.all(noise_map == layer.color, axis=-1), layer.mask)
+
+
+def test_appended_layers_keep_their_noise_map():
+    generator = TopographyMap(2, (4, 4), zoom_aspect=8)
+    noise_map = np.zeros((32, 32, 4))
+    generator.layers.append(TopographyLayer(noise_map, 0.5))
+    assert generator.layers[0].noise_map is noise_map
+    assert generator.layers[0].color == (0, 0, 0, 0)
+
+
+def test_recolor_checks_the_color_count(build_map):
+    with pytest.raises(ValueError):
+        build_map(2, zoom_aspect=8, layers=LAYERS).layers.colors = [(0, 0, 0, 255)]
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from topolayers import NoiseCache, TopographyMap
+from topolayers.exceptions import InvalidRenderMode, LayerRequired
+
+
+def test_indexed_matches_layered(build_map):
+    indexed = np.array(build_map(render_mode="indexed").generate_image())
+    layered = np.array(build_map(render_mode="layered").generate_image())
+    assert indexed.shape == (64, 64, 4)
+    np.testing.assert_array_equal(indexed, layered)
+
+
+def test_indexed_matches_layered_for_non_square_maps(build_map):
+    indexed = np.array(build_map(render_mode="indexed", array_size=(3, 5)).generate_image())
+    layered = np.array(build_map(render_mode="layered", array_size=(3, 5)).generate_image())
+    assert indexed.shape == (48, 80, 4)
+    np.testing.assert_array_equal(indexed, layered)
+
+
+def test_indexed_matches_layered_with_translucent_overlapping_layers():
+    maps = [
+        TopographyMap(3, (4, 4), zoom_aspect=16, render_mode=mode, noise_cache=NoiseCache())
+        for mode in ("indexed", "layered")
+    ]
+    for generator in maps:
+        generator.add_layer((200, 10, 10, 128), 0.7)
+        generator.add_layer((10, 200, 10, 64), 0.4)
+        generator.add_layer((10, 10, 200, 255), 0.55)
+    np.testing.assert_array_equal(np.array(maps[0].generate_image()), np.array(maps[1].generate_image()))
+
+
+def test_index_map_buckets_by_threshold(build_map):
+    generator = build_map()
+    index_map, palette = generator.get_index_map()
+    noise = generator.get_noise(16)[:, :, 0]
+    levels = generator.get_levels()
+    assert len(palette) == len(levels) + 1
+    assert np.all(noise[index_map == 0] <= levels[0])
+    assert np.all(noise[index_map == len(levels)] > levels[-1])
+
+
+def test_generate_image_requires_a_layer():
+    with pytest.raises(LayerRequired):
+        TopographyMap(1, (4, 4), zoom_aspect=8).generate_image()
+
+
+def test_invalid_render_mode():
+    with pytest.raises(InvalidRenderMode):
+        TopographyMap(1, render_mode="fast")
+
+
+def test_recolor_matches_a_fresh_render_and_reuses_the_index_map(build_map, monkeypatch):
+    generator = build_map()
+    generator.generate_image()
+    colors = np.random.default_rng(2).integers(0, 256, size=(len(generator.layers), 4), dtype=np.uint8)
+    fresh = build_map(background=(9, 8, 7, 255), layers=list(zip(map(tuple, colors), generator.layers.thresholds)))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("The noise was bucketed again.")
+
+    monkeypatch.setattr(generator, "bucket_noise", fail)
+    monkeypatch.setattr(generator, "get_random_noise", fail)
+    recolored = generator.recolor(colors, background_color=(9, 8, 7, 255))
+    np.testing.assert_array_equal(np.array(recolored), np.array(fresh.generate_image()))
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import scipy.ndimage
+
+from topolayers import TopographyMap
+from topolayers.noise import RandomNoise
+
+
+def test_legacy_rng_reproduces_the_global_numpy_stream():
+    np.random.seed(42)
+    expected = np.random.uniform(size=(4, 6))
+    noise = RandomNoise(42, (4, 6), legacy_rng=True)
+    np.testing.assert_array_equal(noise.noise_array, expected)
+    np.testing.assert_array_equal(noise.process_noise_array(zoom_aspect=8)[:, :, 0], scipy.ndimage.zoom(expected, 8))
+
+
+def test_numpy_integer_seeds_match_python_seeds():
+    for legacy_rng in (False, True):
+        expected = RandomNoise(7, (4, 4), legacy_rng=legacy_rng).noise_array
+        for seed in (np.int64(7), np.uint32(7), np.arange(10)[7]):
+            np.testing.assert_array_equal(RandomNoise(seed, (4, 4), legacy_rng=legacy_rng).noise_array, expected)
+    generator = TopographyMap(np.int64(7))
+    assert generator.seed == 7 and type(generator.seed) is int
+
+
+@pytest.mark.parametrize("seed", [7.0, "7"])
+def test_non_integer_seeds_are_rejected(seed):
+    with pytest.raises(TypeError):
+        RandomNoise(seed)
+    with pytest.raises(TypeError):
+        TopographyMap(seed)
+
+
+def test_octaves_grow_by_the_lacunarity():
+    noise = RandomNoise(3, (4, 6), octaves=3, lacunarity=1.5)
+    assert [array.shape for array in noise.octave_arrays] == [(4, 6), (6, 9), (9, 14)]
+    assert noise.lattice.shape == (9, 14)
+    assert noise.process_noise_array(zoom_aspect=8).shape == (32, 48, 1)
+
+
+def test_combined_octaves_match_a_weighted_sum_of_zoomed_octaves():
+    noise = RandomNoise(5, (4, 4), octaves=3, persistence=0.6)
+    rng = np.random.default_rng(5)
+    arrays = [rng.uniform(size=size) for size in ((4, 4), (8, 8), (16, 16))]
+    weights = np.array([1.0, 0.6, 0.36]) / 1.96
+    expected = arrays[2] * weights[2] + sum(
+        scipy.ndimage.zoom(array, 16 / len(array)) * weight for array, weight in zip(arrays[:2], weights[:2])
+    )
+    np.testing.assert_allclose(noise.combine_octaves(), expected, rtol=1e-12)
+
+
+def test_octave_weights_add_up_to_one():
+    noise = RandomNoise(5, (4, 4), octaves=4, persistence=0.5)
+    weights = 0.5 ** np.arange(4) / 1.875
+    for octave in range(4):
+        noise.octave_arrays = [
+            np.full(array.shape, float(index == octave)) for index, array in enumerate(noise.octave_arrays)
+        ]
+        np.testing.assert_allclose(noise.combine_octaves(), weights[octave])
+    # The weights add up to 1, so constant octaves sum to the same constant.
+    noise.octave_arrays = [np.ones(array.shape) for array in noise.octave_arrays]
+    np.testing.assert_allclose(noise.combine_octaves(), 1.0)
+
+
+def test_a_single_octave_is_the_noise_array_itself():
+    single = RandomNoise(9, (4, 4))
+    assert single.lattice is single.noise_array
+    np.testing.assert_array_equal(
+        single.process_noise_array(zoom_aspect=8)[:, :, 0], scipy.ndimage.zoom(single.noise_array, 8)
+    )
+    for octaves in (1, 3):
+        fractal = RandomNoise(9, (4, 4), octaves=octaves, lacunarity=3.0, persistence=0.9)
+        np.testing.assert_array_equal(fractal.noise_array, single.noise_array)
+    np.testing.assert_array_equal(
+        RandomNoise(9, (4, 4), octaves=1, persistence=0.9).process_noise_array(zoom_aspect=8),
+        single.process_noise_array(zoom_aspect=8),
+    )
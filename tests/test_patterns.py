@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from topolayers import Patterns
+from topolayers.exceptions import InvalidThreshold
+from topolayers.patterns import histogram_thresholds
+
+
+def chunk_maxima(noise: np.ndarray, layer_count: int) -> list:
+    """Plans thresholds the way main.py used to, from the chunks of every pixel sorted in descending order."""
+    pixels = sorted(noise.ravel(), reverse=True)
+    chunk_length = len(pixels) // layer_count
+    chunks = [pixels[start:][:chunk_length] for start in range(0, len(pixels), chunk_length)]
+    return [max(chunk) for chunk in chunks]
+
+
+@pytest.fixture
+def noise() -> np.ndarray:
+    return np.random.default_rng(3).uniform(size=(37, 41, 1))
+
+
+@pytest.mark.parametrize("layer_count", [1, 6, 7, 40])
+def test_exact_thresholds_match_chunk_maxima(noise, layer_count):
+    # 37 * 41 pixels never split evenly into 6, 7 or 40 chunks, so there is always a remainder.
+    pattern = Patterns(noise, 4)
+    expected = chunk_maxima(noise, layer_count)
+    assert len(expected) > layer_count or layer_count == 1
+    np.testing.assert_array_equal(pattern.plan_thresholds(layer_count), expected[:layer_count])
+    np.testing.assert_array_equal(pattern.plan_thresholds(layer_count, keep_remainder=True), expected)
+
+
+@pytest.mark.parametrize("bins", [64, 65536])
+def test_histogram_thresholds_stay_within_a_bin(noise, bins):
+    pattern = Patterns(noise, 4)
+    bin_width = (noise.max() - noise.min()) / bins
+    for keep_remainder in (False, True):
+        exact = pattern.plan_thresholds(7, keep_remainder=keep_remainder)
+        approximate = pattern.plan_thresholds(7, approximate=True, bins=bins, keep_remainder=keep_remainder)
+        assert np.abs(approximate - exact).max() <= bin_width * (1 + 1e-9)
+    assert pattern.plan_thresholds(7, approximate=True, bins=bins)[0] >= noise.max()
+
+
+def test_histogram_thresholds_interpolate_within_the_bin():
+    counts = np.array([0, 4, 0, 4])
+    np.testing.assert_allclose(histogram_thresholds(counts, 0.0, 4.0, np.array([0, 2, 4, 6])), [4.0, 3.5, 2.0, 1.5])
+
+
+def test_more_layers_than_pixels():
+    with pytest.raises(InvalidThreshold):
+        Patterns(np.zeros((2, 2)), 4).plan_thresholds(5)
+
+
+def legacy_step(color1: tuple, color2: tuple, luminosity: float, opacity: int) -> list:
+    """A gradient step the way interpolate and _process_rgba used to build it, one channel at a time."""
+    rgba = [(end - start) * luminosity + start for start, end in zip(color1[:3], color2[:3])] + [opacity]
+    return [int(min(max(channel, 0), 255)) for channel in rgba]
+
+
+COLORS = ["#102030", "#F0E0D0", "#00FF7F", "#000000"]
+RGB = [(16, 32, 48), (240, 224, 208), (0, 255, 127), (0, 0, 0)]
+
+
+@pytest.mark.parametrize("luminosity", [0.1, 0.3, 1 / 3])
+@pytest.mark.parametrize("opacity", [255, 128, 300])
+def test_gradient_palette_matches_legacy_steps(luminosity, opacity):
+    # A luminosity of 0.3 over 5 steps overshoots the second color, so clipping is covered too.
+    expected = [
+        legacy_step(start, end, luminosity * (step + 1), opacity)
+        for start, end in zip(RGB[:-1], RGB[1:])
+        for step in range(5)
+    ]
+    palette = Patterns(None, 5).gradient_palette(COLORS, luminosity, opacity=opacity)
+    assert palette.dtype == np.uint8
+    np.testing.assert_array_equal(palette, expected)
+
+
+@pytest.mark.parametrize("positions", [None, [0.0, 0.1, 0.7, 1.0]])
+def test_sample_palette_matches_legacy_steps(positions):
+    stops = np.linspace(0.0, 1.0, len(RGB)) if positions is None else positions
+    expected = []
+    for sample in np.linspace(0.0, 1.0, 17):
+        pair = min(int(np.searchsorted(stops, sample, side="right")) - 1, len(RGB) - 2)
+        luminosity = (sample - stops[pair]) / (stops[pair + 1] - stops[pair])
+        unrounded = [(end - start) * luminosity + start for start, end in zip(RGB[pair], RGB[pair + 1])]
+        # sample_palette rounds where _process_rgba truncated.
+        expected.append([min(max(round(channel), 0), 255) for channel in unrounded] + [200])
+    palette = Patterns(None, 5).sample_palette(COLORS, 17, positions=positions, opacity=200)
+    np.testing.assert_array_equal(palette, expected)
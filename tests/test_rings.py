@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from topolayers import NoiseCache, RingMap, RingOverlay, TopographyMap
+
+
+def texture(alpha: bool) -> Image.Image:
+    pixels = np.random.default_rng(1).integers(0, 256, size=(40, 30, 4), dtype=np.uint8)
+    if not alpha:
+        pixels[..., 3] = 255
+    return Image.fromarray(pixels)
+
+
+def legacy_ring_map(image: Image.Image) -> np.ndarray:
+    """Renders the rings the way toporings.py used to, comparing every rendered channel with the ring color."""
+    generator = TopographyMap(6, (4, 4), (255, 255, 255, 255), 16, noise_cache=NoiseCache())
+    noise = sorted(generator.get_noise(zoom_aspect=16).ravel(), reverse=True)
+    chunk_length = len(noise) // 20
+    chunks = [noise[start:][:chunk_length] for start in range(0, len(noise), chunk_length)]
+    for ring, chunk in enumerate(chunks):
+        generator.add_layer([0, 0, 0, 255] if ring % 4 == 0 else [35, 35, 35, 255], threshold=max(chunk))
+    master = np.array(generator.generate_image())
+    overlay = np.array(image.resize((master.shape[1], master.shape[0])).convert("RGBA"))
+    mask = master == [0, 0, 0, 255]
+    master[mask] = overlay[mask]
+    return master
+
+
+def ring_map(image: Image.Image) -> np.ndarray:
+    generator = RingMap(6, (4, 4), (255, 255, 255, 255), 16, overlay=RingOverlay(image), noise_cache=NoiseCache())
+    generator.add_rings()
+    return np.array(generator.generate_image())
+
+
+def test_opaque_textures_match_the_legacy_compositing():
+    image = texture(alpha=False)
+    np.testing.assert_array_equal(ring_map(image), legacy_ring_map(image))
+
+
+def test_translucent_textures_leave_the_other_rings_opaque():
+    image = texture(alpha=True)
+    rendered, legacy = ring_map(image), legacy_ring_map(image)
+    overlay = np.array(image.resize((64, 64)))
+    fill = np.all(rendered == (35, 35, 35, 255), axis=-1)
+    assert fill.any() and not fill.all()
+    np.testing.assert_array_equal(rendered[~fill], legacy[~fill])
+    np.testing.assert_array_equal(rendered[fill][:, :3], legacy[fill][:, :3])
+    # The legacy compositing matched the alpha of the fill color and copied the texture alpha in.
+    np.testing.assert_array_equal(legacy[fill][:, 3], overlay[fill][:, 3])
+
+
+def test_ring_buckets_follow_the_topmost_layer():
+    generator = RingMap(1, (4, 4), zoom_aspect=8, ring_indices=2, noise_cache=NoiseCache())
+    for threshold in (0.8, 0.5, 0.5, 0.2):
+        generator.add_layer((0, 0, 0, 255), threshold)
+    levels = generator.get_levels()
+    np.testing.assert_array_equal(levels, [0.2, 0.5, 0.8])
+    # Layer 2 is added after layer 1 at the same threshold, so it is on top. The last bucket is the background.
+    np.testing.assert_array_equal(generator.ring_buckets(levels), [False, True, True, False])
+
+
+@pytest.mark.parametrize("ring_indices", [1, 3, 4])
+def test_every_ring_indices_th_ring_shows_the_overlay(ring_indices):
+    generator = RingMap(2, (4, 4), zoom_aspect=8, ring_indices=ring_indices, noise_cache=NoiseCache())
+    generator.add_rings()
+    layer_count = len(generator.layers)
+    expected = [(layer_count - 1 - bucket) % ring_indices == 0 for bucket in range(layer_count)] + [False]
+    np.testing.assert_array_equal(generator.ring_buckets(generator.get_levels()), expected)
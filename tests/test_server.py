@@ -0,0 +1,125 @@
+import io
+import json
+import asyncio
+import threading
+import concurrent.futures
+
+import pytest
+from PIL import Image
+
+from topolayers import Patterns, cache, server
+from topolayers.exceptions import ServiceOverloaded
+from topolayers.server import EncodedCache, RenderService, ServiceMetrics
+
+SETTINGS = {
+    "zoom_aspect": 8,
+    "noise_size": (4, 4),
+    "background_color": (255, 255, 255, 255),
+    "colors": ["#000000", "#FFFFFF"],
+    "gradient_steps": 3,
+    "luminosity": 0.1,
+    "legacy_rng": False,
+    "octaves": 1,
+    "lacunarity": 2.0,
+    "persistence": 0.5,
+}
+
+
+def test_encoded_cache_evicts_least_recently_used():
+    encoded = EncodedCache(max_bytes=10)
+    encoded.put("a", b"aaaa")
+    encoded.put("b", b"bbbb")
+    assert encoded.get("a") == b"aaaa"
+    encoded.put("c", b"cccc")
+    assert encoded.get("b") is None
+    assert encoded.get("a") == b"aaaa" and encoded.get("c") == b"cccc"
+    assert encoded.current_bytes == 8 and encoded.evictions == 1
+
+
+def test_encoded_cache_skips_images_over_budget():
+    encoded = EncodedCache(max_bytes=4)
+    encoded.put("a", b"aaaaa")
+    assert len(encoded) == 0 and encoded.current_bytes == 0
+
+
+def test_metrics_snapshot():
+    metrics = ServiceMetrics(cache_hits=3, renders=1)
+    metrics.latencies.extend([0.001 * sample for sample in range(1, 101)])
+    snapshot = metrics.snapshot()
+    assert snapshot["hit_ratio"] == 0.75
+    assert snapshot["latency_ms"] == {"p50": 51.0, "p95": 96.0, "p99": 100.0, "max": 100.0}
+    assert snapshot["render_ms"]["max"] == 0.0
+
+
+def test_render_encoded_leaves_the_shared_noise_cache_alone():
+    cache.noise_cache.clear()
+    palette = Patterns(None, 3).gradient_palette(SETTINGS["colors"], 0.1)
+    data = server.render_encoded(SETTINGS, palette, 3, "PNG", "fast")
+    assert data.startswith(b"\x89PNG")
+    assert len(cache.noise_cache) == 0
+
+
+def test_concurrent_identical_requests_render_once(monkeypatch):
+    calls, release = [], threading.Event()
+    render_encoded = server.render_encoded
+
+    def counting_render(*arguments):
+        calls.append(arguments[2])
+        release.wait(5)
+        return render_encoded(*arguments)
+
+    monkeypatch.setattr(server, "render_encoded", counting_render)
+
+    async def run():
+        executor = concurrent.futures.ThreadPoolExecutor(2)
+        async with RenderService(SETTINGS, workers=2, executor=executor) as service:
+            requests = [asyncio.ensure_future(service.handle("GET", "/render?seed=9")) for _ in range(5)]
+            await asyncio.sleep(0.05)
+            release.set()
+            responses = await asyncio.gather(*requests)
+            cached = await service.handle("GET", "/render?seed=9")
+            metrics = json.loads((await service.handle("GET", "/metrics"))[2])
+        executor.shutdown()
+        return responses, cached, metrics
+
+    responses, cached, metrics = asyncio.run(run())
+    assert calls == [9]
+    assert {status for status, _, _ in responses} == {200}
+    assert len({body for _, _, body in responses + [cached]}) == 1
+    assert Image.open(io.BytesIO(cached[2])).size == (32, 32)
+    assert metrics["renders"] == 1 and metrics["coalesced"] == 4 and metrics["cache_hits"] == 1
+    assert metrics["cache"]["entries"] == 1 and metrics["queue"]["in_flight"] == 0
+
+
+def test_full_queue_is_rejected():
+    async def run():
+        executor = concurrent.futures.ThreadPoolExecutor(1)
+        service = RenderService(SETTINGS, workers=1, max_queue=1, executor=executor)
+        service._queue = asyncio.Queue(1)  # Started without consumers, so nothing leaves the queue.
+        first = asyncio.ensure_future(service.render({"seed": "1"}))
+        await asyncio.sleep(0)
+        with pytest.raises(ServiceOverloaded):
+            await service.render({"seed": "2"})
+        status = (await service.handle("GET", "/render?seed=3"))[0]
+        first.cancel()
+        executor.shutdown()
+        return status, service.metrics.rejected
+
+    assert asyncio.run(run()) == (503, 2)
+
+
+def test_bad_requests():
+    async def run():
+        targets = ("/render", "/render?seed=1&format=gif", "/render?seed=1&colors=zzzzzz,000000", "/nothing")
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            async with RenderService(SETTINGS, workers=1, executor=executor) as service:
+                return [(await service.handle("GET", target))[0] for target in targets]
+
+    assert asyncio.run(run()) == [400, 400, 400, 404]
+
+
+def test_workers_default_to_the_cpu_count(monkeypatch):
+    monkeypatch.setattr(server.os, "cpu_count", lambda: 3)
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        assert RenderService(SETTINGS, executor=executor).workers == 3
+    assert RenderService(SETTINGS, workers=2).workers == 2
@@ -0,0 +1,94 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from topolayers import (
+    HeightField,
+    KernelEngine,
+    NoiseCache,
+    Patterns,
+    PNGStreamWriter,
+    TiledRenderer,
+    TopographyMap,
+    WorldMap,
+)
+from topolayers.exceptions import InvalidThreshold
+
+
+@pytest.mark.parametrize("extension", [".png", ".npy", ".raw"])
+@pytest.mark.parametrize("engine", [None, KernelEngine()], ids=["spline", "kernel"])
+def test_tiled_render_matches_full_render(tmp_path, build_map, extension, engine):
+    generator = build_map(11, (4, 6), 20, engine=engine)
+    expected = np.array(generator.generate_image())
+    path = str(tmp_path / f"map{extension}")
+    # The tile size does not divide the image, so partial tiles and bands are covered too.
+    shape = TiledRenderer(generator, tile_size=48).render(path)
+    assert shape == expected.shape[:2]
+    if extension == ".png":
+        rendered = np.array(Image.open(path))
+    elif extension == ".npy":
+        rendered = np.load(path)
+    else:
+        rendered = np.fromfile(path, dtype=np.uint8).reshape(expected.shape)
+    np.testing.assert_array_equal(rendered, expected)
+
+
+def test_png_stream_writer_round_trips():
+    rows = np.random.default_rng(0).integers(0, 256, size=(37, 23, 4), dtype=np.uint8)
+    buffer = io.BytesIO()
+    with PNGStreamWriter(buffer, 23, 37) as writer:
+        writer.write_rows(rows[:10])
+        writer.write_rows(rows[10:])
+    buffer.seek(0)
+    np.testing.assert_array_equal(np.array(Image.open(buffer)), rows)
+
+
+@pytest.mark.parametrize("tile_size", [16, 24])
+def test_tiled_world_render_matches_full_render(tmp_path, tile_size):
+    world = WorldMap(5, (4, 4), (255, 255, 255, 255), 16, noise_cache=NoiseCache())
+    world.add_layer((200, 40, 40, 255), 0.6)
+    world.add_layer((40, 40, 200, 255), 0.35)
+    expected = np.array(world.generate_image())
+    path = str(tmp_path / "world.npy")
+    assert TiledRenderer(world, tile_size=tile_size).render(path) == (64, 64)
+    np.testing.assert_array_equal(np.load(path), expected)
+
+
+def test_noise_regions_match_the_full_zoom(build_map):
+    for noise in (
+        build_map(11, (4, 6), 20, octaves=2).get_random_noise(),
+        WorldMap(3, (3, 5), zoom_aspect=12).get_random_noise(),
+    ):
+        full = noise.process_noise_array(zoom_aspect=12)[:, :, 0]
+        assert full.shape == noise.zoomed_shape(12)
+        region = noise.process_noise_region(12, slice(7, 30), slice(13, 41))
+        np.testing.assert_array_equal(region, full[7:30, 13:41])
+
+
+def test_streamed_thresholds_match_planned_thresholds(tmp_path, build_map):
+    generator = build_map(11, (4, 6), 20)
+    noise = generator.get_noise(20)
+    renderer = TiledRenderer(generator, tile_size=24)
+    for keep_remainder in (False, True):
+        thresholds = renderer.plan_thresholds(7, keep_remainder=keep_remainder)
+        expected = Patterns(noise, 5).plan_thresholds(7, keep_remainder=keep_remainder)
+        assert len(thresholds) == len(expected)
+        np.testing.assert_allclose(thresholds, expected, atol=2 * np.ptp(noise) / 65536)
+    with pytest.raises(InvalidThreshold):
+        renderer.plan_thresholds(80 * 120 + 1)
+
+
+def test_streamed_thresholds_skip_missing_heights():
+    grid = np.arange(24 * 18, dtype=np.float32).reshape(24, 18)
+    grid[:6] = -9999
+    field = HeightField(grid, nodata=-9999)
+    renderer = TiledRenderer(TopographyMap(height_field=field, zoom_aspect=1, noise_cache=NoiseCache()), tile_size=7)
+    np.testing.assert_allclose(renderer.plan_thresholds(4), field.plan_thresholds(4), atol=2 / 65536)
+
+
+def test_shape_does_not_build_the_noise(build_map, monkeypatch):
+    generator = build_map(11, (4, 6), 20)
+    monkeypatch.setattr(generator, "get_random_noise", None)
+    assert TiledRenderer(generator).shape() == (80, 120)
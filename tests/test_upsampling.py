@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+import scipy.ndimage
+
+from topolayers import KernelEngine, RandomNoise, SpectralEngine, SplineEngine, UpsamplingEngine
+from topolayers.upsampling import SeparableEngine, zoomed_shape
+
+ENGINES = [
+    SplineEngine(),
+    KernelEngine("bicubic"),
+    KernelEngine("bilinear"),
+    SpectralEngine(),
+    KernelEngine(dtype=np.float32),
+]
+IDS = ["spline", "bicubic", "bilinear", "spectral", "bicubic32"]
+
+
+@pytest.fixture
+def array() -> np.ndarray:
+    return np.random.default_rng(3).uniform(size=(5, 7))
+
+
+def test_spline_engine_matches_scipy_zoom(array):
+    np.testing.assert_array_equal(SplineEngine().zoom(array, 9), scipy.ndimage.zoom(array, 9))
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=IDS)
+def test_regions_match_the_full_zoom(engine, array):
+    full = engine.zoom(array, 9)
+    assert full.shape == zoomed_shape(array.shape, 9) and full.dtype == engine.dtype
+    rows, columns = slice(7, 30), slice(20, 63)
+    region = engine.zoom_region(array, 9, rows, columns)
+    tolerance = 1e-5 if engine.dtype == np.float32 else 1e-12
+    np.testing.assert_allclose(region, full[rows, columns], rtol=0, atol=tolerance)
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=IDS)
+def test_zoom_writes_into_out(engine, array):
+    out = np.empty((45, 63), dtype=engine.dtype)
+    assert engine.zoom(array, 9, out=out) is out
+    np.testing.assert_allclose(out, engine.zoom(array, 9), atol=1e-6)
+
+
+def test_per_axis_zoom_aspects(array):
+    assert SplineEngine().zoom(array, (2, 3)).shape == (10, 21)
+    assert KernelEngine().zoom(array, (2, 3)).shape == (10, 21)
+
+
+def test_interpolating_engines_keep_the_samples(array):
+    for engine in (SplineEngine(), KernelEngine("bicubic"), KernelEngine("bilinear")):
+        zoomed = engine.zoom(array, (9, 10))  # (45, 70), so samples land every 11 and 11.5 pixels.
+        np.testing.assert_allclose(zoomed[::11, ::23], array[:, ::2], atol=1e-12)
+
+
+def test_spline_filters_the_array_once_for_every_tile(monkeypatch, array):
+    calls = []
+    spline_filter = scipy.ndimage.spline_filter
+
+    def counting_filter(*args, **kwargs):
+        calls.append(1)
+        return spline_filter(*args, **kwargs)
+
+    monkeypatch.setattr(scipy.ndimage, "spline_filter", counting_filter)
+    engine = SplineEngine()
+    full = engine.zoom(array, 8)
+    tiles = [
+        [engine.zoom_region(array, 8, slice(top, top + 10), slice(left, left + 10)) for left in range(0, 56, 10)]
+        for top in range(0, 40, 10)
+    ]
+    np.testing.assert_array_equal(np.block(tiles), full)
+    assert len(calls) == 1
+    array[0, 0] = 2.0  # Modified in place, so the coefficients are filtered again.
+    np.testing.assert_array_equal(engine.zoom_region(array, 8, slice(0, 40), slice(0, 56)), engine.zoom(array, 8))
+    assert len(calls) == 2
+
+
+def test_base_engines_are_abstract():
+    with pytest.raises(TypeError):
+        UpsamplingEngine()
+    with pytest.raises(TypeError):
+        SeparableEngine()
+
+
+def test_invalid_kernel():
+    with pytest.raises(ValueError):
+        KernelEngine("lanczos")
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=IDS)
+def test_noise_regions_match_the_processed_noise(engine):
+    noise = RandomNoise(4, (4, 5), engine=engine)
+    full = noise.process_noise_array(zoom_aspect=12)[:, :, 0]
+    assert full.shape == noise.zoomed_shape(12)
+    tolerance = 1e-5 if engine.dtype == np.float32 else 1e-12
+    np.testing.assert_allclose(noise.process_noise_region(12, slice(5, 40), slice(0, 60)), full[5:40], atol=tolerance)
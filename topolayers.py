@@ -25,15 +25,26 @@ with open("config.json", "r") as file:
     colors = settings.get("colors")
     seed = settings.get("seed")
     output_path = settings.get("output_path")
-
-generator = TopographyMap(seed, noise_size, background_color, zoom_aspect)
-noise = sorted(generator.get_noise(zoom_aspect=zoom_aspect).ravel(), reverse=True)
+    legacy_rng = settings.get("legacy_rng", False)
+    octaves = settings.get("octaves", 1)
+    lacunarity = settings.get("lacunarity", 2.0)
+    persistence = settings.get("persistence", 0.5)
+
+generator = TopographyMap(
+    seed,
+    noise_size,
+    background_color,
+    zoom_aspect,
+    legacy_rng=legacy_rng,
+    octaves=octaves,
+    lacunarity=lacunarity,
+    persistence=persistence,
+)
+noise = generator.get_noise(zoom_aspect=zoom_aspect)
 pattern = Patterns(noise, gradient_steps=gradient_steps)
 
-values = pattern.interpolate_colors(colors, luminosity=luminosity)  # Change method name.
-
-for rgb, layer in values:
-    generator.add_layer(rgb, threshold=max(layer))
+palette = pattern.gradient_palette(colors, luminosity=luminosity)
+generator.add_layers(palette, pattern.plan_thresholds(len(palette)))
 
 
 if __name__ == "__main__":
@@ -1,7 +1,19 @@
-from .layers import TopographyLayer, TopographyMap
+from .layers import TopographyLayer, TopographyMap, LayerStack
 from .noise import RandomNoise
+from .heightfield import HeightField
 from .patterns import Patterns
-from .exceptions import InvalidThreshold, InvalidRGB, LayerRequired, InvalidHex
+from .cache import NoiseCache, DiskCache, CacheInfo, noise_cache
+from .batch import generate_batch
+from .tiles import TiledRenderer, PNGStreamWriter
+from .instrumentation import Instrumentation, StageEvent
+from .encoding import ENCODE_PROFILES, encode_image, palette_image
+from .rings import RingMap, RingOverlay
+from .upsampling import UpsamplingEngine, SplineEngine, KernelEngine, SpectralEngine
+from .animation import TopographyAnimation
+from .server import RenderService, EncodedCache, ServiceMetrics
+from .world import LatticeNoise, WorldMap
+from .contours import ContourExporter, Contours, marching_squares
+from .exceptions import InvalidThreshold, InvalidRGB, LayerRequired, InvalidHex, InvalidRenderMode, ServiceOverloaded
 
 __version__ = "1.1.0"
 
@@ -0,0 +1,113 @@
+"""
+MIT License
+
+Copyright (c) 2022 capslock321
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import logging
+import argparse
+
+from .batch import load_config, parse_seeds, render_seed_range
+from .encoding import ENCODE_PROFILES
+from .server import run_service
+
+
+def _batch(args: argparse.Namespace) -> int:
+    """Runs the batch subcommand.
+
+    Args:
+        args: The parsed command line arguments.
+
+    Returns:
+        int: The exit code, 1 if any seed failed.
+    """
+    settings = load_config(args.config)
+    cache_bytes = args.cache_mb * 1024 * 1024
+    report = render_seed_range(
+        settings, args.seeds, args.output, args.workers, args.profile, args.format, args.cache_dir, cache_bytes
+    )
+    print(
+        f"Rendered {report.rendered} of {len(args.seeds)} seeds in {report.elapsed:.2f}s ({report.throughput:.2f} images/s)."
+    )
+    if report.failures:
+        print(f"Failed seeds: {', '.join(str(seed) for seed in sorted(report.failures))}")
+        return 1
+    return 0
+
+
+def _serve(args: argparse.Namespace) -> int:
+    """Runs the serve subcommand.
+
+    Args:
+        args: The parsed command line arguments.
+
+    Returns:
+        int: The exit code.
+    """
+    settings = load_config(args.config)
+    run_service(
+        settings, args.host, args.port, workers=args.workers, max_queue=args.queue, cache_bytes=args.cache_mb * 1024 * 1024
+    )
+    return 0
+
+
+def main(argv: list = None) -> int:
+    """The command line entry point, run with "python -m topolayers".
+
+    Args:
+        argv: The command line arguments, defaults to sys.argv.
+
+    Returns:
+        int: The exit code.
+    """
+    parser = argparse.ArgumentParser(prog="python -m topolayers", description="Generate topography like images.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log the progress of every render.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch = subparsers.add_parser("batch", help="Render many seeds on a process pool.")
+    batch.add_argument("seeds", type=parse_seeds, help='Seeds and inclusive seed ranges to render, such as "1-100,250".')
+    batch.add_argument("-c", "--config", default="config.json", help="The config file to render with.")
+    batch.add_argument("-o", "--output", default=".", help="The directory to save the images to.")
+    batch.add_argument("-w", "--workers", type=int, default=None, help="The amount of worker processes.")
+    batch.add_argument("-p", "--profile", choices=ENCODE_PROFILES, default="smallest", help="The encode profile.")
+    batch.add_argument("-f", "--format", choices=("png", "webp"), default="png", help="The image format.")
+    batch.add_argument("--cache-dir", default=None, help="A directory to keep noise fields and images in between runs.")
+    batch.add_argument("--cache-mb", type=int, default=4096, help="The size of the disk cache in megabytes.")
+    batch.set_defaults(handler=_batch)
+
+    serve = subparsers.add_parser("serve", help="Serve maps over HTTP, such as GET /render?seed=5.")
+    serve.add_argument("-c", "--config", default="config.json", help="The config file with the default settings.")
+    serve.add_argument("--host", default="127.0.0.1", help="The address to listen on.")
+    serve.add_argument("--port", type=int, default=8000, help="The port to listen on.")
+    serve.add_argument("-w", "--workers", type=int, default=None, help="The amount of worker processes.")
+    serve.add_argument("-q", "--queue", type=int, default=64, help="The amount of renders that may wait for a worker.")
+    serve.add_argument("--cache-mb", type=int, default=64, help="The size of the encoded image cache in megabytes.")
+    serve.set_defaults(handler=_serve)
+
+    args = parser.parse_args(argv)
+    fmt = "[%(asctime)s] %(name)s: %(message)s"
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format=fmt, datefmt="%m/%d/%Y %I:%M:%S %p")
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,350 @@
+"""
+MIT License
+
+Copyright (c) 2022 capslock321
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import math
+import logging
+
+import numpy as np
+from PIL import GifImagePlugin, Image
+from typing import Iterator, List, Optional, Union
+
+from .noise import RandomNoise
+from .layers import TopographyMap
+from .world import MASK, LatticeNoise, LatticeWindow, WorldMap
+from .encoding import PALETTE_SIZE, encode_image, infer_format, palette_image
+from .upsampling import zoomed_shape
+
+logger = logging.getLogger(__name__)
+
+
+def _keyframe_seed(seed: int, keyframe: int) -> int:
+    """Derives the seed of a keyframe from the seed of the map.
+
+    Args:
+        seed: The seed of the map.
+        keyframe: The keyframe, 0 keeps the seed of the map itself.
+
+    Returns:
+        int: A 32 bit seed, which the legacy random generator accepts too, unrelated to the seeds of other keyframes.
+    """
+    if not keyframe:
+        return seed
+    return int(np.random.SeedSequence([seed & MASK, keyframe]).generate_state(1)[0])
+
+
+class _BlendedLattice(LatticeNoise):
+    def __init__(self, keyframes: List[LatticeNoise]):
+        """The lattice noise of a frame between two keyframe lattices.
+
+        The lattice values are blended like TopographyAnimation blends noise arrays.
+        The cubic weights of every sample add up to 1, so interpolating the blended
+        values gives the blend of the interpolated keyframes.
+
+        Args:
+            keyframes: The lattice noise of every keyframe.
+        """
+        super().__init__(keyframes[0].seed, keyframes[0].cell_size)
+        self.keyframes: List[LatticeNoise] = keyframes
+        self.mix: tuple = (0, 1.0, 0.0)
+
+    def lattice(self, rows: np.ndarray, columns: np.ndarray) -> np.ndarray:
+        keyframe, cosine, sine = self.mix
+        values = self.keyframes[keyframe].lattice(rows, columns)
+        values *= cosine
+        if sine:
+            values += self.keyframes[(keyframe + 1) % len(self.keyframes)].lattice(rows, columns) * sine
+            values += 0.5 * (1 - cosine - sine)
+        return values
+
+
+class TopographyAnimation:
+    def __init__(self, generator: TopographyMap, frame_count: int = 60, keyframes: int = 4):
+        """A looping animation of a topography map whose contours slowly drift.
+
+        The noise is a 3D volume of keyframes drawn from the seed of the map, and
+        the first keyframe is the noise of the map itself, so the first frame
+        matches the still image. Every frame blends two neighbouring keyframes
+        of the small noise array, which keeps the contrast of the noise steady,
+        then zooms it and buckets it with the layers of the map. Zooming is linear,
+        so blending before zooming costs a single zoom per frame.
+
+        With more than one octave, every keyframe is the combined octave lattice of
+        its own RandomNoise, the first one being the noise of the map, and frames
+        blend and zoom those lattices.
+
+        A WorldMap blends the lattices of keyframe worlds instead, the first of
+        which is the world of the map, and evaluates the blend over its window.
+
+        The zoomed noise of random maps, the index map and the RGBA frame are written
+        into buffers allocated once, so rendering frames does not allocate new images.
+
+        Args:
+            generator: The map to animate, with every layer already added.
+            frame_count: The amount of frames in one loop.
+            keyframes: The amount of noise keyframes the loop passes through.
+
+        Raises:
+            ValueError: If the map renders a height field, which has no keyframes to blend.
+        """
+        if generator.height_field is not None:
+            raise ValueError("A height field is fixed terrain, so it cannot be animated.")
+        self.generator: TopographyMap = generator
+        self.frame_count: int = frame_count
+        self.keyframes: int = keyframes
+        self.volume: Optional[np.ndarray] = None
+        self.volume_zoom: Union[int, tuple] = generator.zoom_aspect
+        self.lattice: Optional[_BlendedLattice] = None
+        if isinstance(generator, WorldMap):
+            cell_size = generator.noise_source.cell_size
+            keyframe_noise = [
+                LatticeNoise(_keyframe_seed(generator.seed, keyframe), cell_size) for keyframe in range(1, keyframes)
+            ]
+            self.lattice = _BlendedLattice([generator.noise_source] + keyframe_noise)
+        elif generator.octaves > 1:
+            source = generator.get_random_noise()
+            settings = {
+                "legacy_rng": generator.legacy_rng,
+                "engine": generator.engine,
+                "octaves": generator.octaves,
+                "lacunarity": generator.lacunarity,
+                "persistence": generator.persistence,
+            }
+            keyframe_noise = [
+                RandomNoise(_keyframe_seed(generator.seed, keyframe), generator.array_size, **settings)
+                for keyframe in range(1, keyframes)
+            ]
+            self.volume = np.stack([source.lattice] + [noise.lattice for noise in keyframe_noise])
+            self.volume_zoom = source.lattice_zoom(generator.zoom_aspect)
+        else:
+            array_size = (keyframes,) + tuple(generator.array_size)
+            volume = RandomNoise(generator.seed, array_size, legacy_rng=generator.legacy_rng, engine=generator.engine)
+            self.volume = volume.noise_array
+
+    def _mix(self, frame: int) -> tuple:
+        """Works out the keyframe a frame starts from and how much of it and the next keyframe to mix.
+
+        Args:
+            frame: The frame to mix.
+
+        Returns:
+            tuple: The keyframe and the cosine and sine weights of it and the next keyframe.
+        """
+        position = frame * self.keyframes / self.frame_count
+        keyframe, fraction = int(position) % self.keyframes, position - int(position)
+        angle = math.pi / 2 * fraction * fraction * (3 - 2 * fraction)
+        return keyframe, math.cos(angle), math.sin(angle)
+
+    def _blend(self, frame: int, out: np.ndarray) -> np.ndarray:
+        """Blends the two keyframes around a frame into out.
+
+        The keyframes are centred on the mean of the noise and mixed by the cosine
+        and sine of an eased angle. For independent noise this keeps the variance
+        of the blend constant, and the easing makes every keyframe a smooth turning
+        point. On a keyframe the blend is exactly that keyframe.
+
+        Args:
+            frame: The frame to blend the noise of.
+            out: The preallocated array to write the small noise array into.
+
+        Returns:
+            np.ndarray: out.
+        """
+        keyframe, cosine, sine = self._mix(frame)
+        np.multiply(self.volume[keyframe], cosine, out=out)
+        if sine:
+            out += self.volume[(keyframe + 1) % self.keyframes] * sine
+            out += 0.5 * (1 - cosine - sine)
+        return out
+
+    def index_frames(self) -> Iterator[tuple]:
+        """Renders the layer index map of every frame.
+
+        Yields:
+            np.ndarray: The per pixel layer index of the frame. The same buffer is
+                reused for every frame, so copy it to keep it.
+            np.ndarray: The (levels + 1, 4) uint8 RGBA palette, the same for every frame.
+        """
+        generator, instrumentation = self.generator, self.generator.instrumentation
+        levels = generator.get_levels()
+        palette = generator.build_palette(levels)
+        if self.lattice is not None:
+            window = LatticeWindow(self.lattice, generator.array_size)
+            shape = window.zoomed_shape(generator.zoom_aspect)
+        else:
+            shape = zoomed_shape(self.volume.shape[1:], self.volume_zoom)
+            noise = np.empty(self.volume.shape[1:], dtype=np.float64)
+            field = np.empty(shape, dtype=generator.engine.dtype)
+        index_map = np.empty(shape, dtype=np.min_scalar_type(len(levels)))
+        logger.info(f"Rendering {self.frame_count} frames of shape {shape} from {self.keyframes} keyframes.")
+        for frame in range(self.frame_count):
+            if self.lattice is not None:
+                self.lattice.mix = self._mix(frame)
+                with instrumentation.stage("zoom", generator.seed) as stage:
+                    field = stage.record(window.process_noise_region(generator.zoom_aspect, slice(None), slice(None)))
+            else:
+                self._blend(frame, noise)
+                with instrumentation.stage("zoom", generator.seed) as stage:
+                    stage.record(generator.engine.zoom(noise, self.volume_zoom, out=field))
+            with instrumentation.stage("threshold", generator.seed) as stage:
+                stage.record(generator.bucket_noise(field, levels, out=index_map))
+            yield index_map, palette
+
+    def frames(self) -> Iterator[np.ndarray]:
+        """Renders every frame as RGBA.
+
+        Yields:
+            np.ndarray: The (height, width, 4) uint8 frame. The same buffer is
+                reused for every frame, so copy it to keep it.
+        """
+        buffer = None
+        for index_map, palette in self.index_frames():
+            if buffer is None:
+                buffer = np.empty(index_map.shape + (4,), dtype=np.uint8)
+            with self.generator.instrumentation.stage("composite", self.generator.seed) as stage:
+                stage.record(np.take(palette, index_map, axis=0, out=buffer))
+            yield buffer
+
+    def save_sequence(self, output_path: str, name: str = "frame_{:04d}.png", profile: str = "fast") -> int:
+        """Streams every frame to its own image file, holding one frame in memory at a time.
+
+        Args:
+            output_path: The directory to save the frames to.
+            name: The file name of every frame, formatted with the frame number.
+            profile: The encode profile, one of "fast", "balanced" or "smallest".
+
+        Returns:
+            int: The amount of frames saved.
+        """
+        os.makedirs(output_path, exist_ok=True)
+        for frame, buffer in enumerate(self.frames()):
+            path = os.path.join(output_path, name.format(frame))
+            with self.generator.instrumentation.stage("save", self.generator.seed) as stage:
+                stage.record(
+                    pixels=buffer.shape[0] * buffer.shape[1],
+                    bytes_written=encode_image(Image.fromarray(buffer), path, profile=profile),
+                )
+        return self.frame_count
+
+    @staticmethod
+    def _gif_palette(palette: np.ndarray) -> tuple:
+        """Merges the duplicate colors of a palette, as a GIF has a single transparent color.
+
+        Args:
+            palette: The (levels + 1, 4) uint8 RGBA palette.
+
+        Returns:
+            np.ndarray: The lookup from the buckets to the merged palette.
+            np.ndarray: The merged palette.
+
+        Raises:
+            ValueError: If the palette is partially transparent or has more than 256 colors.
+        """
+        alpha = palette[:, 3]
+        if np.any((alpha != 0) & (alpha != 255)):
+            raise ValueError("Every color of a GIF must be opaque or fully transparent.")
+        palette = np.where(alpha[:, np.newaxis] == 0, np.uint8(0), palette)
+        palette, lookup = np.unique(palette, axis=0, return_inverse=True)
+        if len(palette) > PALETTE_SIZE:
+            raise ValueError(f"A GIF can hold {PALETTE_SIZE} colors, the map has {len(palette)}.")
+        return lookup.reshape(-1).astype(np.uint8), palette
+
+    def _save_gif(self, output_path: str, duration: int) -> int:
+        """Streams every frame into a GIF, writing each frame as soon as it is rendered.
+
+        Every frame indexes into the single global palette written with the header,
+        so a frame only adds its own LZW compressed indices to the file.
+
+        Args:
+            output_path: The path of the animation.
+            duration: The duration of every frame in milliseconds.
+
+        Returns:
+            int: The amount of pixels saved.
+        """
+        params, pixels, lookup, gif_map = {"duration": duration}, 0, None, None
+        with open(output_path, "wb") as file:
+            for index_map, palette in self.index_frames():
+                if lookup is None:
+                    lookup, colors = self._gif_palette(palette)
+                    if not colors[:, 3].all():
+                        params.update(transparency=int(np.argmin(colors[:, 3])), disposal=2)
+                    gif_map = np.empty(index_map.shape, dtype=np.uint8)
+                np.take(lookup, index_map, out=gif_map)
+                image = palette_image(gif_map, colors)
+                if not pixels:
+                    header, _ = GifImagePlugin.getheader(image, info={"loop": 0, "optimize": False})
+                    file.writelines(header)
+                file.writelines(GifImagePlugin.getdata(image, **params))
+                pixels += gif_map.size
+            file.write(b";")
+        return pixels
+
+    def _save_webp(self, output_path: str, duration: int, profile: str) -> int:
+        """Hands every frame to the lossless WebP animation encoder.
+
+        The frames are passed to Image.save as a generator, but Pillow collects
+        every appended frame before it starts encoding, so unlike a GIF the whole
+        animation is held in memory.
+
+        Args:
+            output_path: The path of the animation.
+            duration: The duration of every frame in milliseconds.
+            profile: The encode profile, one of "fast", "balanced" or "smallest".
+
+        Returns:
+            int: The amount of pixels saved.
+        """
+        # Every frame is rendered into the same buffer, so each one is copied before the next is rendered.
+        frames = (Image.fromarray(frame.copy()) for frame in self.frames())
+        first = next(frames)
+        params = {"lossless": True, "exact": True, "method": 0 if profile == "fast" else 4}
+        first.save(output_path, format="WEBP", save_all=True, append_images=frames, duration=duration, loop=0, **params)
+        return first.width * first.height * self.frame_count
+
+    def save_animation(self, output_path: str, duration: int = 40, profile: str = "fast") -> None:
+        """Saves every frame as an animated GIF or lossless animated WebP.
+
+        GIF frames are streamed to the file as they are rendered, so a single frame
+        is held in memory at a time, and need a palette of at most 256 colors with
+        opaque or fully transparent layers. WebP animations hold every frame.
+
+        Args:
+            output_path: The path of the animation, ending in ".gif" or ".webp".
+            duration: The duration of every frame in milliseconds.
+            profile: The encode profile of WebP animations, one of "fast", "balanced" or "smallest".
+
+        Raises:
+            ValueError: If the format is not GIF or WebP, or a GIF palette does not fit.
+        """
+        image_format = infer_format(output_path)
+        if image_format not in ("GIF", "WEBP"):
+            raise ValueError(f"Animations can be saved as GIF or WebP, not {image_format}.")
+        logger.info(f"Saving {self.frame_count} frame {image_format} animation to {output_path}.")
+        with self.generator.instrumentation.stage("save", self.generator.seed) as stage:
+            if image_format == "GIF":
+                pixels = self._save_gif(output_path, duration)
+            else:
+                pixels = self._save_webp(output_path, duration, profile)
+            stage.record(pixels=pixels, bytes_written=os.path.getsize(output_path))
@@ -0,0 +1,319 @@
+"""
+MIT License
+
+Copyright (c) 2022 capslock321
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import json
+import time
+import logging
+import traceback
+import collections
+import dataclasses
+import concurrent.futures
+
+import numpy as np
+from PIL import Image
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .cache import DEFAULT_DISK_BYTES, DiskCache, NoiseCache
+from .encoding import infer_format, write_atomically
+from .layers import TopographyMap
+from .patterns import Patterns
+
+logger = logging.getLogger(__name__)
+
+_worker_state: dict = {}
+
+
+def _render_seed(seed: int, build_map: Callable[[int], TopographyMap], output_path: str = None) -> Image:
+    """Builds and renders the map of a single seed.
+
+    Args:
+        seed: The seed to render.
+        build_map: A function that takes a seed and returns a TopographyMap with its layers added.
+        output_path: If provided, the directory to save the image to as "{seed}.png".
+
+    Returns:
+        PIL.Image: The generated image.
+    """
+    generator = build_map(seed)
+    if output_path is not None:
+        return generator.generate_image(os.path.join(output_path, f"{generator.seed}.png"))
+    return generator.generate_image()
+
+
+def generate_batch(
+    seeds: Iterable[int],
+    build_map: Callable[[int], TopographyMap],
+    output_path: str = None,
+    max_workers: int = None,
+) -> Iterator[Tuple[int, Image.Image]]:
+    """Renders the maps of many seeds concurrently on a thread pool.
+
+    Every TopographyMap draws its noise from its own random generator and the
+    noise cache is thread safe, so maps can be built and rendered side by side.
+    The spline zoom, thresholding and compositing release the GIL, which lets
+    the threads run in parallel. At most twice as many seeds as there are
+    threads are in flight at once, so rendered images that have not been
+    consumed yet do not pile up in memory.
+
+    Args:
+        seeds: The seeds to render, read lazily.
+        build_map: A function that takes a seed and returns a TopographyMap with its layers added.
+        output_path: If provided, the directory to save every image to as "{seed}.png".
+        max_workers: The amount of threads to use. Defaults to the ThreadPoolExecutor default.
+
+    Returns:
+        Iterator[Tuple[int, PIL.Image]]: The seed and generated image of every seed, in order.
+    """
+    workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+    logger.info(f"Rendering seeds on a thread pool with {workers} workers.")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for seed in seeds:
+            pending.append((seed, executor.submit(_render_seed, seed, build_map, output_path)))
+            if len(pending) >= workers * 2:
+                seed, future = pending.popleft()
+                yield seed, future.result()
+        while pending:
+            seed, future = pending.popleft()
+            yield seed, future.result()
+
+
+def load_config(config_path: str) -> dict:
+    """Loads a config.json file into the keyword arguments the batch renderer uses.
+
+    Args:
+        config_path: The path to the config file.
+
+    Returns:
+        dict: The render settings.
+    """
+    with open(config_path, "r") as file:
+        settings = json.load(file)
+    return {
+        "zoom_aspect": settings.get("zoom_aspect"),
+        "noise_size": (settings["noise_size"]["x"], settings["noise_size"]["y"]),
+        "background_color": tuple(settings.get("background_color")),
+        "gradient_steps": settings.get("gradient_steps"),
+        "luminosity": settings.get("luminosity"),
+        "colors": settings.get("colors"),
+        "legacy_rng": settings.get("legacy_rng", False),
+        "octaves": settings.get("octaves", 1),
+        "lacunarity": settings.get("lacunarity", 2.0),
+        "persistence": settings.get("persistence", 0.5),
+    }
+
+
+def parse_seeds(text: str) -> List[int]:
+    """Parses a comma separated list of seeds and inclusive seed ranges, such as "1-100,250".
+
+    Args:
+        text: The seeds to parse.
+
+    Returns:
+        List[int]: Every seed in order.
+
+    Raises:
+        ValueError: If a seed or range is not a number.
+    """
+    seeds = []
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        start, separator, stop = item.partition("-")
+        if separator and start:
+            seeds.extend(range(int(start), int(stop) + 1))
+        else:
+            seeds.append(int(item))
+    return seeds
+
+
+def build_gradient_map(
+    seed: int, settings: dict, palette: np.ndarray, noise_cache: NoiseCache = None, disk_cache: DiskCache = None
+) -> TopographyMap:
+    """Builds a gradient map the same way topolayers.py does.
+
+    Args:
+        seed: The seed to build the map for.
+        settings: The render settings returned by load_config.
+        palette: The (layers, 4) gradient palette, see Patterns.gradient_palette.
+        noise_cache: The cache to store the noise field in.
+        disk_cache: The cache to keep the noise field, index map and image in between runs.
+
+    Returns:
+        TopographyMap: The map with every layer added.
+    """
+    generator = TopographyMap(
+        seed,
+        settings["noise_size"],
+        settings["background_color"],
+        settings["zoom_aspect"],
+        noise_cache=noise_cache,
+        legacy_rng=settings["legacy_rng"],
+        octaves=settings["octaves"],
+        lacunarity=settings["lacunarity"],
+        persistence=settings["persistence"],
+        disk_cache=disk_cache,
+    )
+    noise = generator.get_noise(zoom_aspect=settings["zoom_aspect"])
+    pattern = Patterns(noise, settings["gradient_steps"], generator.instrumentation)
+    generator.add_layers(palette, pattern.plan_thresholds(len(palette)))
+    return generator
+
+
+def save_atomically(generator: TopographyMap, output_path: str, profile: str = "smallest") -> None:
+    """Saves a map to a temporary file next to the output path and then moves it in place.
+
+    Readers never see a partially written file, even if the process is killed midway.
+
+    Args:
+        generator: The map to render and save.
+        output_path: The final path of the image.
+        profile: The encode profile, one of "fast", "balanced" or "smallest".
+    """
+    image_format = infer_format(output_path)
+    write_atomically(output_path, lambda file: generator.generate_image(file, profile=profile, image_format=image_format))
+
+
+def field_cache(settings: dict) -> NoiseCache:
+    """Builds a noise cache that holds the zoomed noise field of a single map.
+
+    The field is read once to plan the thresholds and once to render, so a
+    cache of one field saves a zoom without keeping fields of older seeds.
+
+    Args:
+        settings: The render settings returned by load_config.
+
+    Returns:
+        NoiseCache: The cache, sized to one float64 field.
+    """
+    width, height = settings["noise_size"]
+    field_bytes = int(round(width * settings["zoom_aspect"])) * int(round(height * settings["zoom_aspect"])) * 8
+    return NoiseCache(max_bytes=field_bytes)
+
+
+def _init_worker(
+    settings: dict, profile: str, image_format: str, cache_dir: Optional[str] = None, cache_bytes: int = DEFAULT_DISK_BYTES
+) -> None:
+    """Prepares a batch worker process once, before it renders any seed.
+
+    Args:
+        settings: The render settings returned by load_config.
+        profile: The encode profile, one of "fast", "balanced" or "smallest".
+        image_format: The file extension to save as, such as "png" or "webp".
+        cache_dir: The directory of the disk cache shared by every worker, or None for no disk cache.
+        cache_bytes: The maximum size of the disk cache.
+    """
+    pattern = Patterns(None, settings["gradient_steps"])
+    _worker_state["settings"] = settings
+    _worker_state["profile"] = profile
+    _worker_state["image_format"] = image_format
+    _worker_state["palette"] = pattern.gradient_palette(settings["colors"], settings["luminosity"])
+    # Every seed is rendered once, so only the field of the current seed is worth keeping.
+    _worker_state["noise_cache"] = field_cache(settings)
+    _worker_state["disk_cache"] = DiskCache(cache_dir, cache_bytes) if cache_dir is not None else None
+
+
+def _render_worker_seed(seed: int, output_path: str) -> Tuple[int, Optional[str]]:
+    """Renders and saves a single seed inside a batch worker process.
+
+    Args:
+        seed: The seed to render.
+        output_path: The directory to save the image to as "{seed}.{image_format}".
+
+    Returns:
+        Tuple[int, Optional[str]]: The seed and the formatted exception if rendering failed.
+    """
+    try:
+        generator = build_gradient_map(
+            seed,
+            _worker_state["settings"],
+            _worker_state["palette"],
+            _worker_state["noise_cache"],
+            _worker_state["disk_cache"],
+        )
+        file_name = f"{seed}.{_worker_state['image_format']}"
+        save_atomically(generator, os.path.join(output_path, file_name), _worker_state["profile"])
+        return seed, None
+    except Exception:
+        return seed, traceback.format_exc()
+
+
+@dataclasses.dataclass
+class BatchReport:
+    rendered: int = 0
+    failures: Dict[int, str] = dataclasses.field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """float: The amount of images rendered per second."""
+        return self.rendered / self.elapsed if self.elapsed else 0.0
+
+
+def render_seed_range(
+    settings: dict,
+    seeds: Iterable[int],
+    output_path: str,
+    workers: int = None,
+    profile: str = "smallest",
+    image_format: str = "png",
+    cache_dir: Optional[str] = None,
+    cache_bytes: int = DEFAULT_DISK_BYTES,
+) -> BatchReport:
+    """Renders gradient maps for many seeds on a process pool.
+
+    Every worker imports NumPy, SciPy and PIL and builds the gradient palette once,
+    then renders seeds until none are left. Failed seeds do not stop the batch,
+    they are collected in the returned report.
+
+    Args:
+        settings: The render settings returned by load_config.
+        seeds: The seeds to render.
+        output_path: The directory to save every image to as "{seed}.{image_format}".
+        workers: The amount of worker processes. Defaults to the amount of CPUs.
+        profile: The encode profile, one of "fast", "balanced" or "smallest".
+        image_format: The file extension to save as, such as "png" or "webp".
+        cache_dir: The directory of a disk cache that keeps noise fields, index maps and
+            images between runs, so seeds rendered before are copied instead of rendered.
+        cache_bytes: The maximum size of the disk cache.
+
+    Returns:
+        BatchReport: The amount of rendered images, the failures and the elapsed time.
+    """
+    seeds = list(seeds)
+    os.makedirs(output_path, exist_ok=True)
+    report = BatchReport()
+    start = time.perf_counter()
+    logger.info(f"Rendering {len(seeds)} seeds on {workers or os.cpu_count()} worker processes.")
+    initargs = (settings, profile, image_format, cache_dir, cache_bytes)
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as executor:
+        futures = [executor.submit(_render_worker_seed, seed, output_path) for seed in seeds]
+        for future in concurrent.futures.as_completed(futures):
+            seed, error = future.result()
+            if error is None:
+                report.rendered += 1
+            else:
+                logger.error(f"Failed to render seed {seed}:\n{error}")
+                report.failures[seed] = error
+    report.elapsed = time.perf_counter() - start
+    return report
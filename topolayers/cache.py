@@ -0,0 +1,449 @@
+"""
+MIT License
+
+Copyright (c) 2022 capslock321
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import glob
+import hashlib
+import logging
+import threading
+import collections
+
+import numpy as np
+from typing import Callable, Hashable, NamedTuple, Optional
+
+from .encoding import write_atomically
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_DISK_BYTES = 4 * 1024 * 1024 * 1024
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    current_bytes: int
+    max_bytes: int
+
+
+class NoiseCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        """A thread safe LRU cache of zoomed noise fields bounded by a byte budget.
+
+        Cached arrays are marked read only, so callers that want to modify a
+        field must copy it first. Any array bigger than the whole budget is
+        never stored, which means a budget of 0 disables caching entirely.
+
+        Args:
+            max_bytes: The maximum amount of bytes all cached arrays may take up.
+        """
+        self.max_bytes: int = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.current_bytes: int = 0
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """Gets a cached array and marks it as the most recently used.
+
+        Args:
+            key: The key of the array.
+
+        Returns:
+            Optional[np.ndarray]: The cached array, or None if it is not cached.
+        """
+        with self._lock:
+            array = self._entries.get(key)
+            if array is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return array
+
+    def put(self, key: Hashable, array: np.ndarray) -> np.ndarray:
+        """Stores an array, evicting the least recently used arrays if needed.
+
+        Args:
+            key: The key of the array.
+            array: The array to store.
+
+        Returns:
+            np.ndarray: The stored read only array, or the unchanged array if it does not fit.
+        """
+        if array.nbytes > self.max_bytes:
+            logger.debug(f"Not caching {key}, {array.nbytes} bytes exceeds the budget of {self.max_bytes}.")
+            return array
+        array.setflags(write=False)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous.nbytes
+            self._entries[key] = array
+            self.current_bytes += array.nbytes
+            while self.current_bytes > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+                logger.debug(f"Evicted noise field {evicted_key} from the cache.")
+        return array
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        """Gets a cached array, computing and storing it if it is not cached.
+
+        Args:
+            key: The key of the array.
+            compute: A function without arguments that returns the array.
+
+        Returns:
+            np.ndarray: The read only array.
+        """
+        array = self.get(key)
+        if array is None:
+            array = self.put(key, compute())
+        return array
+
+    def clear(self) -> None:
+        """Removes every cached array and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> CacheInfo:
+        """Returns the hit, miss and eviction counters along with the current usage.
+
+        Returns:
+            CacheInfo: The cache statistics.
+        """
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.evictions, len(self._entries), self.current_bytes, self.max_bytes
+            )
+
+
+noise_cache = NoiseCache()
+
+
+def key_digest(key: tuple) -> str:
+    """Hashes a render configuration into the name it is stored under on disk.
+
+    Arrays, such as thresholds and palettes, are hashed by their dtype, shape and
+    contents, and everything else by its repr.
+
+    Args:
+        key: The render configuration.
+
+    Returns:
+        str: A 32 character hexadecimal digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in key:
+        if isinstance(part, np.ndarray):
+            digest.update(f"ndarray{part.dtype.str}{part.shape}".encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def content_digest(data) -> str:
+    """Hashes the contents of an entry, to check its integrity when it is read back.
+
+    Args:
+        data: The bytes or array to hash.
+
+    Returns:
+        str: A 16 character hexadecimal digest.
+    """
+    if isinstance(data, np.ndarray):
+        data = memoryview(np.ascontiguousarray(data)).cast("B")
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+class DiskCache:
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_DISK_BYTES, verify_arrays: bool = False):
+        """A content addressed LRU cache of noise fields, index maps and encoded images on disk.
+
+        Entries are named after a hash of their render configuration, so a rerun
+        with an overlapping config set finds them again. Arrays are stored as .npy
+        files and opened memory mapped, so a cached noise field costs no more memory
+        than the pages that are read. Encoded images are stored as plain blobs.
+
+        Every entry is written to a temporary file and then renamed in place, so
+        several worker processes may share the directory and never see a partial
+        entry. The file name also holds a digest of the contents. Blobs are always
+        checked against it, arrays only if verify_arrays is set, since that reads
+        the whole array. Entries that fail the check are deleted and count as misses.
+
+        Reading an entry touches its modification time, and whenever the directory
+        grows past max_bytes the least recently used entries are deleted. The size
+        of the directory is scanned once and then kept as a running total of the
+        entries this process writes, so it is only scanned again when the total
+        goes over budget. Entries written by other processes are counted at that scan.
+
+        Args:
+            directory: The directory to store entries in, created if needed.
+            max_bytes: The maximum amount of bytes all entries may take up.
+            verify_arrays: Whether to check the digest of arrays whenever they are read.
+        """
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.verify_arrays: bool = verify_arrays
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._current_bytes: Optional[int] = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _count(self, hit: bool) -> None:
+        """Counts a lookup as a hit or a miss.
+
+        Args:
+            hit: Whether the entry was found.
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _find(self, key: tuple, extension: str) -> tuple:
+        """Finds the file of an entry.
+
+        Args:
+            key: The render configuration of the entry.
+            extension: Either ".npy" or ".bin".
+
+        Returns:
+            str: The path of the entry, or None if it is not stored.
+            str: The digest of its contents, or None.
+        """
+        digest = key_digest(key)
+        paths = glob.glob(os.path.join(self.directory, digest[:2], f"{digest}-*{extension}"))
+        if not paths:
+            return None, None
+        return paths[0], os.path.basename(paths[0])[len(digest) + 1: -len(extension)]
+
+    def _discard(self, path: str, reason: str) -> None:
+        """Deletes a broken entry.
+
+        Args:
+            path: The path of the entry.
+            reason: Why the entry is broken.
+        """
+        logger.warning(f"Discarding cache entry {path}: {reason}.")
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _write(self, key: tuple, extension: str, digest: str, write: Callable) -> None:
+        """Writes an entry atomically and trims the directory if it went over its budget.
+
+        Args:
+            key: The render configuration of the entry.
+            extension: Either ".npy" or ".bin".
+            digest: The digest of the contents.
+            write: A function that writes the contents to the binary file object it is given.
+        """
+        name = key_digest(key)
+        shard = os.path.join(self.directory, name[:2])
+        os.makedirs(shard, exist_ok=True)
+        path = os.path.join(shard, f"{name}-{digest}{extension}")
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        size = write_atomically(path, write) - replaced
+        with self._lock:
+            if self._current_bytes is not None:
+                self._current_bytes += size
+            over_budget = self._current_bytes is None or self._current_bytes > self.max_bytes
+        if over_budget:
+            self.trim()
+
+    def get_array(self, key: tuple) -> Optional[np.ndarray]:
+        """Opens a cached array memory mapped and read only.
+
+        Args:
+            key: The render configuration of the array.
+
+        Returns:
+            Optional[np.ndarray]: The memory mapped array, or None if it is not cached.
+        """
+        path, digest = self._find(key, ".npy")
+        array = None
+        if path is not None:
+            try:
+                array = np.load(path, mmap_mode="r")
+                os.utime(path)
+            except (OSError, ValueError) as error:
+                self._discard(path, str(error))
+                array = None
+            if array is not None and self.verify_arrays and content_digest(array) != digest:
+                self._discard(path, "digest mismatch")
+                array = None
+        self._count(array is not None)
+        return array
+
+    def put_array(self, key: tuple, array: np.ndarray) -> np.ndarray:
+        """Stores an array as a .npy file.
+
+        Args:
+            key: The render configuration of the array.
+            array: The array to store.
+
+        Returns:
+            np.ndarray: The given array.
+        """
+        if array.nbytes <= self.max_bytes:
+            self._write(key, ".npy", content_digest(array), lambda file: np.save(file, array))
+        return array
+
+    def get_or_compute_array(self, key: tuple, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        """Gets a cached array, computing and storing it if it is not cached.
+
+        Args:
+            key: The render configuration of the array.
+            compute: A function without arguments that returns the array.
+
+        Returns:
+            np.ndarray: The array, memory mapped if it was cached.
+        """
+        array = self.get_array(key)
+        if array is None:
+            array = self.put_array(key, compute())
+        return array
+
+    def get_bytes(self, key: tuple) -> Optional[bytes]:
+        """Reads a cached blob, such as an encoded image.
+
+        Args:
+            key: The render configuration of the blob.
+
+        Returns:
+            Optional[bytes]: The blob, or None if it is not cached.
+        """
+        path, digest = self._find(key, ".bin")
+        data = None
+        if path is not None:
+            try:
+                with open(path, "rb") as file:
+                    data = file.read()
+                os.utime(path)
+            except OSError as error:
+                self._discard(path, str(error))
+            if data is not None and content_digest(data) != digest:
+                self._discard(path, "digest mismatch")
+                data = None
+        self._count(data is not None)
+        return data
+
+    def put_bytes(self, key: tuple, data: bytes) -> bytes:
+        """Stores a blob.
+
+        Args:
+            key: The render configuration of the blob.
+            data: The blob to store.
+
+        Returns:
+            bytes: The given blob.
+        """
+        if len(data) <= self.max_bytes:
+            self._write(key, ".bin", content_digest(data), lambda file: file.write(data))
+        return data
+
+    def _entries(self) -> list:
+        """Lists every stored entry, skipping temporary files.
+
+        Returns:
+            list: The (modification time, size, path) of every entry.
+        """
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another worker.
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def trim(self) -> None:
+        """Deletes the least recently used entries until the directory fits its budget, and recounts its size."""
+        entries = self._entries()
+        current_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if current_bytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            current_bytes -= size
+            with self._lock:
+                self.evictions += 1
+            logger.debug(f"Evicted {path} from the disk cache.")
+        with self._lock:
+            self._current_bytes = current_bytes
+
+    def clear(self) -> None:
+        """Deletes every entry and resets the counters."""
+        for _, _, path in self._entries():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+            self._current_bytes = 0
+
+    def info(self) -> CacheInfo:
+        """Returns the hit, miss and eviction counters of this process along with the current usage.
+
+        Returns:
+            CacheInfo: The cache statistics.
+        """
+        entries = self._entries()
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.evictions, len(entries), sum(size for _, size, _ in entries), self.max_bytes
+            )
@@ -0,0 +1,470 @@
+"""
+MIT License
+
+Copyright (c) 2022 capslock321
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import logging
+import dataclasses
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from typing import List, Optional, TextIO, Union
+
+from .layers import TopographyMap
+
+logger = logging.getLogger(__name__)
+
+# Corners are numbered clockwise from the top left: a (0), b (1), c (2), d (3), and edge k runs from corner k
+# to corner k + 1. Index 16 and 17 are the saddle cases 5 and 10 when the centre of the cell is inside.
+CASE_COUNT = 18
+
+
+def _segment_table() -> tuple:
+    """Builds the marching squares table of oriented segments for every cell case.
+
+    Segments run from the edge where the walk around the cell enters an inside
+    run of corners to the edge where it leaves it, so every crossing is the end of
+    exactly one segment and the start of exactly one other, and the segments of a
+    whole field chain into closed rings.
+
+    Returns:
+        np.ndarray: A (CASE_COUNT, 2) array of the start edge of every segment, -1 if unused.
+        np.ndarray: A (CASE_COUNT, 2) array of the end edge of every segment, -1 if unused.
+    """
+    starts = np.full((CASE_COUNT, 2), -1, dtype=np.intp)
+    ends = np.full((CASE_COUNT, 2), -1, dtype=np.intp)
+    for config in range(CASE_COUNT):
+        case = {16: 5, 17: 10}.get(config, config)
+        inside = [bool(case >> corner & 1) for corner in range(4)]
+        # A connected saddle pairs the edges around its outside corners instead of its inside ones.
+        run_of = [not value for value in inside] if config >= 16 else inside
+        segment = 0
+        for first in range(4):
+            if run_of[first] and not run_of[first - 1]:
+                last = first
+                while run_of[(last + 1) % 4]:
+                    last = (last + 1) % 4
+                enter, leave = (first - 1) % 4, last
+                starts[config, segment], ends[config, segment] = (leave, enter) if config >= 16 else (enter, leave)
+                segment += 1
+    return starts, ends
+
+
+SEGMENT_STARTS, SEGMENT_ENDS = _segment_table()
+
+
+@dataclasses.dataclass
+class Contours:
+    """Closed contour rings of a field at several levels.
+
+    Every ring is stored once with its first point repeated at the end. Points
+    are in pixel coordinates, where the centre of pixel (row, column) lies at
+    (column + 0.5, row + 0.5). Rings are clipped to the field, and points on
+    the edge of the field are flagged in border.
+    """
+
+    levels: np.ndarray
+    points: np.ndarray
+    offsets: np.ndarray
+    ring_levels: np.ndarray
+    border: np.ndarray
+    shape: tuple
+
+    def __len__(self) -> int:
+        return len(self.ring_levels)
+
+    def rings(self, level: int) -> List[np.ndarray]:
+        """Gets the rings of a single level.
+
+        Args:
+            level: The index of the level in levels.
+
+        Returns:
+            List[np.ndarray]: The (points, 2) array of every ring.
+        """
+        rings = np.flatnonzero(self.ring_levels == level)
+        return [self.points[start:stop] for start, stop in zip(self.offsets[rings], self.offsets[rings + 1])]
+
+    def lines(self, level: int) -> List[np.ndarray]:
+        """Gets the contour lines of a single level, without the parts that run along the edge of the field.
+
+        Args:
+            level: The index of the level in levels.
+
+        Returns:
+            List[np.ndarray]: The (points, 2) array of every polyline.
+        """
+        lines = []
+        for ring in np.flatnonzero(self.ring_levels == level):
+            start, stop = self.offsets[ring], self.offsets[ring + 1]
+            points, border = self.points[start:stop], self.border[start:stop]
+            cut = border[:-1] & border[1:]
+            if not cut.any():
+                lines.append(points)
+                continue
+            # Start right after a cut, so no line wraps around the repeated first point.
+            shift = int(np.argmax(cut)) + 1
+            points = np.concatenate([points[shift:-1], points[: shift + 1]])
+            cut = np.roll(cut, -shift)
+            for piece in np.split(np.arange(len(points)), np.flatnonzero(cut) + 1):
+                if len(piece) > 1:
+                    lines.append(points[piece])
+        return lines
+
+    def simplify(self, tolerance: float) -> "Contours":
+        """Simplifies every ring at once with the Ramer-Douglas-Peucker algorithm.
+
+        Every round splits all unfinished spans of all rings at their farthest
+        point, so the amount of Python level work grows with the depth of the
+        recursion rather than with the amount of points. Points where a ring
+        reaches or leaves the edge of the field are always kept, and rings that
+        collapse to fewer than three points are dropped.
+
+        Args:
+            tolerance: The largest distance in pixels a dropped point may lie from the simplified line.
+
+        Returns:
+            Contours: The simplified contours.
+        """
+        starts, stops = self.offsets[:-1], self.offsets[1:] - 1
+        keep = np.zeros(len(self.points), dtype=bool)
+        keep[starts] = keep[stops] = True
+        keep[:-1] |= self.border[:-1] != self.border[1:]
+        keep[1:] |= self.border[:-1] != self.border[1:]
+        keep[(starts + stops) // 2] = True
+        # Every pair of neighbouring kept points is a span. The last point of a ring and the first point of
+        # the next one are neighbours too, but have nothing in between, so that span is finished at once.
+        kept = np.flatnonzero(keep)
+        spans = (kept[:-1], kept[1:])
+        while len(spans[0]):
+            first, last = spans
+            lengths = last - first - 1
+            wide = lengths > 0
+            first, last, lengths = first[wide], last[wide], lengths[wide]
+            if not len(first):
+                break
+            span = np.repeat(np.arange(len(first)), lengths)
+            span_offsets = np.cumsum(lengths) - lengths
+            inner = first[span] + 1 + np.arange(len(span)) - span_offsets[span]
+            origin, direction = self.points[first][span], self.points[last][span] - self.points[first][span]
+            relative = self.points[inner] - origin
+            # Distances are measured to the segment rather than its line, so points beyond either end count too.
+            squared_length = (direction**2).sum(axis=1)
+            t = np.clip((relative * direction).sum(axis=1) / np.where(squared_length > 0, squared_length, 1), 0, 1)
+            offset = relative - t[:, np.newaxis] * direction
+            distance = np.hypot(offset[:, 0], offset[:, 1])
+            farthest = np.maximum.reduceat(distance, span_offsets)
+            _, first_max = np.unique(span[distance == farthest[span]], return_index=True)
+            split = farthest > tolerance
+            pivots = inner[np.flatnonzero(distance == farthest[span])[first_max]][split]
+            keep[pivots] = True
+            spans = (np.concatenate([first[split], pivots]), np.concatenate([pivots, last[split]]))
+        ring_of_point = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+        kept_per_ring = np.bincount(ring_of_point[keep], minlength=len(self))
+        valid = kept_per_ring >= 4
+        keep &= valid[ring_of_point]
+        offsets = np.concatenate([[0], np.cumsum(kept_per_ring[valid])])
+        return Contours(self.levels, self.points[keep], offsets, self.ring_levels[valid], self.border[keep], self.shape)
+
+
+def _edge_points(edges: np.ndarray, field: np.ndarray, levels: np.ndarray) -> tuple:
+    """Finds where the contour crosses every edge of the padded grid.
+
+    Args:
+        edges: The global edge ids, see marching_squares.
+        field: The unpadded (height, width) field.
+        levels: The sorted contour levels.
+
+    Returns:
+        np.ndarray: The (edges, 2) x, y position of every crossing.
+        np.ndarray: Whether every crossing lies on the edge of the field.
+    """
+    height, width = field.shape
+    padded_height, padded_width = height + 2, width + 2
+    edge_count = 2 * padded_height * padded_width
+    level, edge = np.divmod(edges, edge_count)
+    vertical, edge = np.divmod(edge, padded_height * padded_width)
+    vertical = vertical.astype(bool)
+    row, column = np.divmod(edge, padded_width)
+    # The first pixel of a horizontal edge is at (row, column), its second one step right or, if vertical, down.
+    first_row, first_column = row - 1, column - 1
+    second_row, second_column = first_row + vertical, first_column + ~vertical
+    first = field[np.clip(first_row, 0, height - 1), np.clip(first_column, 0, width - 1)]
+    second = field[np.clip(second_row, 0, height - 1), np.clip(second_column, 0, width - 1)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (levels[level] - first) / (second - first)
+    x = np.where(vertical, first_column + 0.5, first_column + 0.5 + t)
+    y = np.where(vertical, first_row + 0.5 + t, first_row + 0.5)
+    # Crossings next to the padding snap onto the edge of the field.
+    x = np.where(~vertical & (first_column < 0), 0.0, np.where(~vertical & (second_column >= width), width, x))
+    y = np.where(vertical & (first_row < 0), 0.0, np.where(vertical & (second_row >= height), height, y))
+    border = (first_row < 0) | (first_column < 0) | (second_row >= height) | (second_column >= width)
+    return np.stack([x, y], axis=1), border
+
+
+def marching_squares(field: np.ndarray, levels: np.ndarray, index_map: np.ndarray = None) -> Contours:
+    """Traces the closed rings around every region of a field at or below each level.
+
+    The field is padded with a ring of pixels above every level, so every
+    contour closes and regions touching the edge are outlined along it. Only
+    cells whose corners fall in different layer buckets are visited, and every
+    level of every cell is handled in one vectorised pass. The segments are then
+    chained into rings as the cycles of a permutation, without a Python loop
+    over the cells or segments.
+
+    A pixel is inside at a level when it is at or below it, which is exactly the
+    rule TopographyMap uses to paint a layer, so the rings trace the raster edges.
+
+    Args:
+        field: The (height, width) field to contour.
+        levels: The contour levels, sorted in ascending order without duplicates.
+        index_map: The bucket of every pixel, see TopographyMap.bucket_noise. Computed if not given.
+
+    Returns:
+        Contours: The rings of every level.
+    """
+    levels = np.asarray(levels, dtype=np.float64)
+    if index_map is None:
+        index_map = TopographyMap.bucket_noise(field, levels)
+    height, width = field.shape
+    padded = np.pad(index_map, 1, constant_values=len(levels))
+    padded_height, padded_width = padded.shape
+    corners = (padded[:-1, :-1], padded[:-1, 1:], padded[1:, 1:], padded[1:, :-1])
+    lowest = np.minimum(np.minimum(corners[0], corners[1]), np.minimum(corners[2], corners[3]))
+    highest = np.maximum(np.maximum(corners[0], corners[1]), np.maximum(corners[2], corners[3]))
+    rows, columns = np.nonzero(lowest != highest)
+    lowest, highest = lowest[rows, columns].astype(np.intp), highest[rows, columns].astype(np.intp)
+    # A cell crosses every level from its lowest bucket up to below its highest one.
+    crossings = highest - lowest
+    cell = np.repeat(np.arange(len(rows)), crossings)
+    level = lowest[cell] + np.arange(len(cell)) - np.repeat(np.cumsum(crossings) - crossings, crossings)
+    rows, columns = rows[cell], columns[cell]
+    case = np.zeros(len(cell), dtype=np.intp)
+    for corner, (row_offset, column_offset) in enumerate(((0, 0), (0, 1), (1, 1), (1, 0))):
+        case |= (padded[rows + row_offset, columns + column_offset] <= level).astype(np.intp) << corner
+    saddles = np.flatnonzero((case == 5) | (case == 10))
+    if len(saddles):
+        saddle_rows, saddle_columns = rows[saddles] - 1, columns[saddles] - 1
+        corners = ((0, 0), (0, 1), (1, 1), (1, 0))
+        centre = sum(field[saddle_rows + down, saddle_columns + right] for down, right in corners) / 4
+        connected = centre <= levels[level[saddles]]
+        case[saddles[connected]] = np.where(case[saddles[connected]] == 5, 16, 17)
+
+    horizontal_count = padded_height * padded_width
+    level_offsets = (level * 2 * horizontal_count)[:, np.newaxis]
+    cell_edges = level_offsets + np.stack(
+        [
+            rows * padded_width + columns,
+            horizontal_count + rows * padded_width + columns + 1,
+            (rows + 1) * padded_width + columns,
+            horizontal_count + rows * padded_width + columns,
+        ],
+        axis=1,
+    )
+    segment_starts, segment_ends = [], []
+    for segment in range(2):
+        used = np.flatnonzero(SEGMENT_STARTS[case, segment] >= 0)
+        segment_starts.append(cell_edges[used, SEGMENT_STARTS[case[used], segment]])
+        segment_ends.append(cell_edges[used, SEGMENT_ENDS[case[used], segment]])
+    segment_starts, segment_ends = np.concatenate(segment_starts), np.concatenate(segment_ends)
+
+    # Every crossing starts exactly one segment, so sorting the starts numbers the crossings.
+    order = np.argsort(segment_starts)
+    edges = segment_starts[order]
+    successor = np.searchsorted(edges, segment_ends[order])
+    count = len(edges)
+    graph = coo_matrix((np.ones(count, dtype=np.int8), (np.arange(count), successor)), shape=(count, count))
+    ring_count, ring = connected_components(graph, directed=True, connection="weak")
+    # Break every ring before its lowest numbered crossing, then rank the crossings by pointer jumping.
+    ring_order = np.argsort(ring, kind="stable")
+    roots = ring_order[np.concatenate([[0], np.flatnonzero(np.diff(ring[ring_order])) + 1])] if count else ring_order
+    predecessor = np.empty(count, dtype=np.intp)
+    predecessor[successor] = np.arange(count)
+    jump = successor.copy()
+    jump[predecessor[roots]] = predecessor[roots]
+    remaining = (jump != np.arange(count)).astype(np.intp)
+    while count and np.any(jump[jump] != jump):
+        remaining += remaining[jump]
+        jump = jump[jump]
+    walk = np.lexsort((-remaining, ring))
+    ring_sizes = np.bincount(ring, minlength=ring_count)
+    points, border = _edge_points(edges[walk], field, levels)
+    # Repeat the first point of every ring at its end.
+    ring_starts = np.cumsum(ring_sizes) - ring_sizes
+    points = np.insert(points, ring_starts + ring_sizes, points[ring_starts], axis=0)
+    border = np.insert(border, ring_starts + ring_sizes, border[ring_starts])
+    offsets = np.concatenate([[0], np.cumsum(ring_sizes + 1)])
+    ring_levels = edges[roots] // (2 * horizontal_count)
+    logger.debug(f"Traced {ring_count} rings through {count} crossings at {len(levels)} levels.")
+    return Contours(levels, points, offsets, ring_levels, border, (height, width))
+
+
+def _color(color: np.ndarray) -> str:
+    """Formats the RGB part of a color as an SVG hex color."""
+    return "#{:02x}{:02x}{:02x}".format(*(int(channel) for channel in color[:3]))
+
+
+def _path(polylines: List[np.ndarray], precision: int, closed: bool) -> str:
+    """Formats polylines as SVG path data.
+
+    Args:
+        polylines: The (points, 2) array of every polyline.
+        precision: The amount of decimals of every coordinate.
+        closed: Whether to close every polyline, dropping its repeated last point.
+
+    Returns:
+        str: The path data.
+    """
+    pair = f"%.{precision}f,%.{precision}f"
+    parts = []
+    for line in polylines:
+        line = line[:-1] if closed else line
+        flat = np.round(line, precision).ravel().tolist()
+        parts.append("M" + " ".join([pair] * len(line)) % tuple(flat) + ("Z" if closed else ""))
+    return "".join(parts)
+
+
+class ContourExporter:
+    def __init__(self, generator: TopographyMap, tolerance: float = 0.5, precision: int = 2):
+        """Exports the layers of a map as vector contours instead of pixels.
+
+        The contours are traced through the zoomed noise field of the map at the
+        threshold of every layer, with the same bucketing as the raster image,
+        and simplified once. Vectors scale to any print size without rendering a
+        bigger image.
+
+        Args:
+            generator: The map to export, with every layer already added.
+            tolerance: The simplification tolerance in pixels, 0 keeps every crossing.
+            precision: The amount of decimals of every written coordinate.
+        """
+        self.generator: TopographyMap = generator
+        self.tolerance: float = tolerance
+        self.precision: int = precision
+        self._contours: Optional[Contours] = None
+
+    @property
+    def contours(self) -> Contours:
+        """Contours: The simplified rings of every unique threshold, traced on first use."""
+        if self._contours is None:
+            generator = self.generator
+            levels = generator.get_levels()
+            index_map, _ = generator.get_index_map()
+            field = generator.get_noise(zoom_aspect=generator.zoom_aspect)[:, :, 0]
+            with generator.instrumentation.stage("threshold", generator.seed) as stage:
+                contours = marching_squares(field, levels, index_map)
+                if self.tolerance > 0:
+                    contours = contours.simplify(self.tolerance)
+                stage.record(contours.points)
+            logger.info(f"Traced {len(contours)} rings with {len(contours.points)} points at {len(levels)} levels.")
+            self._contours = contours
+        return self._contours
+
+    def _write(self, document: str, output: Union[str, TextIO, None]) -> str:
+        """Writes a document to a path or text file object if one is given and returns it."""
+        if isinstance(output, str):
+            with open(output, "w", encoding="utf-8") as file:
+                file.write(document)
+        elif output is not None:
+            output.write(document)
+        return document
+
+    def to_svg(
+        self,
+        output_path: Union[str, TextIO] = None,
+        fill: bool = True,
+        stroke: tuple = None,
+        stroke_width: float = 1.0,
+        scale: float = 1.0,
+    ) -> str:
+        """Exports the map as an SVG image.
+
+        Filled layers are painted in the order they were added with the even-odd
+        rule, on top of the background, just like the raster image.
+
+        Args:
+            output_path: If provided, the path or text file object to write to.
+            fill: Whether to fill the area of every layer with its color.
+            stroke: The RGBA color to draw the contour lines with, or None to draw none.
+            stroke_width: The width of the contour lines in pixels.
+            scale: The size of the document relative to the raster image.
+
+        Returns:
+            str: The SVG document.
+        """
+        contours, layers = self.contours, self.generator.layers
+        height, width = contours.shape
+        body = []
+        background = self.generator.background_color
+        if background[3]:
+            opacity = f"{background[3] / 255:.4g}"
+            body.append(f'<rect width="{width}" height="{height}" fill="{_color(background)}" fill-opacity="{opacity}"/>')
+        level_of = {threshold: level for level, threshold in enumerate(contours.levels)}
+        if fill:
+            for threshold, color in zip(layers.thresholds, layers.colors):
+                data = _path(contours.rings(level_of[threshold]), self.precision, closed=True)
+                if color[3] and data:
+                    body.append(
+                        f'<path d="{data}" fill="{_color(color)}" fill-opacity="{color[3] / 255:.4g}" fill-rule="evenodd"/>'
+                    )
+        if stroke is not None:
+            lines = [_path(contours.lines(level), self.precision, closed=False) for level in range(len(contours.levels))]
+            body.append(
+                f'<path d="{"".join(lines)}" fill="none" stroke="{_color(stroke)}" stroke-opacity="{stroke[3] / 255:.4g}" '
+                f'stroke-width="{stroke_width}" stroke-linejoin="round"/>'
+            )
+        document = (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width * scale:g}" height="{height * scale:g}" '
+            f'viewBox="0 0 {width} {height}">\n' + "\n".join(body) + "\n</svg>\n"
+        )
+        return self._write(document, output_path)
+
+    def to_geojson(self, output_path: Union[str, TextIO] = None) -> str:
+        """Exports the contour lines as a GeoJSON FeatureCollection.
+
+        Every unique threshold becomes a MultiLineString feature with its
+        threshold and the color of its topmost layer as properties. Coordinates
+        are pixel coordinates, with y growing downwards like in the raster image.
+
+        Args:
+            output_path: If provided, the path or text file object to write to.
+
+        Returns:
+            str: The GeoJSON document.
+        """
+        contours, generator = self.contours, self.generator
+        top_layers = generator.top_layers(contours.levels)
+        features = []
+        for level, threshold in enumerate(contours.levels):
+            color = generator.layers.colors[top_layers[level]] if top_layers[level] >= 0 else generator.background_color
+            lines = [np.round(line, self.precision).tolist() for line in contours.lines(level)]
+            features.append(
+                {
+                    "type": "Feature",
+                    "properties": {"threshold": float(threshold), "color": _color(color), "opacity": int(color[3])},
+                    "geometry": {"type": "MultiLineString", "coordinates": lines},
+                }
+            )
+        document = json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":"))
+        return self._write(document, output_path)
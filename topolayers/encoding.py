@@ -0,0 +1,159 @@
+"""
+MIT License
+
+Copyright (c) 2022 capslock321
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import logging
+import tempfile
+
+import numpy as np
+from PIL import Image
+from typing import BinaryIO, Callable, Union
+
+logger = logging.getLogger(__name__)
+
+# PNG compress_level trades speed for size, optimize is the slowest and smallest setting.
+# Lossless WebP uses quality as the compression effort and method as the speed preset.
+ENCODE_PROFILES = {
+    "fast": {"PNG": {"compress_level": 1}, "WEBP": {"lossless": True, "exact": True, "quality": 0, "method": 0}},
+    "balanced": {"PNG": {"compress_level": 6}, "WEBP": {"lossless": True, "exact": True, "quality": 50, "method": 4}},
+    "smallest": {"PNG": {"optimize": True}, "WEBP": {"lossless": True, "exact": True, "quality": 100, "method": 6}},
+}
+
+PALETTE_SIZE = 256
+
+
+# The umask can only be read by replacing it, which would race with files other threads
+# create in the meantime, so it is read once while the module is imported.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def default_file_mode() -> int:
+    """Returns the permissions open() gives new files under the umask read on import.
+
+    Files created with tempfile.mkstemp are only readable by their owner, so this
+    is applied to them before they are moved in place.
+
+    Returns:
+        int: The permission bits, usually 0o644.
+    """
+    return 0o666 & ~_UMASK
+
+
+def write_atomically(path: str, data: Union[bytes, Callable[[BinaryIO], None]]) -> int:
+    """Writes data to a temporary file next to a path and then moves it in place.
+
+    Readers never see a partially written file, even if the process is killed midway.
+
+    Args:
+        path: The final path of the file.
+        data: The contents of the file, or a function that writes them to the binary file object it is given.
+
+    Returns:
+        int: The size of the file in bytes.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    descriptor, temporary_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            if callable(data):
+                data(file)
+            else:
+                file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+            size = file.tell()
+        os.chmod(temporary_path, default_file_mode())
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+    return size
+
+
+def infer_format(output: Union[str, BinaryIO], image_format: str = None) -> str:
+    """Works out which format to encode to.
+
+    Args:
+        output: The path or file object the image is encoded to.
+        image_format: The format to use, inferred from the path extension if None.
+
+    Returns:
+        str: The upper case PIL format name, "PNG" if nothing else matches.
+    """
+    if image_format is not None:
+        return image_format.upper()
+    if isinstance(output, (str, os.PathLike)):
+        return Image.registered_extensions().get(os.path.splitext(output)[1].lower(), "PNG")
+    return "PNG"
+
+
+def palette_image(index_map: np.ndarray, palette: np.ndarray) -> Image.Image:
+    """Builds a "P" mode image from a layer index map and its RGBA palette.
+
+    Args:
+        index_map: The (height, width) per pixel palette index.
+        palette: The (colors, 4) uint8 RGBA palette, at most 256 colors.
+
+    Returns:
+        PIL.Image: The palette image, which converts back to the exact same RGBA pixels.
+    """
+    image = Image.fromarray(index_map.astype(np.uint8, copy=False), mode="P")
+    image.putpalette(np.ascontiguousarray(palette, dtype=np.uint8).tobytes(), rawmode="RGBA")
+    return image
+
+
+def encode_image(
+    image: Image.Image, output: Union[str, BinaryIO], profile: str = "smallest", image_format: str = None
+) -> int:
+    """Encodes an image to a path or a file object with one of the encode profiles.
+
+    Lossless WebP cannot store palette images, so "P" mode images are converted
+    back to RGBA first.
+
+    Args:
+        image: The image to encode.
+        output: The path or binary file object to write to.
+        profile: One of "fast", "balanced" or "smallest".
+        image_format: The format to encode to, inferred from the path if None.
+
+    Returns:
+        int: The amount of bytes written, or 0 if the file object cannot tell.
+
+    Raises:
+        ValueError: If the profile does not exist.
+    """
+    if profile not in ENCODE_PROFILES:
+        raise ValueError(f"Encode profile must be one of {tuple(ENCODE_PROFILES)}, not {profile!r}.")
+    image_format = infer_format(output, image_format)
+    params = ENCODE_PROFILES[profile].get(image_format, {})
+    if image_format == "WEBP" and image.mode == "P":
+        image = image.convert("RGBA")
+    logger.debug(f"Encoding {image.mode} image as {image_format} with the {profile} profile.")
+    if isinstance(output, (str, os.PathLike)):
+        image.save(output, format=image_format, **params)
+        return os.path.getsize(output)
+    start = output.tell() if output.seekable() else 0
+    image.save(output, format=image_format, **params)
+    return output.tell() - start if output.seekable() else 0
@@ -37,3 +37,11 @@ class LayerRequired(Exception):
 
 class InvalidHex(Exception):
     pass
+
+
+class InvalidRenderMode(Exception):
+    pass
+
+
+class ServiceOverloaded(Exception):
+    pass
@@ -0,0 +1,278 @@
+"""
+MIT License
+
+Copyright (c) 2022 capslock321
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import logging
+
+import numpy as np
+import scipy.ndimage
+from typing import Union
+
+from .cache import content_digest
+from .noise import RandomNoise
+from .patterns import histogram_thresholds
+from .upsampling import sample_positions, zoomed_shape
+from .exceptions import InvalidThreshold
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 256  # Grid rows read at a time when streaming over the whole grid.
+
+
+class HeightField:
+    def __init__(
+        self,
+        grid: np.ndarray,
+        nodata: float = None,
+        value_range: tuple = None,
+        order: int = 1,
+        dtype: type = np.float32,
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+        path: str = None,
+    ):
+        """An external elevation grid that a TopographyMap renders in place of RandomNoise.
+
+        Heights are normalised to the range 0 to 1 with the smallest and largest
+        height of the grid, found in a single streaming pass over its rows, so the
+        same thresholds and palettes work as with noise. The zoom aspect of the map
+        resamples the grid, where 1 renders it at its native resolution.
+
+        The grid is only ever read a region or a chunk of rows at a time, so a memory
+        mapped grid, see from_npy and from_raw, never has to fit in memory. Render huge
+        grids with a TiledRenderer and plan their thresholds with plan_thresholds.
+
+        Args:
+            grid: The (rows, columns) heights, usually memory mapped.
+            nodata: The height that marks missing data. Missing pixels show the background color.
+            value_range: The (lowest, highest) height mapped to 0 and 1. Defaults to the
+                range of the grid, set it to keep colors consistent between grids.
+            order: The interpolation order used when resampling, 0 for nearest or 1 for linear.
+            dtype: The floating point type of the normalised heights.
+            chunk_rows: The amount of grid rows read at a time when streaming over the grid.
+            path: The file the grid was read from, used to key cached renders.
+
+        Raises:
+            ValueError: If the grid is not 2D or the order is not supported.
+        """
+        if np.ndim(grid) != 2:
+            raise ValueError(f"A height field must be a 2D grid, not {np.ndim(grid)}D.")
+        if order not in (0, 1):
+            raise ValueError(f"Order must be either 0 or 1, not {order}.")
+        self.grid: np.ndarray = grid
+        self.nodata: float = nodata
+        self.order: int = order
+        self.dtype: np.dtype = np.dtype(dtype)
+        self.chunk_rows: int = chunk_rows
+        self.path: str = path
+        self._value_range: tuple = tuple(value_range) if value_range is not None else None
+        # Grids without a file are keyed by their contents, hashed once rather than on every lookup.
+        self._digest: str = content_digest(np.asarray(grid)) if path is None else None
+
+    @classmethod
+    def from_npy(cls, path: str, **kwargs) -> "HeightField":
+        """Opens a .npy grid memory mapped, without reading it.
+
+        Args:
+            path: The path of the .npy file.
+            **kwargs: Passed to HeightField.
+
+        Returns:
+            HeightField: The height field.
+        """
+        return cls(np.load(path, mmap_mode="r"), path=os.path.abspath(path), **kwargs)
+
+    @classmethod
+    def from_raw(
+        cls, path: str, shape: tuple, grid_dtype: type = np.float32, offset: int = 0, **kwargs
+    ) -> "HeightField":
+        """Opens a headerless grid, such as raw float32 heights, memory mapped.
+
+        Args:
+            path: The path of the raw file.
+            shape: The (rows, columns) of the grid.
+            grid_dtype: The type of every height in the file, including its byte order.
+            offset: The amount of bytes to skip at the start of the file.
+            **kwargs: Passed to HeightField.
+
+        Returns:
+            HeightField: The height field.
+        """
+        grid = np.memmap(path, dtype=grid_dtype, mode="r", shape=tuple(shape), offset=offset)
+        return cls(grid, path=os.path.abspath(path), **kwargs)
+
+    @property
+    def shape(self) -> tuple:
+        """tuple: The (rows, columns) of the grid."""
+        return tuple(self.grid.shape)
+
+    @property
+    def cache_key(self) -> tuple:
+        """tuple: Every setting that changes the output, used to key cached fields and images."""
+        if self.path is not None:
+            stat = os.stat(self.path)
+            source = (self.path, stat.st_size, stat.st_mtime_ns, getattr(self.grid, "offset", 0))
+        else:
+            source = (self._digest,)
+        settings = (self.shape, self.grid.dtype.str, self.nodata, self.value_range(), self.order, self.dtype.str)
+        return source + settings
+
+    def _read(self, rows: slice, columns: slice) -> np.ndarray:
+        """Reads a region of the grid, replacing missing heights with NaN.
+
+        Args:
+            rows: The grid rows to read.
+            columns: The grid columns to read.
+
+        Returns:
+            np.ndarray: A copy of the region in the height field dtype.
+        """
+        raw = self.grid[rows, columns]
+        heights = raw.astype(self.dtype)
+        if self.nodata is not None:
+            heights[raw == self.nodata] = np.nan
+        return heights
+
+    def value_range(self) -> tuple:
+        """Finds the lowest and highest height of the grid, skipping missing data.
+
+        The grid is read in chunks of rows and the result is kept, so this only
+        reads the grid once.
+
+        Returns:
+            tuple: The (lowest, highest) height.
+
+        Raises:
+            ValueError: If every height is missing.
+        """
+        if self._value_range is None:
+            lows, highs = [], []
+            for top in range(0, self.shape[0], self.chunk_rows):
+                heights = self._read(slice(top, top + self.chunk_rows), slice(None))
+                lows.append(np.fmin.reduce(heights, axis=None))
+                highs.append(np.fmax.reduce(heights, axis=None))
+            low, high = np.fmin.reduce(lows), np.fmax.reduce(highs)
+            if np.isnan(low):
+                raise ValueError("Every height of the grid is missing.")
+            self._value_range = (float(low), float(high))
+            logger.debug(f"Height field ranges from {low} to {high}.")
+        return self._value_range
+
+    def normalise(self, heights: np.ndarray) -> np.ndarray:
+        """Maps heights onto the range 0 to 1 in place.
+
+        Args:
+            heights: The heights in the height field dtype.
+
+        Returns:
+            np.ndarray: The given, now normalised, array.
+        """
+        low, high = self.value_range()
+        heights -= low
+        if high > low:
+            heights *= 1 / (high - low)
+        return heights
+
+    def zoomed_shape(self, zoom_aspect: Union[int, float] = 1) -> tuple:
+        """Returns the shape process_noise_array resamples the grid to.
+
+        Args:
+            zoom_aspect: The resampling factor, 1 for the native resolution.
+
+        Returns:
+            tuple: The resampled (height, width).
+        """
+        return zoomed_shape(self.shape, zoom_aspect)
+
+    def process_noise_region(self, zoom_aspect: Union[int, float], rows: slice, columns: slice) -> np.ndarray:
+        """Resamples and normalises a rectangular region, reading only the grid cells it needs.
+
+        Args:
+            zoom_aspect: The resampling factor, 1 for the native resolution.
+            rows: The rows of the resampled grid to evaluate.
+            columns: The columns of the resampled grid to evaluate.
+
+        Returns:
+            np.ndarray: The normalised (height, width) region.
+        """
+        shape = self.zoomed_shape(zoom_aspect)
+        if shape == self.shape:
+            return self.normalise(self._read(rows, columns))
+        positions = [sample_positions(self.shape[0], shape[0], rows), sample_positions(self.shape[1], shape[1], columns)]
+        window = [slice(int(axis[0]), min(int(axis[-1]) + 2, size)) for axis, size in zip(positions, self.shape)]
+        heights = self.normalise(self._read(*window))
+        grid = np.meshgrid(*(axis - region.start for axis, region in zip(positions, window)), indexing="ij")
+        return scipy.ndimage.map_coordinates(heights, grid, output=self.dtype, order=self.order, mode="nearest")
+
+    def process_noise_array(self, threshold: Union[int, float] = None, zoom_aspect: Union[int, float] = 1):
+        """Resamples and normalises the whole grid, one chunk of rows at a time.
+
+        Args:
+            threshold: The threshold to aim for, see RandomNoise.filter_noise_array.
+            zoom_aspect: The resampling factor, 1 for the native resolution.
+
+        Returns:
+            np.ndarray: The (height, width, 1) normalised heights, filtered if threshold is set.
+        """
+        height, width = self.zoomed_shape(zoom_aspect)
+        heights = np.empty((height, width, 1), dtype=self.dtype)
+        for top in range(0, height, self.chunk_rows):
+            rows = slice(top, min(top + self.chunk_rows, height))
+            heights[rows, :, 0] = self.process_noise_region(zoom_aspect, rows, slice(0, width))
+        return RandomNoise.filter_noise_array(heights, threshold)
+
+    def plan_thresholds(self, layer_count: int, bins: int = 65536, keep_remainder: bool = False) -> np.ndarray:
+        """Plans layer thresholds like Patterns.plan_thresholds in approximate mode.
+
+        The histogram is built from the native grid a chunk of rows at a time, and
+        missing heights are left out, so no layer is planned for them.
+
+        Args:
+            layer_count: The amount of layers to plan.
+            bins: The amount of histogram bins.
+            keep_remainder: Whether to also return the threshold of the trailing chunk
+                that is left over when the pixels do not split evenly.
+
+        Returns:
+            np.ndarray: The float64 thresholds in descending order.
+
+        Raises:
+            InvalidThreshold: If there are more layers than heights.
+        """
+        counts = np.zeros(bins, dtype=np.int64)
+        for top in range(0, self.shape[0], self.chunk_rows):
+            heights = self.normalise(self._read(slice(top, top + self.chunk_rows), slice(None)))
+            if self.nodata is not None:
+                heights = heights[~np.isnan(heights)]
+            counts += np.histogram(np.clip(heights, 0.0, 1.0, out=heights), bins=bins, range=(0.0, 1.0))[0]
+        pixel_count = int(counts.sum())
+        chunk_length = pixel_count // layer_count
+        if chunk_length == 0:
+            raise InvalidThreshold(f"Cannot split {pixel_count} heights into {layer_count} layers.")
+        ranks = np.arange(0, pixel_count, chunk_length)
+        ranks = ranks if keep_remainder else ranks[:layer_count]
+        logger.debug(f"Planning {len(ranks)} thresholds over {pixel_count} heights.")
+        return histogram_thresholds(counts, 0.0, 1.0, ranks)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(shape={self.shape}, path={self.path!r})"
@@ -0,0 +1,162 @@
+"""
+MIT License
+
+Copyright (c) 2022 capslock321
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+import logging
+import dataclasses
+
+import numpy as np
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("rng", "zoom", "plan", "threshold", "palette", "composite", "save")
+
+
+@dataclasses.dataclass
+class StageEvent:
+    stage: str
+    duration: float
+    pixels: int
+    bytes_allocated: int
+    seed: Optional[int] = None
+    bytes_written: int = 0
+
+
+class Stage:
+    __slots__ = ("instrumentation", "name", "seed", "pixels", "bytes_allocated", "bytes_written", "_start")
+
+    def __init__(self, instrumentation: "Instrumentation", name: str, seed: Optional[int] = None):
+        """A single timed stage, used as a context manager.
+
+        Args:
+            instrumentation: The instrumentation to report the stage to.
+            name: The name of the stage, one of STAGES.
+            seed: The seed of the map being rendered.
+        """
+        self.instrumentation: Instrumentation = instrumentation
+        self.name: str = name
+        self.seed: Optional[int] = seed
+        self.pixels: int = 0
+        self.bytes_allocated: int = 0
+        self.bytes_written: int = 0
+        self._start: float = 0.0
+
+    def record(self, array: np.ndarray = None, pixels: int = 0, bytes_allocated: int = 0, bytes_written: int = 0):
+        """Records the output of the stage.
+
+        Args:
+            array: An array the stage allocated. Its first two dimensions are counted as pixels.
+            pixels: The amount of pixels processed, if no array is given.
+            bytes_allocated: The amount of bytes allocated, if no array is given.
+            bytes_written: The amount of bytes written to a file, such as the size of an encoded image.
+
+        Returns:
+            The given array, so calls can be chained.
+        """
+        if array is not None:
+            pixels = int(np.prod(array.shape[:2]))
+            bytes_allocated = array.nbytes
+        self.pixels = max(self.pixels, pixels)
+        self.bytes_allocated += bytes_allocated
+        self.bytes_written += bytes_written
+        return array
+
+    def __enter__(self) -> "Stage":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        if exc_type is None:
+            duration = time.perf_counter() - self._start
+            event = StageEvent(self.name, duration, self.pixels, self.bytes_allocated, self.seed, self.bytes_written)
+            self.instrumentation.emit(event)
+        return False
+
+
+class NullStage:
+    __slots__ = ()
+
+    def record(self, array: np.ndarray = None, pixels: int = 0, bytes_allocated: int = 0, bytes_written: int = 0):
+        return array
+
+    def __enter__(self) -> "NullStage":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class Instrumentation:
+    def __init__(self, callback: Callable[[StageEvent], None]):
+        """Reports the duration, pixel count and allocated bytes of every render stage.
+
+        Pass an instance to TopographyMap to receive a StageEvent for each stage
+        it runs: drawing the random noise, zooming it, thresholding, building the
+        palette, compositing and saving the image. Patterns reports planning the
+        layer thresholds as the "plan" stage when it is given one.
+
+        Args:
+            callback: Called with every StageEvent, from the thread that ran the stage.
+        """
+        self.callback: Callable[[StageEvent], None] = callback
+
+    def stage(self, name: str, seed: Optional[int] = None) -> Stage:
+        """Starts timing a stage.
+
+        Args:
+            name: The name of the stage, one of STAGES.
+            seed: The seed of the map being rendered.
+
+        Returns:
+            Stage: A context manager that reports the stage when it exits.
+        """
+        return Stage(self, name, seed)
+
+    def emit(self, event: StageEvent) -> None:
+        """Sends an event to the callback.
+
+        Args:
+            event: The finished stage.
+        """
+        self.callback(event)
+
+
+class NullInstrumentation(Instrumentation):
+    def __init__(self):
+        """Instrumentation that reports nothing, used when none is given.
+
+        Every stage is the same shared no-op context manager, so no time is
+        measured and nothing is allocated.
+        """
+        super().__init__(lambda event: None)
+
+    def stage(self, name: str, seed: Optional[int] = None) -> NullStage:
+        return NULL_STAGE
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
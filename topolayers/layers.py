@@ -22,19 +22,29 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import io
+import os
 import logging
-import dataclasses
+import numbers
 
 import numpy as np
 from PIL import Image
-from typing import Optional, Union
+from typing import BinaryIO, List, Optional, Union
 
+from .cache import DiskCache, NoiseCache, noise_cache as shared_noise_cache
+from .encoding import PALETTE_SIZE, encode_image, infer_format, palette_image, write_atomically
+from .instrumentation import Instrumentation, NULL_INSTRUMENTATION
+from .heightfield import HeightField
 from .noise import RandomNoise
-from .exceptions import InvalidRGB, LayerRequired, InvalidThreshold
+from .upsampling import SplineEngine, UpsamplingEngine
+from .exceptions import InvalidRGB, LayerRequired, InvalidThreshold, InvalidRenderMode
 
 TRANSPARENT = (0, 0, 0, 0)
 OPAQUE = (0, 0, 0, 232)
 
+RENDER_MODES = ("indexed", "layered")
+BUCKET_ROWS = 64  # Rows bucketed at a time when writing into a preallocated index map.
+
 logger = logging.getLogger(__name__)
 
 
@@ -45,22 +55,74 @@ class TopographyMap:
         array_size: tuple = (4, 4),
         background_color: tuple = TRANSPARENT,
         zoom_aspect: int = 512,
+        render_mode: str = "indexed",
+        noise_cache: Optional[NoiseCache] = None,
+        legacy_rng: bool = False,
+        instrumentation: Optional[Instrumentation] = None,
+        engine: Optional[UpsamplingEngine] = None,
+        octaves: int = 1,
+        lacunarity: float = 2.0,
+        persistence: float = 0.5,
+        disk_cache: Optional[DiskCache] = None,
+        height_field: Optional[HeightField] = None,
     ):
         """Generates a topography like style map based on a random seeded noise map.
 
         Note that the seed, array_size and zoom_aspect arguments are passed
-        as arguments into the RandomNoise class.
+        as arguments into the RandomNoise class. If no seed is given, one is
+        picked once so that every layer of the map shares the same noise.
+
+        The "indexed" render mode zooms the noise once and buckets every pixel
+        into a layer index, while the "layered" render mode generates and pastes
+        a full image for every layer. Both produce the same pixels.
 
         Args:
             seed: The seed in which to generate the final image.
             array_size: The initial array size of the noise map.
             background_color: The color of any pixel that does not meet the threshold.
             zoom_aspect: The zoom aspect of the processed noise map.
+            render_mode: Either "indexed" or "layered".
+            noise_cache: The cache to store zoomed noise fields in. Defaults to the
+                cache shared by every TopographyMap.
+            legacy_rng: Whether to draw noise like older versions did, see RandomNoise.
+            instrumentation: Receives the duration and size of every render stage.
+                Nothing is measured if it is not given.
+            engine: The engine that zooms the noise, see topolayers.upsampling. Defaults
+                to the exact cubic spline engine.
+            octaves: The amount of noise arrays stacked for fractal detail, see RandomNoise.
+            lacunarity: How much finer every octave is than the one before it.
+            persistence: How much weaker every octave is than the one before it.
+            disk_cache: Keeps noise fields, index maps and saved images on disk, so they
+                are reused by later runs with the same settings. Nothing is kept if it is not given.
+            height_field: An external elevation grid to render instead of random noise. The
+                seed and array size are then unused, and a zoom aspect of 1 renders the grid
+                at its native resolution.
+
+        Raises:
+            TypeError: If the seed is not an integer or None. NumPy integers are accepted.
+            InvalidRenderMode: If the render mode is not supported.
         """
-        self.seed: Optional[int] = seed  # str to int as seed
-        self.array_size: np.ndarray = array_size
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1)[0])
+        elif not isinstance(seed, numbers.Integral):
+            raise TypeError(f"Seed must be an integer or None, not {type(seed).__name__}.")
+        self.seed: int = int(seed)
+        self.legacy_rng: bool = legacy_rng
+        self.instrumentation: Instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self.engine: UpsamplingEngine = engine if engine is not None else SplineEngine()
+        self.octaves: int = octaves
+        self.lacunarity: float = lacunarity
+        self.persistence: float = persistence
+        self._index_cache: Optional[tuple] = None
+        self.height_field: Optional[HeightField] = height_field
+        self.array_size: np.ndarray = height_field.shape if height_field is not None else array_size
         self.zoom_aspect: int = zoom_aspect
-        self.layers: list = []
+        self.layers: LayerStack = LayerStack(self)
+        if render_mode not in RENDER_MODES:
+            raise InvalidRenderMode(f"Render mode must be one of {RENDER_MODES}, not {render_mode!r}.")
+        self.render_mode: str = render_mode
+        self.noise_cache: NoiseCache = noise_cache if noise_cache is not None else shared_noise_cache
+        self.disk_cache: Optional[DiskCache] = disk_cache
         if self._is_valid_rgba(background_color):
             # Why does this parameter even exist?
             self.background_color: tuple = background_color
@@ -80,17 +142,90 @@ class TopographyMap:
             raise InvalidRGB("A RGB tuple must only contain 4 items!")
         return all([isinstance(k, int) for k in rgb])
 
+    def noise_cache_key(self, zoom_aspect: int) -> tuple:
+        """Returns the key the zoomed noise field of this map is cached under.
+
+        Args:
+            zoom_aspect: The zoom aspect of the processed noise map.
+
+        Returns:
+            tuple: The seed, array size, generator, octave, zoom aspect and interpolation settings,
+                or the zoom aspect and grid settings of the height field.
+        """
+        if self.height_field is not None:
+            return ("height field", zoom_aspect) + self.height_field.cache_key
+        rng = "legacy" if self.legacy_rng else "pcg64"
+        octaves = (self.octaves, self.lacunarity, self.persistence)
+        return (self.seed, tuple(self.array_size), rng, octaves, zoom_aspect) + self.engine.cache_key
+
     def get_noise(self, zoom_aspect: int = 512) -> np.ndarray:
         """Generates noise and returns it zoomed.
 
+        Noise fields are cached in the noise cache, so the returned array is shared
+        and read only if it was cached. Copy it if it needs to be modified.
+
+        Args:
+            zoom_aspect: The zoom aspect of the processed noise map.
+
+        Returns:
+            np.ndarray: The processed noise map.
+        """
+        return self.noise_cache.get_or_compute(self.noise_cache_key(zoom_aspect), lambda: self._load_noise(zoom_aspect))
+
+    def _load_noise(self, zoom_aspect: int) -> np.ndarray:
+        """Reads the zoomed noise field of this map from the disk cache, zooming it if it is not there.
+
+        Args:
+            zoom_aspect: The zoom aspect of the processed noise map.
+
+        Returns:
+            np.ndarray: The processed noise map, memory mapped if it was read from disk.
+        """
+        if self.disk_cache is None:
+            return self._zoom_noise(zoom_aspect)
+        key = ("noise",) + self.noise_cache_key(zoom_aspect)
+        return self.disk_cache.get_or_compute_array(key, lambda: self._zoom_noise(zoom_aspect))
+
+    def _zoom_noise(self, zoom_aspect: int) -> np.ndarray:
+        """Draws and zooms the noise of this map, bypassing the noise cache.
+
         Args:
             zoom_aspect: The zoom aspect of the processed noise map.
 
         Returns:
             np.ndarray: The processed noise map.
         """
-        noise = RandomNoise(self.seed, self.array_size)
-        return noise.process_noise_array(zoom_aspect=zoom_aspect)
+        noise = self.get_random_noise()
+        with self.instrumentation.stage("zoom", self.seed) as stage:
+            return stage.record(noise.process_noise_array(zoom_aspect=zoom_aspect))
+
+    def get_random_noise(self) -> Union[RandomNoise, HeightField]:
+        """Draws the unzoomed noise of this map from its own random generator.
+
+        Maps with a height field return the height field instead, which zooms and
+        filters the same way.
+
+        Returns:
+            Union[RandomNoise, HeightField]: The noise generator of this map.
+        """
+        if self.height_field is not None:
+            return self.height_field
+        with self.instrumentation.stage("rng", self.seed) as stage:
+            noise = RandomNoise(
+                self.seed,
+                self.array_size,
+                legacy_rng=self.legacy_rng,
+                engine=self.engine,
+                octaves=self.octaves,
+                lacunarity=self.lacunarity,
+                persistence=self.persistence,
+            )
+            arrays = noise.octave_arrays
+            stage.record(pixels=sum(array.size for array in arrays), bytes_allocated=sum(array.nbytes for array in arrays))
+        if noise.octaves > 1:
+            with self.instrumentation.stage("zoom", self.seed) as stage:
+                stage.record(noise.lattice)
+        return noise
 
     def _preprocess_image(self, zoom_aspect: int, threshold: Union[int, float]):
         """Processes the noise map and prepare it for pasting.
@@ -105,10 +240,11 @@ class TopographyMap:
         Raises:
             InvalidThreshold: If the threshold given is too high or low.
         """
-        noise = RandomNoise(self.seed, self.array_size)
         if isinstance(threshold, float) and 1 <= threshold < 0:
             raise InvalidThreshold("Threshold must be a number between 0.0 and 1.0.")
-        return noise.process_noise_array(threshold, zoom_aspect)
+        noise = self.get_noise(zoom_aspect)
+        with self.instrumentation.stage("threshold", self.seed) as stage:
+            return stage.record(RandomNoise.filter_noise_array(noise, threshold))
 
     def add_layer(self, color: tuple, threshold: Union[int, float]) -> None:
         """Adds a layer to the final image. You need at least 1 layer to generate
@@ -119,44 +255,497 @@ class TopographyMap:
             threshold: The threshold to aim for.
         """
         logger.info(f"Adding layer with color {color} and threshold {threshold}.")
-        noise_map = self._preprocess_image(self.zoom_aspect, threshold)
-        noise_map[np.all(noise_map == OPAQUE, axis=-1)] = color
-        layer = TopographyLayer(noise_map, threshold)
-        return self.layers.append(layer)
+        return self.layers.add(color, threshold)
+
+    def add_layers(self, colors: np.ndarray, thresholds: np.ndarray) -> None:
+        """Adds a layer for every row of a palette, for example one built by Patterns.
+
+        Args:
+            colors: A (layers, 4) RGBA array or list.
+            thresholds: The threshold of every layer.
+        """
+        logger.info(f"Adding {len(thresholds)} layers.")
+        self.layers.extend(colors, thresholds)
+
+    def get_levels(self) -> np.ndarray:
+        """Returns the unique layer thresholds in ascending order.
+
+        Returns:
+            np.ndarray: The sorted float64 thresholds.
+
+        Raises:
+            LayerRequired: If no layers were added.
+        """
+        if not self.layers:
+            raise LayerRequired("A single layer is required to generate the image!")
+        return np.unique(self.layers.thresholds)
+
+    @staticmethod
+    def bucket_noise(noise: np.ndarray, levels: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """Buckets every pixel of a zoomed noise map into the index of its level.
+
+        Args:
+            noise: The zoomed (height, width) noise map.
+            levels: The unique layer thresholds, sorted in ascending order.
+            out: A preallocated index map to write into. It is filled a band of rows
+                at a time, so only a band sized temporary is allocated.
+
+        Returns:
+            np.ndarray: The smallest unsigned integer index map that fits every level, out if it was given.
+        """
+        if out is None:
+            return np.searchsorted(levels, noise, side="left").astype(np.min_scalar_type(len(levels)))
+        for top in range(0, len(noise), BUCKET_ROWS):
+            band = slice(top, top + BUCKET_ROWS)
+            np.copyto(out[band], np.searchsorted(levels, noise[band], side="left"), casting="unsafe")
+        return out
+
+    def top_layers(self, levels: np.ndarray) -> np.ndarray:
+        """Finds the topmost layer of every layer index, the last added layer that covers it.
+
+        Args:
+            levels: The unique layer thresholds, sorted in ascending order.
+
+        Returns:
+            np.ndarray: The (len(levels) + 1) layer positions, -1 where only the background shows.
+        """
+        covered = np.zeros((len(self.layers), len(levels) + 1), dtype=bool)
+        covered[:, :-1] = levels[np.newaxis, :] <= self.layers.thresholds[:, np.newaxis]
+        topmost = len(self.layers) - 1 - np.argmax(covered[::-1], axis=0)
+        return np.where(covered.any(axis=0), topmost, -1)
+
+    def build_palette(self, levels: np.ndarray) -> np.ndarray:
+        """Builds the color of every layer index by compositing the layers onto a strip.
+
+        Every pixel of the strip stands for one bucket between two neighbouring
+        thresholds, so pasting the layers onto it gives the exact same blending as
+        pasting them onto the full image.
+
+        Args:
+            levels: The unique layer thresholds, sorted in ascending order.
+
+        Returns:
+            np.ndarray: A (len(levels) + 1, 4) uint8 array. The last row is the background.
+        """
+        strip = Image.new("RGBA", (len(levels) + 1, 1), self.background_color)
+        for threshold, color in zip(self.layers.thresholds, self.layers.colors):
+            covered = np.append(levels <= threshold, False)[:, np.newaxis]
+            row = np.where(covered, color, np.uint8(TRANSPARENT)).astype(np.uint8)
+            image = Image.fromarray(row[np.newaxis])
+            strip.paste(image, (0, 0), image)
+        return np.array(strip)[0]
+
+    def build_index_map(self, noise: np.ndarray) -> tuple:
+        """Buckets every pixel of the noise map into a layer index.
+
+        A pixel with index i lies between the i-th and (i + 1)-th smallest
+        threshold, so looking its index up in the returned palette gives its color.
+
+        Args:
+            noise: The zoomed noise map, either (height, width) or (height, width, 1).
+
+        Returns:
+            np.ndarray: The per pixel layer index.
+            np.ndarray: The (levels + 1, 4) uint8 RGBA palette.
+
+        Raises:
+            LayerRequired: If no layers were added.
+        """
+        if noise.ndim == 3:
+            noise = noise[:, :, 0]
+        levels = self.get_levels()
+        with self.instrumentation.stage("threshold", self.seed) as stage:
+            index_map = stage.record(self.bucket_noise(noise, levels))
+        with self.instrumentation.stage("palette", self.seed) as stage:
+            palette = self.build_palette(levels)
+            stage.record(pixels=len(palette), bytes_allocated=palette.nbytes)
+        return index_map, palette
+
+    def get_index_map(self) -> tuple:
+        """Gets the layer index map of this map along with a palette of the current layer colors.
+
+        The index map is kept after it is built and reused for as long as the layer
+        thresholds and noise settings stay the same. Changing only the layer colors
+        or the background color therefore never buckets the noise again. With a disk
+        cache, index maps built by earlier runs are reused as well.
+
+        Returns:
+            np.ndarray: The per pixel layer index.
+            np.ndarray: The (levels + 1, 4) uint8 RGBA palette.
+
+        Raises:
+            LayerRequired: If no layers were added.
+        """
+        key = (self.layers.version, self.noise_cache_key(self.zoom_aspect))
+        if self._index_cache is None or self._index_cache[0] != key:
+            levels = self.get_levels()
+            disk_key = ("index", self.noise_cache_key(self.zoom_aspect), levels)
+            index_map = self.disk_cache.get_array(disk_key) if self.disk_cache is not None else None
+            if index_map is None:
+                index_map, palette = self.build_index_map(self.get_noise(zoom_aspect=self.zoom_aspect))
+                self._index_cache = (key, index_map, levels)
+                if self.disk_cache is not None:
+                    self.disk_cache.put_array(disk_key, index_map)
+                return index_map, palette
+            self._index_cache = (key, index_map, levels)
+        _, index_map, levels = self._index_cache
+        with self.instrumentation.stage("palette", self.seed) as stage:
+            palette = self.build_palette(levels)
+            stage.record(pixels=len(palette), bytes_allocated=palette.nbytes)
+        return index_map, palette
+
+    def clear_index_map(self) -> None:
+        """Frees the kept layer index map."""
+        self._index_cache = None
+
+    def _composite_indexed(self, index_map: np.ndarray, palette: np.ndarray) -> Image:
+        """Looks every pixel of an index map up in its palette.
+
+        Args:
+            index_map: The per pixel layer index.
+            palette: The RGBA palette of every index.
+
+        Returns:
+            PIL.Image: The generated image.
+        """
+        height, width = index_map.shape
+        logger.info(f"Generating indexed image with dimensions ({height}, {width}) and {len(palette)} colors.")
+        with self.instrumentation.stage("composite", self.seed) as stage:
+            return Image.fromarray(stage.record(palette[index_map]))
 
-    def generate_image(self, output_path: str = None) -> Image:
+    def _render_layered(self) -> Image:
+        """Renders the image by pasting every layer onto the master image.
+
+        Returns:
+            PIL.Image: The generated image.
+        """
+        height, width, _ = self.get_noise(self.zoom_aspect).shape
+        logger.info(f"Generating image with dimensions ({height}, {width})")
+        master = Image.new("RGBA", (width, height), self.background_color)
+        for layer in self.layers:
+            noise_map = layer.noise_map
+            with self.instrumentation.stage("composite", self.seed) as stage:
+                image = Image.fromarray(stage.record(np.uint8(noise_map)), mode="RGBA")
+                master.paste(image, (0, 0), image)
+        return master
+
+    def _save_image(
+        self,
+        master: Image,
+        output: Union[str, BinaryIO],
+        profile: str,
+        image_format: Optional[str],
+        indexed: Optional[tuple],
+    ) -> None:
+        """Encodes the generated image, as a palette image if the palette fits.
+
+        Args:
+            master: The generated RGBA image.
+            output: The path or binary file object to write to.
+            profile: One of "fast", "balanced" or "smallest".
+            image_format: The format to encode to, inferred from the path if None.
+            indexed: The index map and palette of the image, or None to encode it as RGBA.
+        """
+        image = master
+        if indexed is not None and len(indexed[1]) <= PALETTE_SIZE and infer_format(output, image_format) == "PNG":
+            image = palette_image(*indexed)
+        with self.instrumentation.stage("save", self.seed) as stage:
+            written = encode_image(image, output, profile=profile, image_format=image_format)
+            stage.record(pixels=master.width * master.height, bytes_written=written)
+
+    def generate_image(
+        self,
+        output_path: Union[str, BinaryIO] = None,
+        profile: str = "smallest",
+        image_format: str = None,
+        palette_output: bool = True,
+    ) -> Image:
         """Generates the final image and returns it in a PIL.Image object.
 
-        This works by creating a new RGBA image and layering all layers onto it.
+        In "layered" mode this works by creating a new RGBA image and layering all
+        layers onto it. In "indexed" mode the noise is zoomed once and every pixel
+        is looked up in a palette built from the layers.
+
+        When saving an "indexed" mode map to PNG with no more than 256 colors, the
+        file is written as a "P" mode palette image, which decodes to the same pixels
+        at a fraction of the size and encoding time. The returned image is always RGBA.
+
+        With a disk cache, saved "indexed" mode images are kept, and saving the same
+        image again writes the kept file without rendering or encoding anything.
 
         Args:
-            output_path: If provided, then it will save the generated image to that path.
+            output_path: If provided, then it will save the generated image to that path
+                or binary file object.
+            profile: The encode profile, one of "fast", "balanced" or "smallest".
+            image_format: The format to save as, such as "PNG" or "WEBP". Inferred from
+                the path if None, and PNG for file objects.
+            palette_output: Whether to save as a palette image when the palette fits.
 
         Returns:
             PIL.Image: The generated image.
         """
         if not self.layers:
             raise LayerRequired("A single layer is required to generate the image!")
-        height, width, _ = self.layers[0].noise_map.shape
-        logger.info(f"Generating image with dimensions ({height}, {width})")
-        master = Image.new("RGBA", (height, width), self.background_color)
-        for layer in self.layers:
-            image = Image.fromarray(np.uint8(layer.noise_map), mode="RGBA")
-            master.paste(image, (0, 0), image)
+        if output_path is not None and self.disk_cache is not None and self.render_mode == "indexed":
+            return self._generate_cached(output_path, profile, infer_format(output_path, image_format), palette_output)
+        indexed = None
+        if self.render_mode == "layered":
+            master = self._render_layered()
+        else:
+            indexed = self.get_index_map()
+            master = self._composite_indexed(*indexed)
         if output_path is not None:
             logger.debug(f"Output path is not None, saving to {output_path}.")
-            master.save(output_path, optimize=True)
+            self._save_image(master, output_path, profile, image_format, indexed if palette_output else None)
+        return master
+
+    def _generate_cached(
+        self, output: Union[str, BinaryIO], profile: str, image_format: str, palette_output: bool
+    ) -> Image:
+        """Saves the image from the disk cache, rendering and storing it first if it is not there.
+
+        The image is keyed by the noise settings, the layer thresholds and the color
+        of every layer index, which together decide every pixel.
+
+        Args:
+            output: The path or binary file object to write to.
+            profile: The encode profile, one of "fast", "balanced" or "smallest".
+            image_format: The upper case format to encode to.
+            palette_output: Whether to save as a palette image when the palette fits.
+
+        Returns:
+            PIL.Image: The generated image.
+        """
+        levels = self.get_levels()
+        key = (
+            "image",
+            self.noise_cache_key(self.zoom_aspect),
+            levels,
+            self.build_palette(levels),
+            profile,
+            image_format,
+            palette_output,
+        )
+        data = self.disk_cache.get_bytes(key)
+        if data is None:
+            indexed = self.get_index_map()
+            master = self._composite_indexed(*indexed)
+            buffer = io.BytesIO()
+            self._save_image(master, buffer, profile, image_format, indexed if palette_output else None)
+            data = self.disk_cache.put_bytes(key, buffer.getvalue())
+            self._write_encoded(data, output)
+        else:
+            logger.debug(f"Found the image of seed {self.seed} in the disk cache.")
+            master = Image.open(io.BytesIO(data)).convert("RGBA")
+            # The encode recorded the save stage of a miss, a hit only writes the kept file.
+            with self.instrumentation.stage("save", self.seed) as stage:
+                self._write_encoded(data, output)
+                stage.record(pixels=master.width * master.height, bytes_written=len(data))
         return master
 
+    @staticmethod
+    def _write_encoded(data: bytes, output: Union[str, BinaryIO]) -> None:
+        """Writes an encoded image to a path, atomically, or to a binary file object.
+
+        Args:
+            data: The encoded image.
+            output: The path or binary file object to write to.
+        """
+        if isinstance(output, (str, os.PathLike)):
+            write_atomically(output, data)
+        else:
+            output.write(data)
+
+    def generate_bytes(self, profile: str = "fast", image_format: str = "PNG", palette_output: bool = True) -> bytes:
+        """Generates the final image and returns it encoded, without touching the disk.
+
+        Args:
+            profile: The encode profile, one of "fast", "balanced" or "smallest".
+            image_format: The format to encode to, such as "PNG" or "WEBP".
+            palette_output: Whether to encode as a palette image when the palette fits.
+
+        Returns:
+            bytes: The encoded image.
+        """
+        buffer = io.BytesIO()
+        self.generate_image(buffer, profile=profile, image_format=image_format, palette_output=palette_output)
+        return buffer.getvalue()
+
+    def recolor(self, colors: np.ndarray, background_color: tuple = None, output_path: str = None, **kwargs) -> Image:
+        """Gives every layer a new color and generates the image again.
+
+        Only the palette changes, so the kept layer index map is reused and the
+        image costs a single lookup pass over it, without drawing, zooming or
+        bucketing the noise again.
+
+        Args:
+            colors: A (layers, 4) RGBA array or list with a color for every layer.
+            background_color: The new background color, or None to keep the current one.
+            output_path: If provided, then it will save the generated image to that path.
+            **kwargs: Passed to generate_image.
+
+        Returns:
+            PIL.Image: The generated image.
+
+        Raises:
+            InvalidRGB: If the background color is not a valid RGBA tuple.
+        """
+        if background_color is not None:
+            if not self._is_valid_rgba(background_color):
+                raise InvalidRGB("An invalid RGB tuple was provided!")
+            self.background_color = background_color
+        self.layers.colors = colors
+        return self.generate_image(output_path, **kwargs)
+
 
-@dataclasses.dataclass
 class TopographyLayer:
-    def __init__(self, noise_map: np.ndarray, threshold: float):
+    __slots__ = ("threshold", "color", "source", "_noise_map")
+
+    def __init__(
+        self, noise_map: Optional[np.ndarray], threshold: float, color: tuple = None, source: TopographyMap = None
+    ):
         """A filtered topography layer.
 
+        Layers only hold their threshold and color. The filtered noise map is built
+        from the noise of the source map when it is first needed.
+
         Args:
-            noise_map: The filtered noise map.
+            noise_map: The filtered noise map, or None to build it from the source map.
             threshold: The threshold used to get that noise map.
+            color: The color of every pixel that meets the threshold.
+            source: The map this layer belongs to.
         """
-        self.noise_map: np.ndarray = noise_map
+        self._noise_map: Optional[np.ndarray] = noise_map
         self.threshold: float = threshold
+        self.color: tuple = color
+        self.source: Optional[TopographyMap] = source
+
+    @property
+    def mask(self) -> np.ndarray:
+        """np.ndarray: A (height, width) boolean array of every pixel that meets the threshold."""
+        return ~(self.source.get_noise(self.source.zoom_aspect)[:, :, 0] > self.threshold)
+
+    @property
+    def noise_map(self) -> np.ndarray:
+        """np.ndarray: The (height, width, 4) filtered noise map, filled with the layer color."""
+        if self._noise_map is not None:
+            return self._noise_map
+        noise_map = self.source._preprocess_image(self.source.zoom_aspect, self.threshold)
+        noise_map[np.all(noise_map == OPAQUE, axis=-1)] = self.color
+        return noise_map
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(threshold={self.threshold!r}, color={self.color!r})"
+
+
+class LayerStack:
+    __slots__ = ("source", "version", "_thresholds", "_colors", "_noise_maps", "_length")
+
+    def __init__(self, source: TopographyMap, capacity: int = 16):
+        """The layers of a TopographyMap, stored as a threshold and a color array.
+
+        Every layer takes up 12 bytes until it is rendered. Indexing or iterating
+        returns TopographyLayer objects that build their noise map on demand.
+
+        Args:
+            source: The map the layers belong to.
+            capacity: The amount of layers to allocate room for up front.
+        """
+        self.source: TopographyMap = source
+        self._thresholds: np.ndarray = np.empty(capacity, dtype=np.float64)
+        self._colors: np.ndarray = np.empty((capacity, 4), dtype=np.uint8)
+        self._noise_maps: dict = {}
+        self._length: int = 0
+        self.version: int = 0  # Bumped whenever the thresholds change.
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[TopographyLayer, List[TopographyLayer]]:
+        if isinstance(index, slice):
+            return [self[position] for position in range(self._length)[index]]
+        index = range(self._length)[index]
+        color = tuple(self._colors[index].tolist())
+        return TopographyLayer(self._noise_maps.get(index), float(self._thresholds[index]), color, self.source)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self[index]
+
+    @property
+    def thresholds(self) -> np.ndarray:
+        """np.ndarray: The read only float64 threshold of every layer."""
+        thresholds = self._thresholds[: self._length]
+        thresholds.flags.writeable = False
+        return thresholds
+
+    @property
+    def colors(self) -> np.ndarray:
+        """np.ndarray: The (layers, 4) uint8 RGBA color of every layer."""
+        return self._colors[: self._length]
+
+    @colors.setter
+    def colors(self, colors: np.ndarray) -> None:
+        colors = np.asarray(colors, dtype=np.int64).reshape(-1, 4)
+        if len(colors) != self._length:
+            raise ValueError(f"Got {len(colors)} colors for {self._length} layers.")
+        self._colors[: self._length] = colors.astype(np.uint8)
+
+    def _reserve(self, length: int) -> None:
+        """Grows the arrays so they can hold at least the given amount of layers.
+
+        Args:
+            length: The amount of layers to hold.
+        """
+        if length <= len(self._thresholds):
+            return
+        capacity = max(length, 2 * len(self._thresholds))
+        self._thresholds = np.resize(self._thresholds, capacity)
+        self._colors = np.resize(self._colors, (capacity, 4))
+
+    def extend(self, colors: np.ndarray, thresholds: np.ndarray) -> None:
+        """Adds a layer for every color and threshold.
+
+        Colors are wrapped into uint8 the same way the rendered noise maps are.
+
+        Args:
+            colors: A (layers, 4) RGBA array or list.
+            thresholds: The threshold of every layer.
+        """
+        thresholds = np.asarray(thresholds, dtype=np.float64).reshape(-1)
+        colors = np.asarray(colors, dtype=np.int64).reshape(-1, 4)
+        if len(colors) != len(thresholds):
+            raise ValueError(f"Got {len(colors)} colors for {len(thresholds)} thresholds.")
+        self._reserve(self._length + len(thresholds))
+        self._thresholds[self._length: self._length + len(thresholds)] = thresholds
+        self._colors[self._length: self._length + len(thresholds)] = colors.astype(np.uint8)
+        self._length += len(thresholds)
+        self.version += 1
+
+    def add(self, color: tuple, threshold: Union[int, float]) -> None:
+        """Adds a single layer.
+
+        Args:
+            color: The color to replace all values that meet the threshold.
+            threshold: The threshold to aim for.
+        """
+        self.extend([color], [threshold])
+
+    def append(self, layer: TopographyLayer) -> None:
+        """Adds an existing layer, keeping its noise map if it has one.
+
+        A layer without a color is stored as transparent, so it only shows up
+        through its own noise map in "layered" mode.
+
+        Args:
+            layer: The layer to add.
+        """
+        if layer._noise_map is not None:
+            self._noise_maps[self._length] = layer._noise_map
+        self.add(layer.color if layer.color is not None else TRANSPARENT, layer.threshold)
+
+    def clear(self) -> None:
+        """Removes every layer."""
+        self._noise_maps.clear()
+        self._length = 0
+        self.version += 1
@@ -23,11 +23,13 @@ SOFTWARE.
 """
 
 import logging
+import numbers
 
 import numpy as np
-import scipy.ndimage.interpolation
 
-from typing import Union
+from typing import Optional, Union
+
+from .upsampling import SplineEngine, UpsamplingEngine, zoomed_shape
 
 TRANSPARENT = (0, 0, 0, 0)  # True
 OPAQUE = (0, 0, 0, 232)  # False
@@ -36,7 +38,16 @@ logger = logging.getLogger(__name__)
 
 
 class RandomNoise:
-    def __init__(self, seed: int = None, array_size: tuple = (4, 4)):
+    def __init__(
+        self,
+        seed: int = None,
+        array_size: tuple = (4, 4),
+        legacy_rng: bool = False,
+        engine: UpsamplingEngine = None,
+        octaves: int = 1,
+        lacunarity: float = 2.0,
+        persistence: float = 0.5,
+    ):
         """The noise generator for layering. Takes a seed and an initial array size.
 
         If seed is None, then a random seed is chosen. The array size signifies the
@@ -44,15 +55,99 @@ class RandomNoise:
         a more complex final image. Also, the generation process will take longer
         the higher the value put into the array_size argument.
 
+        Every instance draws from its own random generator, so noise can be generated
+        from several threads at once without touching the global NumPy random state.
+        By default this is a PCG64 np.random.Generator. Setting legacy_rng draws from
+        a seeded np.random.RandomState instead, which reproduces the noise, and therefore
+        the images, of versions that seeded the global NumPy random state bit for bit.
+
+        With more than one octave, finer noise arrays are drawn after the first one and
+        added on top of it as fractal (fBm) detail, see combine_octaves. The first
+        octave is always the same noise array, so one octave gives the same images as before.
+
         Args:
             seed: The seed to generate the random noise map.
             array_size: The initial size of the noise array.
+            legacy_rng: Whether to use the random generator of older versions.
+            engine: The engine that zooms the noise array, see topolayers.upsampling.
+                Defaults to the cubic spline engine of older versions.
+            octaves: The amount of noise arrays to stack.
+            lacunarity: How much finer every octave is than the one before it.
+            persistence: How much weaker every octave is than the one before it.
+
+        Raises:
+            TypeError: If the seed is not an integer or None. NumPy integers are accepted.
+            ValueError: If there are less than 1 octaves or the lacunarity is not above 1.
         """
         logger.debug(f"Generating noise array with array size: {array_size}.")
-        if isinstance(seed, int):
+        if seed is not None:
+            if not isinstance(seed, numbers.Integral):
+                raise TypeError(f"Seed must be an integer or None, not {type(seed).__name__}.")
+            seed = int(seed)
             logger.debug(f"Seed is not None. Using seed: {seed}.")
-            np.random.seed(seed)
-        self.noise_array = np.random.uniform(size=array_size)
+        self.legacy_rng: bool = legacy_rng
+        if legacy_rng:
+            self.rng = np.random.RandomState(seed)
+        else:
+            self.rng = np.random.default_rng(seed)
+        self.noise_array = self.rng.uniform(size=array_size)
+        self.engine: UpsamplingEngine = engine if engine is not None else SplineEngine()
+        if octaves < 1 or lacunarity <= 1:
+            raise ValueError(f"Expected at least 1 octave and a lacunarity above 1, not {octaves} and {lacunarity}.")
+        self.octaves: int = octaves
+        self.lacunarity: float = lacunarity
+        self.persistence: float = persistence
+        shapes = [zoomed_shape(self.noise_array.shape, lacunarity**octave) for octave in range(1, octaves)]
+        self.octave_arrays: list = [self.noise_array] + [self.rng.uniform(size=shape) for shape in shapes]
+        self._lattice: Optional[np.ndarray] = None
+
+    @property
+    def lattice(self) -> np.ndarray:
+        """np.ndarray: The array that is zoomed into the image, the octaves are combined on first use."""
+        if self._lattice is None:
+            self._lattice = self.combine_octaves() if self.octaves > 1 else self.noise_array
+        return self._lattice
+
+    def combine_octaves(self) -> np.ndarray:
+        """Sums every octave on the lattice of the finest one.
+
+        Octave k is a noise array lacunarity ** k times the size of the first one,
+        weighted by persistence ** k. Every octave is drawn when the noise is created,
+        and every coarser octave is zoomed onto the lattice of the finest octave,
+        which is still tiny next to the image, and added into one buffer. The image
+        is then zoomed from that lattice once, so any amount of octaves costs about
+        as much as a single zoom.
+
+        The weights add up to 1, so the sum stays in the range of a single octave.
+
+        Returns:
+            np.ndarray: The float64 lattice of the combined octaves.
+        """
+        arrays = self.octave_arrays
+        weights = self.persistence ** np.arange(self.octaves, dtype=np.float64)
+        weights /= weights.sum()
+        logger.debug(f"Combining {self.octaves} octaves onto a {arrays[-1].shape} lattice.")
+        lattice = arrays[-1] * weights[-1]
+        scratch = np.empty_like(lattice)
+        for array, weight in zip(arrays[:-1], weights[:-1]):
+            zoom_aspects = tuple(size / octave_size for size, octave_size in zip(lattice.shape, array.shape))
+            self.engine.zoom(array, zoom_aspects, out=scratch)
+            scratch *= weight
+            lattice += scratch
+        return lattice
+
+    def lattice_zoom(self, zoom_aspect: int = 8) -> Union[int, tuple]:
+        """Returns the zoom aspect that zooms the lattice to the image size of zoom_aspect.
+
+        Args:
+            zoom_aspect: The zoom aspect for that array.
+
+        Returns:
+            Union[int, tuple]: The zoom aspect itself with a single octave, else the zoom aspect of every axis.
+        """
+        if self.lattice is self.noise_array:
+            return zoom_aspect
+        return tuple(size / lattice_size for size, lattice_size in zip(self.zoomed_shape(zoom_aspect), self.lattice.shape))
 
     def process_noise_array(self, threshold: Union[int, float] = None, zoom_aspect: int = 8):
         """Zooms and filters the generated noise array.
@@ -68,7 +163,47 @@ class RandomNoise:
             np.ndarray: The processed noise array.
         """
         logger.debug(f"Processing noise array with threshold {threshold} and zoom aspect {zoom_aspect}.")
-        generated_array = scipy.ndimage.interpolation.zoom(self.noise_array, zoom_aspect)[:, :, np.newaxis]
+        generated_array = self.engine.zoom(self.lattice, self.lattice_zoom(zoom_aspect))[:, :, np.newaxis]
+        return self.filter_noise_array(generated_array, threshold)
+
+    def zoomed_shape(self, zoom_aspect: int = 8) -> tuple:
+        """Returns the shape process_noise_array zooms the noise array to.
+
+        Args:
+            zoom_aspect: The zoom aspect for that array.
+
+        Returns:
+            tuple: The zoomed (height, width).
+        """
+        return zoomed_shape(self.noise_array.shape, zoom_aspect)
+
+    def process_noise_region(self, zoom_aspect: int, rows: slice, columns: slice) -> np.ndarray:
+        """Zooms only a rectangular region of the noise array.
+
+        The result is identical to the same region of process_noise_array, so
+        regions rendered separately line up without seams.
+
+        Args:
+            zoom_aspect: The zoom aspect for that array.
+            rows: The rows of the zoomed array to evaluate.
+            columns: The columns of the zoomed array to evaluate.
+
+        Returns:
+            np.ndarray: The zoomed (height, width) region.
+        """
+        return self.engine.zoom_region(self.lattice, self.lattice_zoom(zoom_aspect), rows, columns)
+
+    @staticmethod
+    def filter_noise_array(generated_array: np.ndarray, threshold: Union[int, float] = None):
+        """Filters an already zoomed noise array.
+
+        Args:
+            generated_array: The zoomed (height, width, 1) noise array.
+            threshold: The threshold to aim for.
+
+        Returns:
+            np.ndarray: The filtered noise array, or the given array if threshold is None.
+        """
         if isinstance(threshold, float) or isinstance(threshold, int):
             return np.where(generated_array > threshold, TRANSPARENT, OPAQUE)
         return generated_array
@@ -23,25 +23,59 @@ SOFTWARE.
 """
 
 import logging
-import itertools
 import numpy as np
 
 from PIL import ImageColor
-from .exceptions import InvalidHex
+from typing import Optional, Union
+from .exceptions import InvalidHex, InvalidThreshold
+from .instrumentation import Instrumentation, NULL_INSTRUMENTATION
 
 logger = logging.getLogger(__name__)
 
+HISTOGRAM_BLOCK_SIZE = 1 << 22  # Pixels read at a time when building a histogram.
+
+
+def histogram_thresholds(counts: np.ndarray, low: float, high: float, ranks: np.ndarray) -> np.ndarray:
+    """Looks the pixel value at every descending rank up in a histogram.
+
+    Each threshold lies within one bin width of the exact value, rounded up so
+    the largest pixel is always covered.
+
+    Args:
+        counts: The pixel count of every bin, spread evenly from low to high.
+        low: The smallest pixel value.
+        high: The largest pixel value.
+        ranks: The descending ranks to look up.
+
+    Returns:
+        np.ndarray: The approximated thresholds.
+    """
+    bins = len(counts)
+    edges = np.linspace(low, high, bins + 1)
+    # Walk the histogram from the top, so the bin of rank r holds the (r + 1)-th largest pixel.
+    from_top = np.cumsum(counts[::-1])
+    bin_index = np.searchsorted(from_top, ranks, side="right")
+    above = from_top[bin_index] - counts[::-1][bin_index]
+    fraction = (ranks - above) / counts[::-1][bin_index]
+    return edges[::-1][bin_index] - fraction * (high - low) / bins
+
 
 class Patterns:
-    def __init__(self, noise: np.ndarray, gradient_steps: int):
+    def __init__(
+        self, noise: Union[np.ndarray, list], gradient_steps: int, instrumentation: Optional[Instrumentation] = None
+    ):
         """A utility function that helps the image generation process.
 
         Args:
-            noise: The noise array to base the layers on.
+            noise: The noise array to base the layers on. Either the zoomed noise array
+                itself or, for interpolate_colors, its pixels sorted in descending order.
             gradient_steps: The amount of layers that will be generated between each color.
+            instrumentation: Receives the duration of planning the layer thresholds as
+                the "plan" stage, usually the instrumentation of the map. Nothing is measured if it is not given.
         """
         self.noise: np.ndarray = noise
         self.gradient_steps: int = gradient_steps
+        self.instrumentation: Instrumentation = instrumentation or NULL_INSTRUMENTATION
 
     def _convert_hex(self, colors: list, color_opacity: int = 255):
         """Converts hex into RGBA given a list of colors and a color opacity.
@@ -115,6 +149,191 @@ class Patterns:
         chunk_length = len(self.noise) // len(colors)
         return [self.noise[x: x + chunk_length] for x in range(0, len(self.noise), chunk_length)]
 
+    def _chunk_ranks(self, layer_count: int, keep_remainder: bool = False) -> np.ndarray:
+        """Gets the descending rank of the first, and so largest, pixel of every chunk.
+
+        Args:
+            layer_count: The amount of chunks to split the noise into.
+            keep_remainder: Whether to keep the trailing chunk of leftover pixels.
+
+        Returns:
+            np.ndarray: The rank of every chunk, where rank 0 is the largest pixel.
+
+        Raises:
+            InvalidThreshold: If there are more layers than pixels.
+        """
+        pixel_count = np.size(self.noise)
+        chunk_length = pixel_count // layer_count
+        if chunk_length == 0:
+            raise InvalidThreshold(f"Cannot split {pixel_count} pixels into {layer_count} layers.")
+        ranks = np.arange(0, pixel_count, chunk_length)
+        return ranks if keep_remainder else ranks[:layer_count]
+
+    @staticmethod
+    def _histogram_thresholds(noise: np.ndarray, ranks: np.ndarray, bins: int) -> np.ndarray:
+        """Approximates the pixel value at every descending rank with a histogram.
+
+        The noise is read in blocks, so memory mapped or otherwise huge fields are
+        never copied as a whole. See histogram_thresholds for the accuracy.
+
+        Args:
+            noise: The noise array.
+            ranks: The descending ranks to look up.
+            bins: The amount of histogram bins.
+
+        Returns:
+            np.ndarray: The approximated thresholds.
+        """
+        flat = noise.reshape(-1)
+        blocks = range(0, len(flat), HISTOGRAM_BLOCK_SIZE)
+        low = min(float(flat[x: x + HISTOGRAM_BLOCK_SIZE].min()) for x in blocks)
+        high = max(float(flat[x: x + HISTOGRAM_BLOCK_SIZE].max()) for x in blocks)
+        counts = np.zeros(bins, dtype=np.int64)
+        for x in blocks:
+            counts += np.histogram(flat[x: x + HISTOGRAM_BLOCK_SIZE], bins=bins, range=(low, high))[0]
+        return histogram_thresholds(counts, low, high, ranks)
+
+    def plan_thresholds(
+        self, layer_count: int, approximate: bool = False, bins: int = 65536, keep_remainder: bool = False
+    ) -> np.ndarray:
+        """Gets the threshold of every layer straight from the noise array.
+
+        The noise is split into layer_count equally sized chunks of its pixels sorted
+        in descending order, and the threshold of every chunk is its largest pixel.
+        Instead of sorting every pixel, only the pixels at the chunk boundaries are
+        selected with np.partition. The approximate mode builds a histogram instead,
+        which reads the noise in blocks and suits huge or memory mapped fields.
+
+        Args:
+            layer_count: The amount of layers to plan.
+            approximate: Whether to approximate the thresholds with a histogram.
+            bins: The amount of histogram bins used in approximate mode.
+            keep_remainder: Whether to also return the threshold of the trailing chunk
+                that is left over when the pixels do not split evenly.
+
+        Returns:
+            np.ndarray: The float64 thresholds in descending order.
+
+        Raises:
+            InvalidThreshold: If there are more layers than pixels.
+        """
+        noise = np.asarray(self.noise)
+        ranks = self._chunk_ranks(layer_count, keep_remainder)
+        logger.debug(f"Planning {len(ranks)} thresholds over {noise.size} pixels, approximate={approximate}.")
+        with self.instrumentation.stage("plan") as stage:
+            if approximate:
+                thresholds = self._histogram_thresholds(noise, ranks, bins)
+                stage.record(pixels=noise.size, bytes_allocated=bins * 8)
+            else:
+                flat = noise.reshape(-1)
+                ascending = len(flat) - 1 - ranks
+                thresholds = np.partition(flat, ascending)[ascending]
+                stage.record(pixels=noise.size, bytes_allocated=flat.nbytes)  # np.partition sorts a copy.
+            return thresholds
+
+    def _color_array(self, colors: list, color_opacity: int = 255) -> np.ndarray:
+        """Converts a list of hex colors into a single RGBA array.
+
+        Args:
+            colors: A list of colors to convert to RGBA.
+            color_opacity: The alpha element for each color.
+
+        Returns:
+            np.ndarray: A (colors, 4) float64 array.
+
+        Raises:
+            InvalidHex: If the hex provided is invalid.
+        """
+        return np.array(self._convert_hex(colors, color_opacity=color_opacity), dtype=np.float64).reshape(-1, 4)
+
+    def gradient_palette(self, colors: list, luminosity: float, opacity: int = 255) -> np.ndarray:
+        """Builds every gradient step between each pair of colors at once.
+
+        Every pair of colors is faded over gradient_steps steps, each luminosity
+        further from the first color than the last. The steps are clipped and
+        truncated in bulk, matching interpolate and _process_rgba exactly.
+
+        Args:
+            colors: A list of colors to interpolate from and to.
+            luminosity: The difference between each color while fading between two colors.
+            opacity: The alpha value of every step.
+
+        Returns:
+            np.ndarray: A (steps, 4) uint8 array that can be used as a lookup table.
+
+        Raises:
+            InvalidHex: If the hex provided is invalid.
+        """
+        stops = self._color_array(colors)
+        brightness = luminosity * np.arange(1, self.gradient_steps + 1, dtype=np.float64)
+        start, end = stops[:-1, np.newaxis, :3], stops[1:, np.newaxis, :3]
+        rgb = (end - start) * brightness[np.newaxis, :, np.newaxis] + start
+        palette = np.empty((len(stops) - 1, self.gradient_steps, 4), dtype=np.uint8)
+        palette[..., :3] = np.clip(rgb, 0, 255)
+        palette[..., 3] = min(max(opacity, 0), 255)
+        logger.info(f"Built gradient palette with {len(stops)} stops and {palette.shape[0] * palette.shape[1]} steps.")
+        return palette.reshape(-1, 4)
+
+    def sample_palette(self, colors: list, size: int, positions: list = None, opacity: int = 255) -> np.ndarray:
+        """Samples a multi stop gradient at evenly spaced points.
+
+        Each color is placed at its position between 0.0 and 1.0, and every sample
+        is linearly interpolated between its neighbouring stops, then rounded.
+
+        Args:
+            colors: A list of colors, the gradient stops.
+            size: The amount of colors to sample.
+            positions: The position of every stop in ascending order. Defaults to evenly spaced stops.
+            opacity: The alpha value of every color.
+
+        Returns:
+            np.ndarray: A (size, 4) uint8 array that can be used as a lookup table.
+
+        Raises:
+            InvalidHex: If the hex provided is invalid.
+            ValueError: If the positions do not match the colors or are not ascending.
+        """
+        stops = self._color_array(colors, color_opacity=opacity)
+        if positions is None:
+            positions = np.linspace(0.0, 1.0, len(stops))
+        positions = np.asarray(positions, dtype=np.float64)
+        if positions.shape != (len(stops),) or np.any(np.diff(positions) < 0):
+            raise ValueError("There must be one ascending position for every color.")
+        samples = np.linspace(0.0, 1.0, size)
+        channels = [np.interp(samples, positions, stops[:, channel]) for channel in range(4)]
+        return np.clip(np.rint(np.stack(channels, axis=-1)), 0, 255).astype(np.uint8)
+
+    def _build_gradient(self, colors: list, luminosity: float) -> list:
+        """Builds the RGBA colors of every gradient step.
+
+        Args:
+            colors: A list of colors to interpolate from and to.
+            luminosity: The difference between each color while fading between two colors.
+
+        Returns:
+            list: The RGBA value of every step.
+        """
+        return self.gradient_palette(colors, luminosity).tolist()
+
+    def gradient_layers(self, colors: list, luminosity: float, approximate: bool = False):
+        """Pairs every gradient color with the threshold of its layer.
+
+        This is the vectorised counterpart of interpolate_colors, it works on the
+        noise array itself and gives back thresholds instead of noise chunks.
+
+        Args:
+            colors: A list of colors to interpolate from and to.
+            luminosity: The difference between each color while fading between two colors.
+            approximate: Whether to approximate the thresholds with a histogram.
+
+        Returns:
+            zip: A zip object with all generated gradients and their thresholds.
+        """
+        gradient_colors = self._build_gradient(colors, luminosity)
+        thresholds = self.plan_thresholds(len(gradient_colors), approximate=approximate)
+        logger.info(f"Returning gradient with {len(gradient_colors)} colors and {len(thresholds)} thresholds.")
+        return zip(gradient_colors, thresholds.tolist())
+
     def interpolate_colors(self, colors: list, luminosity: float):
         """Interpolates between two different colors.
 
@@ -128,14 +347,7 @@ class Patterns:
         Returns:
             zip: A zip object with all noise chunks and generated gradients.
         """
-        gradient_colors = list()
-        colors = self._convert_hex(colors, color_opacity=255)
-        for rgb_color1, rgb_color2 in itertools.pairwise(colors):
-            for iteration in range(self.gradient_steps):
-                brightness = luminosity * (iteration + 1)
-                rgba = list(self.interpolate(rgb_color1, rgb_color2, brightness, opacity=255))
-                gradient_colors.append(self._process_rgba(rgba))
-            logger.info(f"Adding layer with start RGB {rgb_color1} and end RGB {rgb_color2}.")
-        chunks = self._chunk_noise(gradient_colors=gradient_colors)
+        gradient_colors = self._build_gradient(colors, luminosity)
+        chunks = self._chunk_noise(gradient_colors)
         logger.info(f"Returning gradient with {len(gradient_colors)} colors and {len(chunks)} chunks.")
         return zip(gradient_colors, chunks)
@@ -0,0 +1,172 @@
+"""
+MIT License
+
+Copyright (c) 2022 capslock321
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import logging
+import threading
+
+import numpy as np
+from PIL import Image
+from typing import BinaryIO, Union
+
+from .layers import TopographyMap, TRANSPARENT
+from .patterns import Patterns
+from .exceptions import LayerRequired
+
+logger = logging.getLogger(__name__)
+
+RING_COLOR = (0, 0, 0, 255)
+FILL_COLOR = (35, 35, 35, 255)
+
+
+class RingOverlay:
+    def __init__(self, image: Image.Image):
+        """A texture shown through the rings of a RingMap.
+
+        The texture is resized once for every output size and kept, so one
+        overlay can be shared by the maps of many seeds.
+
+        Args:
+            image: The texture to show through the rings.
+        """
+        self.image: Image.Image = image
+        self._resized: dict = {}
+        self._lock = threading.Lock()
+
+    def resized(self, size: tuple) -> np.ndarray:
+        """Gets the texture resized to an output size.
+
+        Args:
+            size: The (width, height) of the output image.
+
+        Returns:
+            np.ndarray: The read only (height, width, 4) uint8 RGBA texture.
+        """
+        with self._lock:
+            overlay = self._resized.get(size)
+            if overlay is None:
+                logger.debug(f"Resizing ring overlay to {size}.")
+                overlay = np.array(self.image.resize(size).convert("RGBA"))
+                overlay.setflags(write=False)
+                self._resized[size] = overlay
+            return overlay
+
+
+class RingMap(TopographyMap):
+    def __init__(
+        self,
+        seed: int = None,
+        array_size: tuple = (4, 4),
+        background_color: tuple = TRANSPARENT,
+        zoom_aspect: int = 512,
+        overlay: RingOverlay = None,
+        ring_amount: int = 20,
+        ring_indices: int = 4,
+        ring_color: tuple = RING_COLOR,
+        fill_color: tuple = FILL_COLOR,
+        **kwargs,
+    ):
+        """A topography map whose every ring_indices-th ring shows an overlay texture.
+
+        Rings are found from the layer index of every pixel rather than by comparing
+        the rendered colors, so the overlay is composited with a single gather. Ring
+        maps are always rendered in "indexed" mode.
+
+        Args:
+            seed: The seed in which to generate the final image.
+            array_size: The initial array size of the noise map.
+            background_color: The color of any pixel that does not meet the threshold.
+            zoom_aspect: The zoom aspect of the processed noise map.
+            overlay: The texture to show through the rings, or None to show the ring color.
+            ring_amount: The amount of rings, each covering an equal share of the pixels.
+            ring_indices: Every how many rings the overlay shows.
+            ring_color: The color of the overlay rings when there is no overlay.
+            fill_color: The color of every other ring.
+            **kwargs: Passed to TopographyMap.
+        """
+        super().__init__(seed, array_size, background_color, zoom_aspect, **kwargs)
+        self.overlay: RingOverlay = overlay
+        self.ring_amount: int = ring_amount
+        self.ring_indices: int = ring_indices
+        self.ring_color: tuple = ring_color
+        self.fill_color: tuple = fill_color
+
+    def add_rings(self) -> None:
+        """Adds a layer for every ring, alternating between the ring and fill color."""
+        noise = self.get_noise(zoom_aspect=self.zoom_aspect)
+        thresholds = Patterns(noise, gradient_steps=1).plan_thresholds(self.ring_amount, keep_remainder=True)
+        rings = np.arange(len(thresholds)) % self.ring_indices == 0
+        colors = np.where(rings[:, np.newaxis], self.ring_color, self.fill_color)
+        logger.info(f"Adding {len(thresholds)} rings, every {self.ring_indices}th showing the overlay.")
+        self.add_layers(colors, thresholds)
+
+    def ring_buckets(self, levels: np.ndarray) -> np.ndarray:
+        """Finds out which layer indexes belong to an overlay ring.
+
+        Args:
+            levels: The unique layer thresholds, sorted in ascending order.
+
+        Returns:
+            np.ndarray: A (len(levels) + 1) boolean array, True for overlay rings.
+        """
+        top_layers = self.top_layers(levels)
+        return (top_layers >= 0) & (top_layers % self.ring_indices == 0)
+
+    def generate_image(
+        self,
+        output_path: Union[str, BinaryIO] = None,
+        profile: str = "smallest",
+        image_format: str = None,
+        palette_output: bool = True,
+    ) -> Image.Image:
+        """Generates the ring map with the overlay shown through its rings.
+
+        For opaque textures this matches the compositing toporings.py once did by
+        comparing the rendered colors. That comparison went channel by channel, so
+        the other rings took on the alpha of a translucent texture, while here
+        they keep the alpha of their own color.
+
+        Args:
+            output_path: If provided, then it will save the generated image to that path
+                or binary file object.
+            profile: The encode profile, one of "fast", "balanced" or "smallest".
+            image_format: The format to save as, inferred from the path if None.
+            palette_output: Whether to save as a palette image when there is no overlay.
+
+        Returns:
+            PIL.Image: The generated image.
+        """
+        if not self.layers:
+            raise LayerRequired("A single layer is required to generate the image!")
+        if self.overlay is None:
+            return super().generate_image(output_path, profile, image_format, palette_output)
+        levels = self.get_levels()
+        index_map, palette = self.get_index_map()
+        height, width = index_map.shape
+        overlay = self.overlay.resized((width, height))
+        with self.instrumentation.stage("composite", self.seed) as stage:
+            rings = self.ring_buckets(levels)[index_map]
+            master = Image.fromarray(stage.record(np.where(rings[:, :, np.newaxis], overlay, palette[index_map])))
+        if output_path is not None:
+            self._save_image(master, output_path, profile, image_format, None)
+        return master
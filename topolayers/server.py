@@ -0,0 +1,468 @@
+"""
+MIT License
+
+Copyright (c) 2022 capslock321
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import functools
+import collections
+import dataclasses
+import urllib.parse
+import concurrent.futures
+
+import numpy as np
+
+from typing import Dict, Hashable, Optional, Tuple
+
+from .batch import build_gradient_map, field_cache
+from .exceptions import InvalidHex, ServiceOverloaded
+from .patterns import Patterns
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {"PNG": "image/png", "WEBP": "image/webp"}
+DEFAULT_MAX_PIXELS = 4096 * 4096
+LATENCY_SAMPLES = 1024
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+def render_encoded(settings: dict, palette: np.ndarray, seed: int, image_format: str, profile: str) -> bytes:
+    """Builds, renders and encodes the gradient map of a single seed.
+
+    This runs inside the worker pool, so it takes plain picklable arguments. The
+    noise field is cached for this render only, encoded images are cached by the
+    service, so workers never fill the shared noise cache.
+
+    Args:
+        settings: The render settings, see topolayers.batch.load_config.
+        palette: The (layers, 4) gradient palette, see Patterns.gradient_palette.
+        seed: The seed to render.
+        image_format: The format to encode to, "PNG" or "WEBP".
+        profile: The encode profile, one of "fast", "balanced" or "smallest".
+
+    Returns:
+        bytes: The encoded image.
+    """
+    generator = build_gradient_map(seed, settings, palette, noise_cache=field_cache(settings))
+    return generator.generate_bytes(profile=profile, image_format=image_format)
+
+
+class EncodedCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """An LRU cache of encoded images bounded by a byte budget.
+
+        It is only touched from the event loop, so unlike NoiseCache it needs no lock.
+
+        Args:
+            max_bytes: The maximum amount of bytes all cached images may take up.
+        """
+        self.max_bytes: int = max_bytes
+        self.current_bytes: int = 0
+        self.evictions: int = 0
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """Gets a cached image and marks it as the most recently used.
+
+        Args:
+            key: The key of the image.
+
+        Returns:
+            Optional[bytes]: The encoded image, or None if it is not cached.
+        """
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+
+    def put(self, key: Hashable, data: bytes) -> None:
+        """Stores an image, evicting the least recently used images if needed.
+
+        Args:
+            key: The key of the image.
+            data: The encoded image. Images bigger than the whole budget are not stored.
+        """
+        if len(data) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.current_bytes -= len(previous)
+        self._entries[key] = data
+        self.current_bytes += len(data)
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= len(evicted)
+            self.evictions += 1
+
+
+@dataclasses.dataclass
+class ServiceMetrics:
+    requests: int = 0
+    cache_hits: int = 0
+    coalesced: int = 0
+    renders: int = 0
+    rejected: int = 0
+    errors: int = 0
+    latencies: collections.deque = dataclasses.field(default_factory=lambda: collections.deque(maxlen=LATENCY_SAMPLES))
+    render_times: collections.deque = dataclasses.field(default_factory=lambda: collections.deque(maxlen=LATENCY_SAMPLES))
+
+    @staticmethod
+    def _percentiles(samples: collections.deque) -> Dict[str, float]:
+        """Summarises recent timings in milliseconds.
+
+        Args:
+            samples: The timings in seconds.
+
+        Returns:
+            Dict[str, float]: The 50th, 95th and 99th percentile and the maximum.
+        """
+        ordered = sorted(samples)
+        if not ordered:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+        ranks = {"p50": 0.5, "p95": 0.95, "p99": 0.99, "max": 1.0}
+        return {
+            name: round(ordered[min(len(ordered) - 1, int(rank * len(ordered)))] * 1000, 3) for name, rank in ranks.items()
+        }
+
+    def snapshot(self) -> dict:
+        """Returns the counters and latency percentiles as a JSON serialisable dict."""
+        lookups = self.cache_hits + self.coalesced + self.renders
+        return {
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "renders": self.renders,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "hit_ratio": round(self.cache_hits / lookups, 4) if lookups else 0.0,
+            "latency_ms": self._percentiles(self.latencies),
+            "render_ms": self._percentiles(self.render_times),
+        }
+
+
+class RenderService:
+    def __init__(
+        self,
+        settings: dict,
+        workers: int = None,
+        max_queue: int = 64,
+        cache_bytes: int = 64 * 1024 * 1024,
+        max_pixels: int = DEFAULT_MAX_PIXELS,
+        executor: concurrent.futures.Executor = None,
+    ):
+        """Renders gradient maps on demand, keyed by seed and style parameters.
+
+        Renders run on a worker pool so the event loop stays responsive. Identical
+        requests that arrive while a render is in flight wait for that render
+        instead of starting their own, and finished images are kept encoded in an
+        LRU cache. At most max_queue renders wait for a worker, requests beyond
+        that are rejected with a 503 rather than queued without bound.
+
+        Args:
+            settings: The default render settings, see topolayers.batch.load_config.
+            workers: The amount of renders that run at once, defaults to the amount of CPUs. The
+                default pool is created with this many workers, so pass the size of a custom executor too.
+            max_queue: The amount of renders that may wait for a free worker.
+            cache_bytes: The byte budget of the encoded image cache.
+            max_pixels: The largest image a request may ask for.
+            executor: The pool renders run on. Defaults to a process pool with workers processes,
+                pass a ThreadPoolExecutor to run everything in a single process.
+        """
+        self.settings: dict = settings
+        self.workers: int = workers or os.cpu_count() or 1
+        self.max_pixels: int = max_pixels
+        self.cache: EncodedCache = EncodedCache(cache_bytes)
+        self.metrics: ServiceMetrics = ServiceMetrics()
+        self._executor: Optional[concurrent.futures.Executor] = executor
+        self._owns_executor: bool = executor is None
+        self._max_queue: int = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumers: list = []
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def parse_request(self, query: Dict[str, str]) -> Tuple[Hashable, tuple]:
+        """Turns the query parameters of a request into render settings.
+
+        Any parameter left out falls back to the default settings of the service.
+
+        Args:
+            query: The query parameters, such as {"seed": "5", "colors": "000000,FFFFFF"}.
+
+        Returns:
+            Tuple[Hashable, tuple]: The cache key and the arguments of render_encoded.
+
+        Raises:
+            ValueError: If a parameter is malformed or the image would be too large.
+            InvalidHex: If a color is not a valid hex color.
+        """
+        settings = dict(self.settings)
+        seed = int(query["seed"])
+        if "zoom_aspect" in query:
+            settings["zoom_aspect"] = int(query["zoom_aspect"])
+        if "noise_size" in query:
+            settings["noise_size"] = tuple(int(size) for size in query["noise_size"].split("x", 1))
+        if "gradient_steps" in query:
+            settings["gradient_steps"] = int(query["gradient_steps"])
+        if "luminosity" in query:
+            settings["luminosity"] = float(query["luminosity"])
+        if "colors" in query:
+            settings["colors"] = [f"#{color.lstrip('#')}" for color in query["colors"].split(",")]
+        image_format = query.get("format", "png").upper()
+        profile = query.get("profile", "fast")
+        if image_format not in CONTENT_TYPES:
+            raise ValueError(f"Unsupported format {image_format}, expected one of {', '.join(CONTENT_TYPES)}.")
+        if profile not in ("fast", "balanced", "smallest"):
+            raise ValueError(f"Unknown encode profile {profile}.")
+        width, height = settings["noise_size"]
+        if min(width, height, settings["zoom_aspect"], settings["gradient_steps"]) < 1 or len(settings["colors"]) < 2:
+            raise ValueError("The noise size, zoom aspect and gradient steps must be positive, with at least two colors.")
+        if width * height * settings["zoom_aspect"] ** 2 > self.max_pixels:
+            raise ValueError(f"The requested image is larger than {self.max_pixels} pixels.")
+        palette = Patterns(None, settings["gradient_steps"]).gradient_palette(settings["colors"], settings["luminosity"])
+        key = (
+            seed,
+            settings["zoom_aspect"],
+            tuple(settings["noise_size"]),
+            settings["gradient_steps"],
+            settings["luminosity"],
+            tuple(color.upper() for color in settings["colors"]),
+            tuple(settings["background_color"]),
+            settings["legacy_rng"],
+            (settings["octaves"], settings["lacunarity"], settings["persistence"]),
+            image_format,
+            profile,
+        )
+        return key, (settings, palette, seed, image_format, profile)
+
+    async def start(self) -> None:
+        """Starts the worker pool and the tasks that feed it from the render queue."""
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        self._queue = asyncio.Queue(self._max_queue)
+        self._consumers = [asyncio.ensure_future(self._consume()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        """Stops accepting connections, cancels waiting renders and shuts the worker pool down."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for consumer in self._consumers:
+            consumer.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        for future in self._in_flight.values():
+            if not future.done():
+                future.cancel()
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def __aenter__(self) -> "RenderService":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def _consume(self) -> None:
+        """Takes queued renders and runs them on the worker pool, one at a time."""
+        loop = asyncio.get_running_loop()
+        while True:
+            key, future, job = await self._queue.get()
+            try:
+                start = time.perf_counter()
+                data = await loop.run_in_executor(self._executor, job)
+                self.metrics.render_times.append(time.perf_counter() - start)
+                self.cache.put(key, data)
+                if not future.done():
+                    future.set_result(data)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as error:
+                self.metrics.errors += 1
+                logger.exception(f"Failed to render {key}.")
+                if not future.done():
+                    future.set_exception(error)
+            finally:
+                self._in_flight.pop(key, None)
+                self._queue.task_done()
+
+    async def render(self, query: Dict[str, str]) -> Tuple[bytes, str]:
+        """Renders the image a request asks for, from the cache if possible.
+
+        Args:
+            query: The query parameters, see parse_request.
+
+        Returns:
+            Tuple[bytes, str]: The encoded image and its content type.
+
+        Raises:
+            ValueError: If a parameter is malformed.
+            InvalidHex: If a color is not a valid hex color.
+            ServiceOverloaded: If the render queue is full.
+        """
+        key, arguments = self.parse_request(query)
+        content_type = CONTENT_TYPES[key[-2]]
+        data = self.cache.get(key)
+        if data is not None:
+            self.metrics.cache_hits += 1
+            return data, content_type
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.metrics.coalesced += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            job = functools.partial(render_encoded, *arguments)
+            try:
+                self._queue.put_nowait((key, future, job))
+            except asyncio.QueueFull:
+                self.metrics.rejected += 1
+                raise ServiceOverloaded(f"The render queue is full with {self._queue.qsize()} renders.")
+            self._in_flight[key] = future
+            self.metrics.renders += 1
+        # Shielded so a client that disconnects does not cancel the render for everyone else waiting on it.
+        return await asyncio.shield(future), content_type
+
+    async def handle(self, method: str, target: str) -> Tuple[int, str, bytes]:
+        """Answers a single HTTP request.
+
+        Args:
+            method: The request method.
+            target: The request path and query string.
+
+        Returns:
+            Tuple[int, str, bytes]: The status code, content type and body.
+        """
+        url = urllib.parse.urlsplit(target)
+        if method not in ("GET", "HEAD"):
+            return 405, "text/plain", b"Only GET is supported.\n"
+        if url.path == "/metrics":
+            snapshot = self.metrics.snapshot()
+            snapshot["cache"] = {
+                "entries": len(self.cache),
+                "bytes": self.cache.current_bytes,
+                "evictions": self.cache.evictions,
+            }
+            snapshot["queue"] = {"waiting": self._queue.qsize(), "max": self._max_queue, "in_flight": len(self._in_flight)}
+            return 200, "application/json", json.dumps(snapshot).encode()
+        if url.path == "/health":
+            return 200, "text/plain", b"ok\n"
+        if url.path != "/render":
+            return 404, "text/plain", b"Not found.\n"
+        start = time.perf_counter()
+        self.metrics.requests += 1
+        try:
+            data, content_type = await self.render(dict(urllib.parse.parse_qsl(url.query)))
+        except (KeyError, ValueError, InvalidHex) as error:
+            return 400, "text/plain", f"Bad request: {error}\n".encode()
+        except ServiceOverloaded as error:
+            return 503, "text/plain", f"{error}\n".encode()
+        except Exception:
+            return 500, "text/plain", b"The render failed.\n"
+        self.metrics.latencies.append(time.perf_counter() - start)
+        return 200, content_type, data
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Reads one HTTP/1.1 request from a connection, answers it and closes the connection.
+
+        Args:
+            reader: The stream to read the request from.
+            writer: The stream to write the response to.
+        """
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # Headers are not needed, the request has no body.
+            parts = request_line.decode("latin-1").split()
+            if len(parts) != 3:
+                status, content_type, body = 400, "text/plain", b"Malformed request line.\n"
+                method = "GET"
+            else:
+                method, target = parts[0], parts[1]
+                status, content_type, body = await self.handle(method, target)
+            head = (
+                f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n"
+            )
+            if status == 503:
+                head += "Retry-After: 1\r\n"
+            writer.write(f"{head}\r\n".encode("latin-1"))
+            if method != "HEAD":
+                writer.write(body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            logger.debug("The client disconnected before the response was sent.")
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8000) -> asyncio.AbstractServer:
+        """Starts listening for HTTP requests.
+
+        Args:
+            host: The address to listen on.
+            port: The port to listen on, 0 picks a free port.
+
+        Returns:
+            asyncio.AbstractServer: The listening server.
+        """
+        if self._queue is None:
+            await self.start()
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info(f"Serving on {', '.join(str(sock.getsockname()) for sock in self._server.sockets)}.")
+        return self._server
+
+
+def run_service(settings: dict, host: str = "127.0.0.1", port: int = 8000, **kwargs) -> None:
+    """Runs the render service until it is interrupted.
+
+    Args:
+        settings: The default render settings, see topolayers.batch.load_config.
+        host: The address to listen on.
+        port: The port to listen on.
+        **kwargs: The keyword arguments of RenderService.
+    """
+
+    async def main() -> None:
+        async with RenderService(settings, **kwargs) as service:
+            server = await service.serve(host, port)
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
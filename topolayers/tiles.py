@@ -0,0 +1,246 @@
+"""
+MIT License
+
+Copyright (c) 2022 capslock321
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import zlib
+import struct
+import logging
+
+import numpy as np
+from typing import BinaryIO
+
+from .exceptions import InvalidThreshold
+from .layers import TopographyMap
+from .patterns import histogram_thresholds
+from .upsampling import zoomed_shape
+
+logger = logging.getLogger(__name__)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class PNGStreamWriter:
+    def __init__(self, file: BinaryIO, width: int, height: int, compress_level: int = 6):
+        """Writes an 8 bit RGBA PNG a few rows at a time.
+
+        Only the rows currently being compressed are held in memory, so images far
+        bigger than the available memory can be written.
+
+        Args:
+            file: The binary file object to write to.
+            width: The width of the image.
+            height: The height of the image.
+            compress_level: The zlib compression level, between 0 and 9.
+        """
+        self.file: BinaryIO = file
+        self.width: int = width
+        self.height: int = height
+        self.rows_written: int = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self.file.write(PNG_SIGNATURE)
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+
+    def _write_chunk(self, chunk_type: bytes, data: bytes) -> None:
+        """Writes a single length prefixed and checksummed PNG chunk.
+
+        Args:
+            chunk_type: The four byte chunk type.
+            data: The chunk data.
+        """
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        """Compresses and writes the next rows of the image.
+
+        Args:
+            rows: A (rows, width, 4) uint8 array.
+        """
+        rows = np.ascontiguousarray(rows, dtype=np.uint8).reshape(len(rows), self.width * 4)
+        scanlines = np.zeros((len(rows), self.width * 4 + 1), dtype=np.uint8)  # Filter type 0 per row.
+        scanlines[:, 1:] = rows
+        data = self._compressor.compress(scanlines.tobytes())
+        if data:
+            self._write_chunk(b"IDAT", data)
+        self.rows_written += len(rows)
+
+    def close(self) -> None:
+        """Flushes the compressor and ends the image.
+
+        Raises:
+            ValueError: If not every row of the image was written.
+        """
+        if self.rows_written != self.height:
+            raise ValueError(f"Expected {self.height} rows but {self.rows_written} were written.")
+        self._write_chunk(b"IDAT", self._compressor.flush())
+        self._write_chunk(b"IEND", b"")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+class TiledRenderer:
+    def __init__(self, generator: TopographyMap, tile_size: int = 512):
+        """Renders a TopographyMap tile by tile straight to a file on disk.
+
+        Instead of zooming the whole noise array, every tile evaluates the zoomed
+        noise of its own region, buckets it into layer indexes and looks its colors
+        up in the palette. A band of tile_size rows is then written out before the
+        next band is computed, so memory use depends on the tile size and width,
+        not on the height of the image.
+
+        Args:
+            generator: The map to render, with every layer already added.
+            tile_size: The height and width of a single tile.
+        """
+        self.generator: TopographyMap = generator
+        self.tile_size: int = tile_size
+
+    def _tiles(self):
+        """Walks the tiles of the image, band by band.
+
+        Yields:
+            slice: The rows of the tile.
+            slice: The columns of the tile.
+        """
+        height, width = self.shape()
+        for top in range(0, height, self.tile_size):
+            rows = slice(top, min(top + self.tile_size, height))
+            for left in range(0, width, self.tile_size):
+                yield rows, slice(left, min(left + self.tile_size, width))
+
+    def plan_thresholds(self, layer_count: int, bins: int = 65536, keep_remainder: bool = False) -> np.ndarray:
+        """Plans layer thresholds like Patterns.plan_thresholds in approximate mode, one tile at a time.
+
+        Planning on get_noise needs the whole zoomed field in memory. Instead, the
+        tiles are zoomed twice, once to find the range of the noise and once to fill
+        a histogram of it, so planning needs no more memory than rendering. Missing
+        heights of a HeightField are left out, like in HeightField.plan_thresholds.
+
+        Args:
+            layer_count: The amount of layers to plan.
+            bins: The amount of histogram bins.
+            keep_remainder: Whether to also return the threshold of the trailing chunk
+                that is left over when the pixels do not split evenly.
+
+        Returns:
+            np.ndarray: The float64 thresholds in descending order.
+
+        Raises:
+            InvalidThreshold: If there are more layers than pixels.
+        """
+        generator = self.generator
+        noise = generator.get_random_noise()
+        with generator.instrumentation.stage("plan", generator.seed) as stage:
+            low, high = np.inf, -np.inf
+            for rows, columns in self._tiles():
+                tile = noise.process_noise_region(generator.zoom_aspect, rows, columns)
+                if not np.isnan(tile).all():
+                    low, high = min(low, float(np.nanmin(tile))), max(high, float(np.nanmax(tile)))
+            counts = np.zeros(bins, dtype=np.int64)
+            if low <= high:
+                for rows, columns in self._tiles():
+                    tile = noise.process_noise_region(generator.zoom_aspect, rows, columns)
+                    counts += np.histogram(tile[~np.isnan(tile)], bins=bins, range=(low, high))[0]
+            stage.record(pixels=int(counts.sum()), bytes_allocated=counts.nbytes)
+        pixel_count = int(counts.sum())
+        chunk_length = pixel_count // layer_count
+        if chunk_length == 0:
+            raise InvalidThreshold(f"Cannot split {pixel_count} pixels into {layer_count} layers.")
+        ranks = np.arange(0, pixel_count, chunk_length)
+        ranks = ranks if keep_remainder else ranks[:layer_count]
+        logger.debug(f"Planning {len(ranks)} thresholds over {pixel_count} pixels in {self.tile_size} pixel tiles.")
+        return histogram_thresholds(counts, low, high, ranks)
+
+    def _render_bands(self):
+        """Renders the map one band of rows at a time.
+
+        Yields:
+            np.ndarray: A (rows, width, 4) uint8 band of the final image.
+        """
+        instrumentation, seed = self.generator.instrumentation, self.generator.seed
+        noise = self.generator.get_random_noise()
+        levels = self.generator.get_levels()
+        with instrumentation.stage("palette", seed) as stage:
+            palette = self.generator.build_palette(levels)
+            stage.record(pixels=len(palette), bytes_allocated=palette.nbytes)
+        height, width = self.shape()
+        band = np.empty((min(self.tile_size, height), width, 4), dtype=np.uint8)
+        for rows, columns in self._tiles():
+            with instrumentation.stage("zoom", seed) as stage:
+                tile = stage.record(noise.process_noise_region(self.generator.zoom_aspect, rows, columns))
+            with instrumentation.stage("threshold", seed) as stage:
+                index_map = stage.record(self.generator.bucket_noise(tile, levels))
+            with instrumentation.stage("composite", seed) as stage:
+                band[: rows.stop - rows.start, columns] = palette[index_map]
+                stage.record(pixels=index_map.size)
+            if columns.stop == width:
+                yield band[: rows.stop - rows.start]
+
+    def shape(self) -> tuple:
+        """Returns the shape of the rendered image without rendering it.
+
+        Returns:
+            tuple: The (height, width) of the image.
+        """
+        return zoomed_shape(self.generator.array_size, self.generator.zoom_aspect)
+
+    def render(self, output_path: str) -> tuple:
+        """Renders the map to a file.
+
+        A ".png" path is written as a streamed PNG, a ".npy" path as a memory mapped
+        NumPy array and any other path as raw (height, width, 4) RGBA bytes.
+
+        Args:
+            output_path: The path to write the image to.
+
+        Returns:
+            tuple: The (height, width) of the rendered image.
+        """
+        height, width = self.shape()
+        extension = os.path.splitext(output_path)[1].lower()
+        logger.info(f"Rendering ({height}, {width}) image in {self.tile_size} pixel tiles to {output_path}.")
+        if extension == ".png":
+            with open(output_path, "wb") as file, PNGStreamWriter(file, width, height) as writer:
+                for band in self._render_bands():
+                    writer.write_rows(band)
+            return height, width
+        if extension == ".npy":
+            output = np.lib.format.open_memmap(output_path, mode="w+", dtype=np.uint8, shape=(height, width, 4))
+        else:
+            output = np.memmap(output_path, mode="w+", dtype=np.uint8, shape=(height, width, 4))
+        top = 0
+        for band in self._render_bands():
+            bottom = top + len(band)
+            output[top:bottom] = band
+            top = bottom
+        output.flush()
+        del output
+        return height, width
@@ -0,0 +1,320 @@
+"""
+MIT License
+
+Copyright (c) 2022 capslock321
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import abc
+import logging
+import threading
+
+import numpy as np
+import scipy.ndimage
+from typing import Union
+
+logger = logging.getLogger(__name__)
+
+SPLINE_ORDER = 3  # The order scipy.ndimage.zoom uses by default.
+
+
+def zoomed_shape(shape: tuple, zoom_aspect: Union[float, tuple]) -> tuple:
+    """Returns the shape an array is zoomed to, the same way scipy.ndimage.zoom rounds it.
+
+    Args:
+        shape: The shape of the array.
+        zoom_aspect: The zoom aspect, or a zoom aspect for every axis.
+
+    Returns:
+        tuple: The zoomed shape.
+    """
+    zoom_aspects = zoom_aspect if isinstance(zoom_aspect, tuple) else (zoom_aspect,) * len(shape)
+    return tuple(int(round(size * zoom)) for size, zoom in zip(shape, zoom_aspects))
+
+
+def sample_positions(size: int, zoomed_size: int, region: slice = slice(None)) -> np.ndarray:
+    """Maps zoomed indexes back onto the input, aligning the first and last samples like scipy.ndimage.zoom.
+
+    Args:
+        size: The size of the input axis.
+        zoomed_size: The size of the zoomed axis.
+        region: The zoomed indexes to map.
+
+    Returns:
+        np.ndarray: The float64 input position of every zoomed index.
+    """
+    step = (size - 1) / (zoomed_size - 1) if zoomed_size > 1 else 1.0
+    return np.arange(*region.indices(zoomed_size)) * step
+
+
+class UpsamplingEngine(abc.ABC):
+    name = "engine"
+
+    def __init__(self, dtype: type = np.float64):
+        """Zooms a small noise array up to the final image size.
+
+        Args:
+            dtype: The floating point type of the zoomed array.
+        """
+        self.dtype: np.dtype = np.dtype(dtype)
+
+    @property
+    def cache_key(self) -> tuple:
+        """tuple: Every setting that changes the output, used to key cached noise fields."""
+        return self.name, self.dtype.str
+
+    def zoom(self, array: np.ndarray, zoom_aspect: Union[float, tuple], out: np.ndarray = None) -> np.ndarray:
+        """Zooms a whole 2D array.
+
+        Args:
+            array: The array to zoom.
+            zoom_aspect: The zoom aspect, or a (rows, columns) pair of zoom aspects.
+            out: A preallocated array of the zoomed shape and dtype to write into.
+
+        Returns:
+            np.ndarray: The zoomed array, out if it was given.
+        """
+        shape = zoomed_shape(array.shape, zoom_aspect)
+        zoomed = self.zoom_region(array, zoom_aspect, slice(0, shape[0]), slice(0, shape[1]))
+        if out is None:
+            return zoomed
+        out[...] = zoomed
+        return out
+
+    @abc.abstractmethod
+    def zoom_region(self, array: np.ndarray, zoom_aspect: Union[float, tuple], rows: slice, columns: slice) -> np.ndarray:
+        """Zooms only a rectangular region of a 2D array.
+
+        The region matches the same region of zoom, bit for bit with the spline
+        engine and up to floating point rounding with the others, so separately
+        zoomed regions line up without seams.
+
+        Args:
+            array: The array to zoom.
+            zoom_aspect: The zoom aspect, or a (rows, columns) pair of zoom aspects.
+            rows: The rows of the zoomed array to evaluate.
+            columns: The columns of the zoomed array to evaluate.
+
+        Returns:
+            np.ndarray: The zoomed region.
+        """
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(dtype={self.dtype.name})"
+
+
+class SplineEngine(UpsamplingEngine):
+    name = "spline"
+
+    def __init__(self, dtype: type = np.float64):
+        """Cubic spline zoom through scipy.ndimage, the engine older versions always used.
+
+        This is the exact engine: with float64 it reproduces older images bit for bit.
+        It is also the slowest, since every output pixel is a 4x4 spline evaluation
+        done in float64. With float32 only the output is stored in single precision.
+
+        Args:
+            dtype: The floating point type of the zoomed array.
+        """
+        super().__init__(dtype)
+        self._coefficients: tuple = (None, None)
+        self._lock = threading.Lock()
+
+    @property
+    def cache_key(self) -> tuple:
+        return self.name, SPLINE_ORDER, self.dtype.str
+
+    def coefficients(self, array: np.ndarray) -> np.ndarray:
+        """Gets the spline coefficients of an array, reusing those of the previous array if it is equal.
+
+        Every region of an array needs the coefficients of the whole array, so a
+        tiled render filters the array once instead of once per tile. Comparing
+        against a copy of the previous array keeps this correct for arrays that
+        are modified in place, and costs far less than filtering.
+
+        Args:
+            array: The 2D array to zoom.
+
+        Returns:
+            np.ndarray: The read only float64 spline coefficients.
+        """
+        with self._lock:
+            source, coefficients = self._coefficients
+            if source is None or source.shape != array.shape or not np.array_equal(source, array):
+                coefficients = scipy.ndimage.spline_filter(array, SPLINE_ORDER, mode="mirror")
+                coefficients.setflags(write=False)
+                self._coefficients = (np.array(array), coefficients)
+            return coefficients
+
+    def zoom(self, array: np.ndarray, zoom_aspect: Union[float, tuple], out: np.ndarray = None) -> np.ndarray:
+        return scipy.ndimage.zoom(array, zoom_aspect, output=out if out is not None else self.dtype)
+
+    def zoom_region(self, array: np.ndarray, zoom_aspect: Union[float, tuple], rows: slice, columns: slice) -> np.ndarray:
+        coefficients = self.coefficients(array)
+        shape = zoomed_shape(array.shape, zoom_aspect)
+        positions = [sample_positions(array.shape[0], shape[0], rows), sample_positions(array.shape[1], shape[1], columns)]
+        grid = np.meshgrid(*positions, indexing="ij")
+        return scipy.ndimage.map_coordinates(
+            coefficients, grid, output=self.dtype, order=SPLINE_ORDER, mode="constant", prefilter=False
+        )
+
+
+class SeparableEngine(UpsamplingEngine):
+    def __init__(self, dtype: type = np.float64):
+        """Zooms with a precomputed weight matrix per axis, as two matrix products.
+
+        Args:
+            dtype: The floating point type of the weights and the zoomed array.
+        """
+        super().__init__(dtype)
+        self._weights: dict = {}
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _build_weights(self, size: int, zoomed_size: int) -> np.ndarray:
+        """Builds the (zoomed_size, size) weight matrix of one axis.
+
+        Args:
+            size: The size of the input axis.
+            zoomed_size: The size of the zoomed axis.
+
+        Returns:
+            np.ndarray: The float64 weights.
+        """
+
+    def weights(self, size: int, zoomed_size: int) -> np.ndarray:
+        """Gets the weight matrix of one axis, building it on first use.
+
+        Args:
+            size: The size of the input axis.
+            zoomed_size: The size of the zoomed axis.
+
+        Returns:
+            np.ndarray: The read only (zoomed_size, size) weights.
+        """
+        with self._lock:
+            weights = self._weights.get((size, zoomed_size))
+            if weights is None:
+                weights = self._build_weights(size, zoomed_size).astype(self.dtype)
+                weights.setflags(write=False)
+                self._weights[(size, zoomed_size)] = weights
+            return weights
+
+    def zoom_region(self, array: np.ndarray, zoom_aspect: Union[float, tuple], rows: slice, columns: slice) -> np.ndarray:
+        height, width = zoomed_shape(array.shape, zoom_aspect)
+        row_weights = self.weights(array.shape[0], height)[rows]
+        column_weights = self.weights(array.shape[1], width)[columns]
+        return row_weights @ (array.astype(self.dtype) @ column_weights.T)
+
+    def zoom(self, array: np.ndarray, zoom_aspect: Union[float, tuple], out: np.ndarray = None) -> np.ndarray:
+        height, width = zoomed_shape(array.shape, zoom_aspect)
+        row_weights = self.weights(array.shape[0], height)
+        column_weights = self.weights(array.shape[1], width)
+        return np.matmul(row_weights, array.astype(self.dtype) @ column_weights.T, out=out)
+
+
+class KernelEngine(SeparableEngine):
+    name = "kernel"
+
+    def __init__(self, kernel: str = "bicubic", dtype: type = np.float64):
+        """Separable bicubic or bilinear interpolation with precomputed weights.
+
+        Much faster than the spline engine, since zooming is two small matrix
+        products, and float32 halves the memory and time again. Bicubic uses the
+        Keys kernel (a = -0.5) and looks close to the spline, with slightly less
+        smooth contours. Bilinear is the fastest but gives visibly straight-edged
+        contours, which suits previews and thumbnails.
+
+        Args:
+            kernel: Either "bicubic" or "bilinear".
+            dtype: The floating point type of the weights and the zoomed array.
+
+        Raises:
+            ValueError: If the kernel is not supported.
+        """
+        if kernel not in ("bicubic", "bilinear"):
+            raise ValueError(f"Kernel must be either 'bicubic' or 'bilinear', not {kernel!r}.")
+        super().__init__(dtype)
+        self.kernel: str = kernel
+
+    @property
+    def cache_key(self) -> tuple:
+        return self.name, self.kernel, self.dtype.str
+
+    @staticmethod
+    def _keys(distance: np.ndarray, a: float = -0.5) -> np.ndarray:
+        """The Keys cubic convolution kernel.
+
+        Args:
+            distance: The absolute distance between the sample and each tap.
+            a: The sharpness of the kernel.
+
+        Returns:
+            np.ndarray: The weight of each tap.
+        """
+        near = ((a + 2) * distance - (a + 3)) * distance**2 + 1
+        far = ((distance - 5) * distance + 8) * distance * a - 4 * a
+        return np.where(distance <= 1, near, np.where(distance < 2, far, 0.0))
+
+    def _build_weights(self, size: int, zoomed_size: int) -> np.ndarray:
+        positions = sample_positions(size, zoomed_size)
+        first_tap = np.floor(positions).astype(np.intp)
+        taps = np.arange(-1, 3) if self.kernel == "bicubic" else np.arange(0, 2)
+        indexes = first_tap[:, np.newaxis] + taps[np.newaxis, :]
+        distance = np.abs(positions[:, np.newaxis] - indexes)
+        if self.kernel == "bicubic":
+            tap_weights = self._keys(distance)
+        else:
+            tap_weights = np.maximum(1 - distance, 0.0)
+        weights = np.zeros((zoomed_size, size), dtype=np.float64)
+        # Taps past the edges are clamped onto the edge samples.
+        rows = np.broadcast_to(np.arange(zoomed_size)[:, np.newaxis], indexes.shape)
+        np.add.at(weights, (rows, np.clip(indexes, 0, size - 1)), tap_weights)
+        return weights
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(kernel={self.kernel!r}, dtype={self.dtype.name})"
+
+
+class SpectralEngine(SeparableEngine):
+    name = "spectral"
+
+    def __init__(self, dtype: type = np.float64):
+        """Band limited zooming by zero padding the Fourier spectrum.
+
+        The noise is treated as periodic, so contours wrap around the edges and
+        the image tiles seamlessly with itself, at the cost of some ringing near
+        sharp changes. Samples are spaced as in the FFT, which shifts the image
+        by up to half a noise cell compared to the other engines. The resampling
+        operator is precomputed per axis, so it is as fast as the kernel engine.
+
+        Args:
+            dtype: The floating point type of the weights and the zoomed array.
+        """
+        super().__init__(dtype)
+
+    def _build_weights(self, size: int, zoomed_size: int) -> np.ndarray:
+        spectrum = np.fft.rfft(np.eye(size), axis=0)
+        if size % 2 == 0 and zoomed_size > size:
+            spectrum[size // 2] *= 0.5  # The Nyquist bin is split between its two mirrored frequencies.
+        return np.fft.irfft(spectrum, n=zoomed_size, axis=0) * (zoomed_size / size)
+
+
+ENGINES = {"spline": SplineEngine, "kernel": KernelEngine, "spectral": SpectralEngine}
@@ -0,0 +1,373 @@
+"""
+MIT License
+
+Copyright (c) 2022 capslock321
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import logging
+import fractions
+import concurrent.futures
+
+import numpy as np
+from PIL import Image
+from typing import BinaryIO, Iterable, Iterator, Tuple, Union
+
+from .layers import TopographyMap, TRANSPARENT
+from .noise import RandomNoise
+from .upsampling import zoomed_shape
+
+logger = logging.getLogger(__name__)
+
+MASK = (1 << 64) - 1
+GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+ROW_PRIME = 0xC2B2AE3D27D4EB4F
+COLUMN_PRIME = 0x165667B19E3779F9
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """The SplitMix64 finalizer, which scrambles every bit of a uint64 array into every other bit.
+
+    Args:
+        values: The uint64 array to scramble, modified in place.
+
+    Returns:
+        np.ndarray: values.
+    """
+    values ^= values >> np.uint64(30)
+    values *= np.uint64(0xBF58476D1CE4E5B9)
+    values ^= values >> np.uint64(27)
+    values *= np.uint64(0x94D049BB133111EB)
+    values ^= values >> np.uint64(31)
+    return values
+
+
+def cubic_weights(fraction: np.ndarray) -> np.ndarray:
+    """The weights of the four taps around every sample of the Catmull-Rom kernel.
+
+    This is the Keys kernel (a = -0.5) of KernelEngine, written in terms of the
+    distance from the tap before every sample.
+
+    Args:
+        fraction: The position of every sample between its two nearest lattice points, in [0, 1).
+
+    Returns:
+        np.ndarray: A (samples, 4) array of weights for the taps at -1, 0, 1 and 2.
+    """
+    t = fraction[:, np.newaxis]
+    coefficients = np.array(
+        [[-0.5, 1.0, -0.5, 0.0], [1.5, -2.5, 0.0, 1.0], [-1.5, 2.0, 0.5, 0.0], [0.5, -0.5, 0.0, 0.0]]
+    )
+    return ((coefficients[:, 0] * t + coefficients[:, 1]) * t + coefficients[:, 2]) * t + coefficients[:, 3]
+
+
+class LatticeNoise:
+    def __init__(self, seed: int, cell_size: int = 512):
+        """Noise that is a deterministic function of the seed and a world coordinate.
+
+        Every integer lattice point gets a uniform value by hashing the seed and its
+        coordinates, and the points in between are interpolated with a bicubic
+        kernel. A pixel therefore only depends on its own world coordinate, never on
+        the region it is rendered in, so regions rendered on their own, on any thread
+        or machine, line up with their neighbours bit for bit. The world has no edges.
+
+        Args:
+            seed: The seed of the world.
+            cell_size: The amount of world pixels between two lattice points, like the zoom aspect of RandomNoise.
+        """
+        self.seed: int = seed
+        self.cell_size: int = cell_size
+        self._key: np.uint64 = np.uint64(((seed & MASK) * GOLDEN_GAMMA + GOLDEN_GAMMA) & MASK)
+
+    def lattice(self, rows: np.ndarray, columns: np.ndarray) -> np.ndarray:
+        """Hashes the value of every lattice point in a grid.
+
+        Args:
+            rows: The integer lattice rows.
+            columns: The integer lattice columns.
+
+        Returns:
+            np.ndarray: A (rows, columns) float64 array of values in [0, 1).
+        """
+        rows = _mix(np.asarray(rows, dtype=np.int64).view(np.uint64) * np.uint64(ROW_PRIME) ^ self._key)
+        columns = np.asarray(columns, dtype=np.int64).view(np.uint64) * np.uint64(COLUMN_PRIME)
+        values = _mix(rows[:, np.newaxis] ^ columns[np.newaxis, :])
+        return (values >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+    def _axis(self, start: int, size: int, scale: fractions.Fraction) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the lattice cell and the cubic weights of every sample along one axis.
+
+        Positions are kept as exact fractions of a world pixel, so the same world
+        coordinate always gets the same cell and weights.
+
+        Args:
+            start: The first sample, in samples.
+            size: The amount of samples.
+            scale: The amount of world pixels between two samples.
+
+        Returns:
+            np.ndarray: The lattice cell of every sample.
+            np.ndarray: The (size, 4) tap weights of every sample.
+        """
+        cell_units = self.cell_size * scale.denominator
+        units = (start + np.arange(size, dtype=np.int64)) * scale.numerator
+        cells, remainders = np.divmod(units, cell_units)
+        return cells, cubic_weights(remainders / cell_units)
+
+    def region(self, x: int, y: int, width: int, height: int, scale: Union[int, fractions.Fraction] = 1) -> np.ndarray:
+        """Evaluates the noise over a rectangular region of the world.
+
+        Args:
+            x: The column of the top left sample, in samples.
+            y: The row of the top left sample, in samples.
+            width: The amount of columns.
+            height: The amount of rows.
+            scale: The amount of world pixels between two samples, 1 for full resolution.
+                Powers of two such as Fraction(1, 4) or 8 are exact at any distance from the origin.
+
+        Returns:
+            np.ndarray: The (height, width) float64 noise.
+        """
+        scale = fractions.Fraction(scale)
+        row_cells, row_weights = self._axis(y, height, scale)
+        column_cells, column_weights = self._axis(x, width, scale)
+        values = self.lattice(
+            np.arange(row_cells[0] - 1, row_cells[-1] + 3), np.arange(column_cells[0] - 1, column_cells[-1] + 3)
+        )
+        # Both passes add the four taps in the same order for every pixel, so a pixel never depends on the region.
+        columns = column_cells - column_cells[0]
+        horizontal = values[:, columns] * column_weights[:, 0]
+        for tap in range(1, 4):
+            horizontal += values[:, columns + tap] * column_weights[:, tap]
+        rows = row_cells - row_cells[0]
+        noise = horizontal[rows] * row_weights[:, 0, np.newaxis]
+        for tap in range(1, 4):
+            noise += horizontal[rows + tap] * row_weights[:, tap, np.newaxis]
+        return noise
+
+
+class LatticeWindow:
+    def __init__(self, source: LatticeNoise, array_size: tuple):
+        """A window of array_size lattice cells at the origin of a LatticeNoise.
+
+        It zooms the same way RandomNoise does, with zoom_aspect pixels per lattice
+        cell, so anything that renders the noise of a map, such as TiledRenderer,
+        reads the world through the same interface as random noise.
+
+        Args:
+            source: The noise of the world.
+            array_size: The size of the window in lattice cells.
+        """
+        self.source: LatticeNoise = source
+        self.array_size: tuple = tuple(array_size)
+
+    def _scale(self, zoom_aspect: int) -> fractions.Fraction:
+        """Returns the amount of world pixels between two samples at a zoom aspect."""
+        return fractions.Fraction(self.source.cell_size) / fractions.Fraction(zoom_aspect)
+
+    def zoomed_shape(self, zoom_aspect: int = 8) -> tuple:
+        """Returns the shape process_noise_array evaluates the window at.
+
+        Args:
+            zoom_aspect: The amount of pixels per lattice cell.
+
+        Returns:
+            tuple: The zoomed (height, width).
+        """
+        return zoomed_shape(self.array_size, zoom_aspect)
+
+    def process_noise_region(self, zoom_aspect: int, rows: slice, columns: slice) -> np.ndarray:
+        """Evaluates only a rectangular region of the window.
+
+        Every pixel only depends on its world coordinate, so the result is identical
+        to the same region of process_noise_array.
+
+        Args:
+            zoom_aspect: The amount of pixels per lattice cell.
+            rows: The rows of the zoomed window to evaluate.
+            columns: The columns of the zoomed window to evaluate.
+
+        Returns:
+            np.ndarray: The (height, width) region.
+        """
+        height, width = self.zoomed_shape(zoom_aspect)
+        top, bottom, _ = rows.indices(height)
+        left, right, _ = columns.indices(width)
+        return self.source.region(left, top, right - left, bottom - top, self._scale(zoom_aspect))
+
+    def process_noise_array(self, threshold: Union[int, float] = None, zoom_aspect: int = 8) -> np.ndarray:
+        """Evaluates the whole window, see RandomNoise.process_noise_array.
+
+        Args:
+            threshold: The threshold to aim for, or None for the noise itself.
+            zoom_aspect: The amount of pixels per lattice cell.
+
+        Returns:
+            np.ndarray: The (height, width, 1) noise map, filtered if a threshold is given.
+        """
+        height, width = self.zoomed_shape(zoom_aspect)
+        noise = self.source.region(0, 0, width, height, self._scale(zoom_aspect))[:, :, np.newaxis]
+        return RandomNoise.filter_noise_array(noise, threshold)
+
+
+class WorldMap(TopographyMap):
+    def __init__(
+        self,
+        seed: int = None,
+        array_size: tuple = (4, 4),
+        background_color: tuple = TRANSPARENT,
+        zoom_aspect: int = 512,
+        tile_size: int = 256,
+        native_zoom: int = 0,
+        **kwargs,
+    ):
+        """A topography map of an unbounded world that can be rendered region by region.
+
+        The noise comes from a LatticeNoise with one lattice point every zoom_aspect
+        pixels. The map itself covers the reference window of array_size lattice
+        cells at the origin, so thresholds are planned on get_noise exactly like on
+        a TopographyMap, and every region and tile is then bucketed with those same
+        layers. Tiles rendered separately share their edges seamlessly.
+
+        Args:
+            seed: The seed of the world.
+            array_size: The size of the reference window in lattice cells.
+            background_color: The color of any pixel that does not meet the threshold.
+            zoom_aspect: The amount of pixels between two lattice points.
+            tile_size: The width and height of a tile in pixels.
+            native_zoom: The tile zoom level at which one tile pixel is one world pixel.
+                Every level above it doubles the resolution, every level below halves it.
+            **kwargs: Passed to TopographyMap.
+
+        Raises:
+            ValueError: If more than one octave is asked for, the world noise has a single octave.
+        """
+        if kwargs.get("octaves", 1) > 1:
+            raise ValueError(f"A WorldMap has a single octave of lattice noise, not {kwargs['octaves']}.")
+        super().__init__(seed, array_size, background_color, zoom_aspect, **kwargs)
+        self.noise_source: LatticeNoise = LatticeNoise(self.seed, zoom_aspect)
+        self.tile_size: int = tile_size
+        self.native_zoom: int = native_zoom
+
+    def noise_cache_key(self, zoom_aspect: int) -> tuple:
+        """Returns the key the reference window noise of this map is cached under.
+
+        Args:
+            zoom_aspect: The zoom aspect of the processed noise map.
+
+        Returns:
+            tuple: The seed, array size, noise source, zoom aspect and cell size.
+        """
+        return self.seed, tuple(self.array_size), "lattice", zoom_aspect, self.noise_source.cell_size
+
+    def get_random_noise(self) -> LatticeWindow:
+        """Returns the reference window of the world noise.
+
+        Returns:
+            LatticeWindow: The noise of the map, zoomed like the noise of a TopographyMap.
+        """
+        return LatticeWindow(self.noise_source, self.array_size)
+
+    def render_region(
+        self,
+        x: int,
+        y: int,
+        width: int,
+        height: int,
+        scale: Union[int, fractions.Fraction] = 1,
+        output_path: Union[str, BinaryIO] = None,
+        profile: str = "smallest",
+        image_format: str = None,
+    ) -> Image.Image:
+        """Renders any rectangular region of the world with the layers of this map.
+
+        Args:
+            x: The column of the top left pixel.
+            y: The row of the top left pixel.
+            width: The width of the region in pixels.
+            height: The height of the region in pixels.
+            scale: The amount of world pixels per rendered pixel, see LatticeNoise.region.
+            output_path: If provided, then it will save the generated image to that path
+                or binary file object.
+            profile: The encode profile, one of "fast", "balanced" or "smallest".
+            image_format: The format to save as, inferred from the path if None.
+
+        Returns:
+            PIL.Image: The generated image.
+
+        Raises:
+            LayerRequired: If no layers were added.
+        """
+        with self.instrumentation.stage("zoom", self.seed) as stage:
+            noise = stage.record(self.noise_source.region(x, y, width, height, scale))
+        index_map, palette = self.build_index_map(noise)
+        master = self._composite_indexed(index_map, palette)
+        if output_path is not None:
+            self._save_image(master, output_path, profile, image_format, (index_map, palette))
+        return master
+
+    def render_tile(self, z: int, x: int, y: int, output_path: Union[str, BinaryIO] = None, **kwargs) -> Image.Image:
+        """Renders a single slippy map tile.
+
+        Args:
+            z: The zoom level of the tile.
+            x: The column of the tile.
+            y: The row of the tile.
+            output_path: If provided, then it will save the generated image to that path
+                or binary file object.
+            **kwargs: The profile and image_format, see render_region.
+
+        Returns:
+            PIL.Image: The (tile_size, tile_size) tile.
+        """
+        scale = fractions.Fraction(2) ** (self.native_zoom - z)
+        return self.render_region(
+            x * self.tile_size, y * self.tile_size, self.tile_size, self.tile_size, scale, output_path, **kwargs
+        )
+
+    def render_tiles(
+        self, tiles: Iterable[Tuple[int, int, int]], output_path: str, max_workers: int = None, **kwargs
+    ) -> Iterator[Tuple[Tuple[int, int, int], str]]:
+        """Renders and saves many tiles concurrently on a thread pool, as "{z}/{x}/{y}.png".
+
+        Args:
+            tiles: The (z, x, y) of every tile.
+            output_path: The directory to save the tiles to.
+            max_workers: The amount of threads to use. Defaults to the ThreadPoolExecutor default.
+            **kwargs: The profile and image_format, see render_region.
+
+        Returns:
+            Iterator[Tuple[Tuple[int, int, int], str]]: The (z, x, y) and path of every tile, in order.
+        """
+        extension = (kwargs.get("image_format") or "png").lower()
+
+        def render(tile: Tuple[int, int, int]) -> str:
+            z, x, y = tile
+            path = os.path.join(output_path, str(z), str(x), f"{y}.{extension}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.render_tile(z, x, y, path, **kwargs)
+            return path
+
+        tiles = list(tiles)
+        logger.info(f"Rendering {len(tiles)} tiles on a thread pool with {max_workers or 'default'} workers.")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for tile, path in zip(tiles, executor.map(render, tiles)):
+                yield tile, path
@@ -3,10 +3,8 @@ import time
 import json
 import logging
 
-import numpy as np
-
 from PIL import Image
-from topolayers import TopographyMap
+from topolayers import RingMap, RingOverlay
 
 print("Generating Topography Rings...")
 start = time.time()
@@ -14,6 +12,8 @@ start = time.time()
 fmt = "[%(asctime)s] %(name)s: %(message)s"
 logging.basicConfig(level=logging.INFO, format=fmt, datefmt="%m/%d/%Y %I:%M:%S %p")
 
+overlay_image = Image.open("examples/prod/gilded/gilded.png")
+
 with open("config.json", "r") as file:
     settings = json.load(file)
     zoom_aspect = settings.get("zoom_aspect")
@@ -24,36 +24,16 @@ with open("config.json", "r") as file:
     colors = settings.get("colors")
     seed = settings.get("seed")
     output_path = settings.get("output_path")
+    legacy_rng = settings.get("legacy_rng", False)
 
-generator = TopographyMap(seed, noise_size, background_color, zoom_aspect)
-noise = sorted(generator.get_noise(zoom_aspect=zoom_aspect).ravel(), reverse=True)
-
-ring_amount = 20
-ring_indices = 4
-cl = len(noise) // ring_amount
-chunks = [noise[x:x + cl] for x in range(0, len(noise), cl)]
-
-overlay_image = Image.open("examples/prod/gilded/gilded.png")
-
-for ring, chunk in enumerate(chunks):
-    if ring % ring_indices == 0:
-        generator.add_layer([0, 0, 0, 255], threshold=max(chunk))
-    else:
-        generator.add_layer([35, 35, 35, 255], threshold=max(chunk))
-
-
-def generate_ringmap(source_image: Image):
-    master = generator.generate_image(output_path)
-    image = source_image.resize(master.size).convert("RGBA")
-    master_image, overlay = np.array(master), np.array(image)
-    mask = (master_image == [0, 0, 0, 255])
-    master_image[mask] = overlay[mask]
-    return master_image
+generator = RingMap(
+    seed, noise_size, background_color, zoom_aspect, overlay=RingOverlay(overlay_image), legacy_rng=legacy_rng
+)
+generator.add_rings()
 
 
 if __name__ == "__main__":
     output_path = os.path.join(output_path, f"gilded/{generator.seed}.png")
-    master = generate_ringmap(overlay_image)
-    Image.fromarray(master, mode="RGBA").save(output_path)
+    generator.generate_image(output_path)
     print(f"Generated Topography Map with seed: {seed}")
     print(f"Total time elapsed: {time.time() - start:.2f}s")